@@ -0,0 +1,5 @@
+"""Performance benchmarks for hypernotes. They are not part of the test suite
+and can be run from the root of the repository, e.g.:
+
+$ python -m benchmarks.concurrent_writers
+"""
@@ -0,0 +1,80 @@
+"""Measures how long it takes to load a store and to add a note to it for
+uncompressed, gzip, and lzma compressed json files, together with the size
+of the files.
+
+Compressed files need less time to be read from and written to slow disks,
+e.g. network file systems, but more time to be decompressed and compressed.
+Reading and writing local files is mostly served from the page cache and
+--throughput therefore adds the time which would be needed to transfer the
+file at the given speed in MB/s to the measured durations:
+
+$ python -m benchmarks.compression --notes 10000 --throughput 50
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from benchmarks.store_operations import _synthetic_note
+from hypernotes import Note, Store
+
+SUFFIXES = {"json": ".json", "gzip": ".json.gz", "lzma": ".json.xz"}
+
+
+def _time(function: Callable[[], object], repeat: int) -> float:
+    """Returns the fastest of multiple runs to reduce the influence of
+    other processes and of the garbage collector"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(raw_args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--throughput",
+        type=float,
+        help="simulated speed of the disk in MB/s, e.g. 50 for a network file system",
+    )
+    args = parser.parse_args(raw_args)
+
+    random.seed(args.seed)
+    notes = [_synthetic_note(i) for i in range(args.notes)]
+    print(
+        f"{args.notes} notes"
+        + (f", {args.throughput} MB/s" if args.throughput else ", local disk")
+    )
+    print(f"{'file':>6} {'size MB':>8} {'load s':>8} {'add s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, suffix in SUFFIXES.items():
+            path = Path(tmp_dir) / ("store" + suffix)
+            store = Store(path)
+            store.add_many(notes)
+            size_mb = path.stat().st_size / 2 ** 20
+            transfer_seconds = size_mb / args.throughput if args.throughput else 0.0
+
+            # A new store instance is used so that the file is read again
+            load_seconds = _time(lambda: Store(path).load(), args.repeat)
+
+            def add() -> None:
+                store.add(Note())
+
+            add_seconds = _time(add, args.repeat)
+            print(
+                f"{name:>6} {size_mb:>8.1f} {load_seconds + transfer_seconds:>8.3f}"
+                + f" {add_seconds + transfer_seconds:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measures the write throughput of a store when several processes
+add notes to it at the same time and checks that no notes are lost.
+
+$ python -m benchmarks.concurrent_writers --processes 1 2 4 8 16 32
+"""
+import argparse
+import multiprocessing as mp
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Type
+
+from hypernotes import BaseStore, JsonLinesStore, Note, Store
+
+STORE_CLASSES = {"json": Store, "jsonl": JsonLinesStore}
+
+
+def _add_notes(store_class: Type[BaseStore], path: Path, n_notes: int) -> None:
+    store = store_class(path)  # type: ignore
+    note = Note("Benchmark note")
+    note.parameters = {"learning_rate": 0.1, "max_depth": 5}
+    note.metrics = {"auc": 0.8, "accuracy": 0.9}
+    for _ in range(n_notes):
+        store.add(Note.from_note(note))
+
+
+def run(store_type: str, n_processes: int, notes_per_process: int) -> dict:
+    store_class = STORE_CLASSES[store_type]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / f"store.{store_type}"
+        store = store_class(path)
+        processes = [
+            mp.Process(target=_add_notes, args=(store_class, path, notes_per_process))
+            for _ in range(n_processes)
+        ]
+        start = time.perf_counter()
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        duration = time.perf_counter() - start
+        n_stored = len(store.load())
+    n_expected = n_processes * notes_per_process
+    return {
+        "store": store_type,
+        "processes": n_processes,
+        "notes": n_expected,
+        "lost_notes": n_expected - n_stored,
+        "seconds": duration,
+        "notes_per_second": n_expected / duration,
+    }
+
+
+def main(raw_args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32]
+    )
+    parser.add_argument("--notes-per-process", type=int, default=50)
+    parser.add_argument(
+        "--stores", nargs="+", default=list(STORE_CLASSES), choices=STORE_CLASSES
+    )
+    args = parser.parse_args(raw_args)
+
+    print(f"{'store':>6} {'processes':>9} {'notes':>6} {'lost':>5} {'notes/s':>9}")
+    for store_type in args.stores:
+        for n_processes in args.processes:
+            result = run(store_type, n_processes, args.notes_per_process)
+            print(
+                f"{result['store']:>6} {result['processes']:>9} {result['notes']:>6}"
+                + f" {result['lost_notes']:>5} {result['notes_per_second']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Measures how long it takes to decode the datetimes of a store with the
+previous and the current datetime encoding.
+
+The previous encoding stored datetimes without microseconds in the format
+DATETIME_STRING_FORMAT, which was parsed with datetime.strptime, and every
+decoded dictionary was checked for the key "_datetime".
+
+$ python -m benchmarks.datetime_decoding --notes 100000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from json import JSONEncoder
+from pathlib import Path
+from typing import Callable, List
+
+from hypernotes import (
+    DATETIME_STRING_FORMAT,
+    DatetimeJSONEncoder,
+    Store,
+    _deserialize_datetime,
+)
+
+
+class _PreviousDatetimeJSONEncoder(JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return {"_datetime": obj.strftime(DATETIME_STRING_FORMAT)}
+        return super().default(obj)
+
+
+def _previous_deserialize_datetime(obj):
+    _datetime = obj.get("_datetime")
+    if _datetime is not None:
+        return datetime.strptime(_datetime, DATETIME_STRING_FORMAT)
+    return obj
+
+
+def _raw_notes(n_notes: int) -> List[dict]:
+    start = datetime(2019, 1, 1)
+    notes = []
+    for i in range(n_notes):
+        start_datetime = start + timedelta(seconds=i, microseconds=i)
+        notes.append(
+            {
+                "identifier": str(i),
+                "text": f"Note {i}",
+                "model": "randomforest",
+                "start_datetime": start_datetime,
+                "end_datetime": start_datetime + timedelta(seconds=30),
+                "metrics": {"accuracy": random.random(), "recall": random.random()},
+                "parameters": {"max_depth": i % 10, "n_estimators": 100},
+                "features": {"numerical": ["a", "b"], "categorical": ["c"]},
+                "info": {"fold_datetimes": [start_datetime] * 3},
+                "git": {"branch": "master", "commit": "abcdefg"},
+            }
+        )
+    return notes
+
+
+def _time(function: Callable[[], object], repeat: int) -> float:
+    """Returns the fastest of multiple runs to reduce the influence of
+    other processes and of the garbage collector"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(raw_args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(raw_args)
+
+    notes = _raw_notes(args.notes)
+    previous = json.dumps(notes, cls=_PreviousDatetimeJSONEncoder)
+    current = json.dumps(notes, cls=DatetimeJSONEncoder)
+
+    decodings = [
+        ("previous file, previous decoder", previous, _previous_deserialize_datetime),
+        ("previous file, current decoder", previous, _deserialize_datetime),
+        ("current file, current decoder", current, _deserialize_datetime),
+        ("current file, no decoder", current, None),
+    ]
+    print(f"Decoding {args.notes} notes")
+    for name, content, object_hook in decodings:
+        seconds = _time(
+            lambda: json.loads(content, object_hook=object_hook), args.repeat
+        )
+        print(f"{name:>32}: {seconds:6.2f}s")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_path = Path(tmp_dir) / "store.json"
+        store_path.write_text(current)
+        seconds = _time(lambda: Store(store_path).load(), args.repeat)
+        print(f"{'current file, Store.load':>32}: {seconds:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compares Note.from_note with a full deepcopy to Note.from_note with
+copy_on_write=True for a sweep over notes with large info payloads, including
+adding all resulting notes to a store with add_many.
+
+$ python -m benchmarks.from_note --trials 1000
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List
+
+from hypernotes import JsonLinesStore, Note
+
+
+def _base_note(n_features: int, n_folds: int, n_predictions: int) -> Note:
+    note = Note("Benchmark sweep")
+    note.model = "gradient_boosting"
+    note.features["numerical"] = [f"feature_{i}" for i in range(n_features)]
+    note.info["fold_predictions"] = [
+        [random.random() for _ in range(n_predictions)] for _ in range(n_folds)
+    ]
+    return note
+
+
+def run(copy_on_write: bool, trials: int, base_note: Note) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    notes = []
+    for i in range(trials):
+        note = Note.from_note(base_note, copy_on_write=copy_on_write)
+        note.parameters["learning_rate"] = 0.01 * (i + 1)
+        note.metrics["auc"] = random.random()
+        notes.append(note)
+    from_note_seconds = time.perf_counter() - start
+    _, from_note_peak = tracemalloc.get_traced_memory()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        JsonLinesStore(Path(tmp_dir) / "store.jsonl").add_many(notes)
+        add_many_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "copy_on_write": copy_on_write,
+        "from_note_seconds": from_note_seconds,
+        "from_note_peak_mb": from_note_peak / 2 ** 20,
+        "add_many_seconds": add_many_seconds,
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+def main(raw_args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--features", type=int, default=2000)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--predictions", type=int, default=2000)
+    args = parser.parse_args(raw_args)
+
+    base_note = _base_note(args.features, args.folds, args.predictions)
+    print(
+        f"{'mode':>13} {'from_note s':>11} {'from_note MB':>12}"
+        + f" {'add_many s':>10} {'peak MB':>8}"
+    )
+    for copy_on_write in (False, True):
+        result = run(copy_on_write, args.trials, base_note)
+        mode = "copy_on_write" if copy_on_write else "deepcopy"
+        print(
+            f"{mode:>13} {result['from_note_seconds']:>11.2f}"
+            + f" {result['from_note_peak_mb']:>12.1f}"
+            + f" {result['add_many_seconds']:>10.2f} {result['peak_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
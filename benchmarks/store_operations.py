@@ -0,0 +1,270 @@
+"""Measures the duration and the peak memory usage of the most common operations
+on synthetic stores of different sizes: adding, updating, removing, and loading
+notes, creating notes with Note.from_note, and rendering the table of the
+command-line interface.
+
+The results are written to a json file, which can be passed to --compare in a
+later run to see how the durations changed, e.g.:
+
+$ python -m benchmarks.store_operations --output before.json
+$ python -m benchmarks.store_operations --output after.json --compare before.json
+
+Stores with 1 million notes need several GB of memory and are therefore not
+part of the default sizes, but can be included with --sizes 1000 1000000.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from hypernotes import JsonLinesStore, Note, SqliteStore, Store, __version__
+from hypernotes.__main__ import _datatables_response, _format_html, _table_data
+
+STORE_CLASSES = {"json": Store, "jsonl": JsonLinesStore, "sqlite": SqliteStore}
+MODELS = ["randomforest", "gradient_boosting", "logistic_regression", "svm"]
+
+
+def _synthetic_note(i: int) -> Note:
+    """Returns a note with a similar nesting and size as the notes
+    of a typical hyperparameter search"""
+    note = Note(f"Hyperparameter search, run {i}")
+    note.model = random.choice(MODELS)
+    note.parameters = {
+        "learning_rate": random.choice([0.001, 0.01, 0.1]),
+        "max_depth": random.randint(2, 12),
+        "n_estimators": random.choice([100, 200, 500]),
+        "preprocessing": {"impute": "median", "scale": random.random() > 0.5},
+    }
+    note.features = {
+        "identifier": ["customer_id"],
+        "binary": [f"flag_{j}" for j in range(5)],
+        "categorical": [f"category_{j}" for j in range(5)],
+        "numerical": [f"feature_{j}" for j in range(20)],
+    }
+    note.target = "churn"
+    note.metrics = {
+        split: {name: random.random() for name in ("recall", "precision", "auc")}
+        for split in ("train", "test")
+    }
+    note.info = {
+        "fold_auc": [random.random() for _ in range(5)],
+        "data_version": "2019-05-21",
+        "n_rows": random.randint(10000, 100000),
+    }
+    note.end()
+    return note
+
+
+def _measure(
+    function: Callable[[], object],
+    repeat: int,
+    setup: Optional[Callable[[], object]] = None,
+) -> Tuple[float, float]:
+    """Returns the median duration of repeat calls of function in seconds and
+    the peak memory usage of a single call in MB. setup is called before each
+    call of function and is not part of the measurement.
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    # Tracing memory allocations slows down the code considerably and
+    # is therefore measured in a separate call
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(durations), peak / 2 ** 20
+
+
+def run(store_type: str, n_notes: int, repeat: int, tmp_dir: Path) -> List[dict]:
+    store_class = STORE_CLASSES[store_type]
+    path = tmp_dir / f"store_{n_notes}.{store_type}"
+    notes = [_synthetic_note(i) for i in range(n_notes)]
+    # Added notes are removed again so that all measurements
+    # are done on a store with n_notes
+    new_notes = [_synthetic_note(n_notes + i) for i in range(repeat + 1)]
+
+    results = []
+
+    def measure(
+        operation: str,
+        function: Callable[[], object],
+        operation_repeat: int = repeat,
+        setup: Optional[Callable[[], object]] = None,
+    ) -> None:
+        seconds, peak_mb = _measure(function, operation_repeat, setup=setup)
+        results.append(
+            {
+                "store": store_type,
+                "notes": n_notes,
+                "operation": operation,
+                "seconds": seconds,
+                "peak_mb": peak_mb,
+            }
+        )
+
+    def reset_store() -> None:
+        for suffix in ("", ".lock", "-wal", "-shm", "-journal"):
+            file_path = path.with_name(path.name + suffix)
+            if file_path.exists():
+                file_path.unlink()
+
+    measure(
+        "add_many",
+        lambda: store_class(path).add_many(notes),
+        operation_repeat=1,
+        setup=reset_store,
+    )
+    store = store_class(path)
+    added_notes = []  # type: List[Note]
+
+    def add() -> None:
+        added_notes.append(new_notes.pop())
+        store.add(added_notes[-1])
+
+    def remove_added() -> None:
+        if added_notes:
+            store.remove(added_notes)
+            added_notes.clear()
+
+    def add_new() -> None:
+        added_notes.append(_synthetic_note(n_notes))
+        store.add(added_notes[-1])
+
+    measure("add", add, setup=remove_added)
+    remove_added()
+    measure("remove", remove_added, setup=add_new)
+
+    note_to_update = store.load()[n_notes // 2]
+
+    def update() -> None:
+        note_to_update.metrics["test"]["auc"] = random.random()
+        store.update(note_to_update)
+
+    measure("update", update)
+
+    measure("load", lambda: store_class(path).load())
+    measure("load_cached", store.load)
+    measure("load_lazy_20", lambda: list(store_class(path).load(lazy=True)[:20]))
+    try:
+        import pandas  # type: ignore # noqa: F401
+    except ImportError:
+        print("pandas is not installed, load(return_dataframe=True) is skipped")
+    else:
+        measure("load_dataframe", lambda: store.load(return_dataframe=True))
+
+    base_note = notes[0]
+    measure("from_note", lambda: [Note.from_note(base_note) for _ in range(100)])
+
+    loaded_notes = store.load()
+    measure("table_data", lambda: _table_data(loaded_notes))
+    table = _table_data(loaded_notes)
+    measure("render_page", lambda: _format_html(table.columns))
+    page_params = {
+        "draw": "1",
+        "start": "0",
+        "length": "10",
+        "order[0][column]": str(table.columns.index("metrics.test.auc")),
+        "order[0][dir]": "desc",
+    }
+    measure("data_page", lambda: _datatables_response(table, page_params))
+    return results
+
+
+def _metadata() -> dict:
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode()
+    except (subprocess.CalledProcessError, OSError):
+        commit = ""
+    return {
+        "datetime": datetime.now().isoformat(),
+        "hypernotes_version": __version__,
+        "commit": commit.strip(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def _print_results(results: List[dict], previous: Optional[List[dict]]) -> None:
+    previous_seconds = {
+        (result["store"], result["notes"], result["operation"]): result["seconds"]
+        for result in previous or []
+    }
+
+    print(
+        f"{'store':>6} {'notes':>8} {'operation':>14} {'seconds':>9} {'peak MB':>8}"
+        + (f" {'change':>7}" if previous is not None else "")
+    )
+    for result in results:
+        line = (
+            f"{result['store']:>6} {result['notes']:>8} {result['operation']:>14}"
+            + f" {result['seconds']:>9.4f} {result['peak_mb']:>8.1f}"
+        )
+        key = (result["store"], result["notes"], result["operation"])
+        if key in previous_seconds and previous_seconds[key] > 0:
+            change = result["seconds"] / previous_seconds[key] - 1
+            line += f" {change:>+7.0%}"
+        print(line)
+
+
+def main(raw_args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--stores", nargs="+", default=["json"], choices=STORE_CLASSES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("benchmark_results.json"),
+        help="json file to which the results are written",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        help="results of a previous run, which are compared to the current ones",
+    )
+    args = parser.parse_args(raw_args)
+
+    random.seed(args.seed)
+    results = []  # type: List[dict]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for store_type in args.stores:
+            for n_notes in args.sizes:
+                print(f"Running benchmarks for {store_type} store with {n_notes} notes")
+                results += run(store_type, n_notes, args.repeat, Path(tmp_dir))
+
+    output = {"metadata": _metadata(), "repeat": args.repeat, "results": results}
+    args.output.write_text(json.dumps(output, indent=2))
+    print(f"Results were written to {args.output}\n")
+
+    previous = None
+    if args.compare is not None:
+        previous = json.loads(args.compare.read_text())["results"]
+    _print_results(results, previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,77 @@
+import asyncio
+import atexit
 import copy
+import functools
+import gzip
+import heapq
 import json
+import lzma
+import math
 import os
+import re
+import sqlite3
 import subprocess
 import sys
+import threading
+import time
 import uuid
+import warnings
 from abc import ABC, abstractmethod
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import Executor
+from contextlib import closing, contextmanager
 from datetime import datetime
 from json import JSONEncoder
 from pathlib import Path
 from pprint import pformat
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from typing import (
+    IO,
+    AbstractSet,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
 from unittest.mock import patch
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None  # type: ignore
+
 __version__ = "2.0.2"
+# Format of datetimes in stores of previous versions, which can still be read
 DATETIME_STRING_FORMAT = "%Y-%m-%dT%H-%M-%S"
 
+_D = TypeVar("_D", bound=dict)
+_T = TypeVar("_T")
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Compression of store files by file extension, and the magic bytes with which
+# compressed files start so that they are also detected with other extensions
+_COMPRESSIONS = {".gz": "gzip", ".xz": "lzma"}
+_MAGIC_BYTES = {b"\x1f\x8b": "gzip", b"\xfd7zXZ\x00": "lzma"}
+_WRITE_CHUNK_SIZE = 1 << 20
+_Where = Union[Callable[[Dict[str, Any]], bool], Dict[str, Any]]
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses"])
+_StoreCache = namedtuple("_StoreCache", ["key", "raw_dicts", "positions"])
+
 
 class Note(dict):
     _model_key = "model"
@@ -33,6 +90,15 @@ class Note(dict):
     _git_key = "git"
     _python_path_key = "python_path"
 
+    # Can be set to False to not add any information about the git repository
+    # to new notes, e.g. in worker processes which should not call git.
+    # Defaults to False if the environment variable HYPERNOTES_GIT_INFO is "0"
+    capture_git_info = os.environ.get("HYPERNOTES_GIT_INFO", "1") != "0"
+
+    # Keys of values which are shared with other notes and need to be copied before
+    # they are handed out, see from_note with copy_on_write=True
+    _shared_keys = frozenset()  # type: AbstractSet[str]
+
     def __init__(
         self, text: str = "", content: Optional[Dict[str, dict]] = None
     ) -> None:
@@ -100,44 +166,14 @@ class Note(dict):
         self.end_datetime = self._current_datetime()
 
     def _current_datetime(self) -> datetime:
-        return datetime.now().replace(microsecond=0)
+        return datetime.now()
 
     def _add_git_info(self) -> None:
-        if self._is_in_git_repo():
-            self.git["repo_name"] = (
-                subprocess.check_output(["git", "rev-parse", "--git-dir"])
-                .strip()
-                .decode("utf-8")
-            )
-            self.git["branch"] = (
-                subprocess.check_output(["git", "rev-parse", "--abbrev-ref", "HEAD"])
-                .strip()
-                .decode("utf-8")
-            )
-            self.git["commit"] = (
-                subprocess.check_output(["git", "rev-parse", "--short", "HEAD"])
-                .strip()
-                .decode("utf-8")
-            )
-
-    def _is_in_git_repo(self) -> bool:
-        """Function based on following stackoverflow answer by tdelaney:
-        https://stackoverflow.com/a/19688210
-        """
-        if (
-            subprocess.call(
-                ["git", "branch"],
-                stderr=subprocess.STDOUT,
-                stdout=open(os.devnull, "w"),
-            )
-            != 0
-        ):
-            return False
-        else:
-            return True
+        if self.capture_git_info:
+            self.git.update(_git_info())
 
     @classmethod
-    def from_note(cls, note: "Note") -> "Note":
+    def from_note(cls, note: "Note", copy_on_write: bool = False) -> "Note":
         """Creates a new note from an existing one, taking over its content
         but setting a new start datetime and identifier.
 
@@ -153,17 +189,68 @@ class Note(dict):
         ----------
         note : Note
             Existing ntoe from which the content should be taken over
+        copy_on_write : bool, optional (default=False)
+            If True, the content is not copied right away. Instead, both notes share
+            their dictionaries, lists, etc. (e.g. note.info) and each note copies
+            them only when they are accessed by key or attribute
+            (e.g. note.info["folds"] or note["info"]) for the first time.
+            Content which is never accessed, e.g. large info dictionaries which
+            are the same for all notes, is then never copied. Be aware that
+            the values returned by .items() and .values() are still shared.
 
         Returns
         -------
         Note
         """
         assert isinstance(note, cls)
-        new_note = copy.deepcopy(note)
+        if copy_on_write:
+            shared_keys = {k for k, v in dict.items(note) if not _is_immutable(v)}
+            new_note = cls(content=note)
+            new_note._shared_keys = frozenset(shared_keys)
+            note._shared_keys = note._shared_keys | shared_keys
+        else:
+            new_note = copy.deepcopy(note)
+            new_note._shared_keys = frozenset()
         new_note.start_datetime = new_note._current_datetime()
         new_note._set_identifier()
         return new_note
 
+    def __copy__(self) -> "Note":
+        # The default implementation sets the items with __setitem__, which would
+        # mark shared values as owned by the copy without copying them
+        new_note = self.__class__.__new__(self.__class__)
+        new_note.__dict__.update(self.__dict__)
+        dict.update(new_note, self)
+        return new_note
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if key in self._shared_keys:
+            value = copy.deepcopy(value)
+            super().__setitem__(key, value)
+            self._shared_keys = self._shared_keys - {key}
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        if key in self._shared_keys:
+            self._shared_keys = self._shared_keys - {key}
+        super().__setitem__(key, value)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return super().pop(key, *default)
+
     @property
     def identifier(self) -> str:
         return self[self._identifier_key]
@@ -269,14 +356,393 @@ class Note(dict):
         return r
 
 
+# Git information per working directory together with the state of the
+# repository for which it was retrieved, see _git_info
+_git_info_cache = {}  # type: Dict[str, Tuple[Optional[tuple], Dict[str, str]]]
+
+
+def _git_info() -> Dict[str, str]:
+    """Returns name (i.e. the path to the .git directory), current branch, and last
+    commit of the git repository of the current working directory, or an
+    empty dictionary if there is none.
+
+    The information is cached and only retrieved again if HEAD or the branch
+    it points to changed. Not being in a git repository is cached as well.
+    """
+    cwd = os.getcwd()
+    cached = _git_info_cache.get(cwd)
+    if cached is not None:
+        state, info = cached
+        if not info or state == _git_state(info["repo_name"]):
+            return dict(info)
+    info = _read_git_info()
+    state = _git_state(info["repo_name"]) if info else None
+    _git_info_cache[cwd] = (state, info)
+    return dict(info)
+
+
+def _read_git_info() -> Dict[str, str]:
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--git-dir", "HEAD", "--abbrev-ref", "HEAD"],
+            stderr=subprocess.DEVNULL,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return {}
+    git_dir, commit, branch = output.decode("utf-8").splitlines()
+    return {"repo_name": git_dir, "branch": branch, "commit": commit[:7]}
+
+
+def _git_state(git_dir: str) -> Optional[tuple]:
+    """Returns the content of HEAD together with the modification times of the files
+    which change if a new commit is created or another branch is checked out
+    """
+    git_path = Path(git_dir)
+    try:
+        head = (git_path / "HEAD").read_text()
+    except OSError:
+        return None
+    files = [git_path / "logs" / "HEAD", git_path / "packed-refs"]
+    if head.startswith("ref:"):
+        files.append(git_path / head.split(":", 1)[1].strip())
+    return (head,) + tuple(_file_identity(path) for path in files)
+
+
+class LazyNotes(Sequence[Note]):
+    """Sequence of notes as returned by the load methods of the stores with
+    lazy=True. The notes are only created, and depending on the store also only
+    decoded, when they are accessed, so that the length of the sequence and
+    slices of it are available without converting all notes.
+
+    Accessing the same position twice returns the same Note instance. Slices
+    are again LazyNotes.
+    """
+
+    def __init__(self, items: Sequence[Any], to_note: Callable[[Any], Note]) -> None:
+        """
+        Parameters
+        ----------
+        items : Sequence[Any]
+            One item per note with the most recent note first, e.g. the raw
+            dictionaries or the encoded notes
+        to_note : Callable[[Any], Note]
+            Function which converts an item into a Note instance
+        """
+        self._items = items
+        self._to_note = to_note
+        self._notes = [None] * len(items)  # type: List[Optional[Note]]
+
+    @overload
+    def __getitem__(self, index: int) -> Note:
+        pass
+
+    @overload  # noqa: F811
+    def __getitem__(self, index: slice) -> "LazyNotes":
+        pass
+
+    def __getitem__(self, index):  # noqa: F811
+        if isinstance(index, slice):
+            return LazyNotes(self._items[index], self._to_note)
+        note = self._notes[index]
+        if note is None:
+            note = self._to_note(self._items[index])
+            self._notes[index] = note
+        return note
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Note]:
+        for i in range(len(self._items)):
+            yield self[i]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, LazyNotes)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyNotes({len(self)} notes)"
+
+
+class StoreStats:
+    """Collects measurements of store operations in memory. For each operation
+    (e.g. "add", "load", or "update"), it records the duration of its phases,
+    the number of processed notes, and the number of bytes read and written.
+    The durations, as well as other values which are recorded once per call
+    (e.g. the number of buffered notes per flush of a buffered Store), can be
+    summarized with percentiles by summary and dump.
+
+    Pass an instance to a store to enable the measurements, e.g.
+    Store(path, stats=StoreStats()). Multiple stores can share one instance.
+    To forward the measurements somewhere else, e.g. to a monitoring system,
+    inherit from this class and overwrite record_duration, record_count,
+    and record_sample.
+
+    The phases of Store are "lock" (waiting for the lock of the file), "read"
+    (reading the file), "parse" (decoding the json content), "validate"
+    (checking the identifiers of the notes), "prepare" (ending and copying
+    the notes), "sort", "serialize" (encoding to json), "write" (writing the
+    file), "columns" (converting to or writing the columnar format), "copy"
+    (copying loaded notes), and "dataframe" (converting to a pandas dataframe).
+    "total" is the duration of the whole operation.
+    """
+
+    def __init__(self, max_samples: int = 10000) -> None:
+        """
+        Parameters
+        ----------
+        max_samples : int, optional (default=10000)
+            Maximum number of durations which are kept per operation and phase,
+            and of samples per operation and name, to calculate percentiles.
+            Older ones are discarded. The number of calls and the totals always
+            include all measurements.
+        """
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._durations = {}  # type: Dict[Tuple[str, str], deque[float]]
+        self._duration_totals = {}  # type: Dict[Tuple[str, str], Tuple[int, float]]
+        self._counts = {}  # type: Dict[Tuple[str, str], int]
+        self._samples = {}  # type: Dict[Tuple[str, str], deque[float]]
+        self._sample_totals = {}  # type: Dict[Tuple[str, str], Tuple[int, float]]
+
+    def record_duration(self, operation: str, phase: str, seconds: float) -> None:
+        """Is called by a store with the duration of a phase of an operation
+        in seconds. The phase "total" is the duration of the whole operation.
+        """
+        key = (operation, phase)
+        with self._lock:
+            durations = self._durations.get(key)
+            if durations is None:
+                durations = self._durations[key] = deque(maxlen=self.max_samples)
+            durations.append(seconds)
+            count, total = self._duration_totals.get(key, (0, 0.0))
+            self._duration_totals[key] = (count + 1, total + seconds)
+
+    def record_count(self, operation: str, name: str, value: int) -> None:
+        """Is called by a store with the number of "notes", "bytes_read",
+        or "bytes_written" of an operation
+        """
+        key = (operation, name)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + value
+
+    def record_sample(self, operation: str, name: str, value: float) -> None:
+        """Is called by a store with a value which is measured once per call of
+        an operation, e.g. the "queue_depth" (number of buffered notes) of each
+        "flush" of a buffered Store
+        """
+        key = (operation, name)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.max_samples)
+            samples.append(value)
+            count, total = self._sample_totals.get(key, (0, 0.0))
+            self._sample_totals[key] = (count + 1, total + value)
+
+    def summary(self, percentiles: Sequence[float] = (50, 90, 99)) -> Dict[str, dict]:
+        """Returns the measurements per operation, e.g.
+        {"add": {"calls": 2, "notes": 2, "bytes_read": 0, "bytes_written": 512,
+        "phases": {"write": {"count": 2, "total": 0.002, "mean": 0.001,
+        "p50": 0.001, "p90": 0.0012, "p99": 0.0012, "max": 0.0012}, ...},
+        "samples": {}}}. Durations are in seconds. Samples, e.g.
+        "queue_depth", are summarized in the same way as the durations.
+
+        Parameters
+        ----------
+        percentiles : Sequence[float], optional (default=(50, 90, 99))
+            Percentiles of the durations of each phase and of the samples
+            which are included
+
+        Returns
+        -------
+        Dict[str, dict]
+        """
+        with self._lock:
+            durations = {k: sorted(v) for k, v in self._durations.items()}
+            duration_totals = dict(self._duration_totals)
+            counts = dict(self._counts)
+            samples = {k: sorted(v) for k, v in self._samples.items()}
+            sample_totals = dict(self._sample_totals)
+
+        operations = sorted(
+            {
+                operation
+                for operation, _ in list(duration_totals)
+                + list(counts)
+                + list(sample_totals)
+            }
+        )
+        result = {}  # type: Dict[str, dict]
+        for operation in operations:
+            result[operation] = {
+                "calls": duration_totals.get((operation, "total"), (0, 0.0))[0],
+                "notes": counts.get((operation, "notes"), 0),
+                "bytes_read": counts.get((operation, "bytes_read"), 0),
+                "bytes_written": counts.get((operation, "bytes_written"), 0),
+                "phases": {},
+                "samples": {},
+            }
+        for (operation, phase), (count, total) in sorted(duration_totals.items()):
+            result[operation]["phases"][phase] = _summarize_values(
+                durations[(operation, phase)], count, total, percentiles
+            )
+        for (operation, name), (count, total) in sorted(sample_totals.items()):
+            result[operation]["samples"][name] = _summarize_values(
+                samples[(operation, name)], count, total, percentiles
+            )
+        return result
+
+    def dump(self, file: Optional[TextIO] = None) -> None:
+        """Writes a summary of all measurements as a table to file,
+        or to stdout if it is None
+        """
+        if file is None:
+            file = sys.stdout
+        for operation, values in self.summary().items():
+            counts = ", ".join(
+                f"{name}={values[name]}"
+                for name in ("calls", "notes", "bytes_read", "bytes_written")
+            )
+            print(f"{operation} ({counts})", file=file)
+            print(
+                f"  {'phase':<10} {'total ms':>10} {'mean ms':>9} {'p50 ms':>9}"
+                + f" {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+                file=file,
+            )
+            for phase, d in values["phases"].items():
+                print(
+                    f"  {phase:<10} {d['total'] * 1000:>10.2f}"
+                    + "".join(
+                        f" {d[name] * 1000:>9.2f}"
+                        for name in ("mean", "p50", "p90", "p99", "max")
+                    ),
+                    file=file,
+                )
+            for name, d in values["samples"].items():
+                print(
+                    f"  {name} (mean={d['mean']:g}, p50={d['p50']:g},"
+                    + f" p90={d['p90']:g}, p99={d['p99']:g}, max={d['max']:g})",
+                    file=file,
+                )
+
+    def reset(self) -> None:
+        """Removes all measurements"""
+        with self._lock:
+            self._durations = {}
+            self._duration_totals = {}
+            self._counts = {}
+            self._samples = {}
+            self._sample_totals = {}
+
+
+def _summarize_values(
+    sorted_values: Sequence[float],
+    count: int,
+    total: float,
+    percentiles: Sequence[float],
+) -> Dict[str, float]:
+    """Returns count, total, mean, the percentiles, and the maximum of the values.
+    count and total include values which are no longer kept in sorted_values"""
+    summary = {"count": count, "total": total, "mean": total / count}
+    for percentile in percentiles:
+        summary[f"p{percentile:g}"] = _percentile(sorted_values, percentile)
+    summary["max"] = sorted_values[-1]
+    return summary
+
+
+def _percentile(sorted_values: Sequence[float], percentile: float) -> float:
+    """Returns the percentile of the sorted values with the nearest-rank method"""
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
 class BaseStore(ABC):
     """The base store class. This class cannot be used directly and acts
     as a template which defines the store interface. Inherit from this class if you
     want to implement your own store class.
+
+    Subclasses can report measurements to the optional StoreStats instance in
+    the stats attribute by wrapping their operations with _operation and their
+    phases with _phase, and by calling _record_count.
     """
 
-    def __init__(self):
-        pass
+    stats = None  # type: Optional[StoreStats]
+    # True if add_many either adds all notes or none, which AsyncStore relies on
+    # to retry the notes of a failed add_many one by one
+    atomic_add_many = False
+
+    def __init__(self, stats: Optional[StoreStats] = None):
+        self.stats = stats
+        self._stats_local = threading.local()
+
+    @contextmanager
+    def _operation(self, name: str) -> Iterator[None]:
+        """Measures the total duration of an operation and assigns all phases and
+        counts recorded in the meantime to it. Operations which are used by
+        other operations, e.g. add_many by add, are measured as part of the
+        outer one and only the outer one records the number of notes.
+        """
+        local = getattr(self, "_stats_local", None)
+        if self.stats is None or local is None:
+            yield
+            return
+        if getattr(local, "operation", None) is not None:
+            local.depth += 1
+            try:
+                yield
+            finally:
+                local.depth -= 1
+            return
+        local.operation = name
+        local.depth = 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            local.operation = None
+            self.stats.record_duration(name, "total", time.perf_counter() - start)
+
+    @contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        if self.stats is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record_duration(name, time.perf_counter() - start)
+
+    def _record_duration(self, phase: str, seconds: float) -> None:
+        operation = getattr(getattr(self, "_stats_local", None), "operation", None)
+        if self.stats is not None and operation is not None:
+            self.stats.record_duration(operation, phase, seconds)
+
+    def _record_sample(self, name: str, value: float) -> None:
+        operation = getattr(getattr(self, "_stats_local", None), "operation", None)
+        if self.stats is not None and operation is not None:
+            self.stats.record_sample(operation, name, value)
+
+    def _record_count(self, name: str, value: int) -> None:
+        local = getattr(self, "_stats_local", None)
+        operation = getattr(local, "operation", None)
+        if self.stats is None or operation is None:
+            return
+        if name == "notes" and local.depth > 1:  # type: ignore
+            return
+        self.stats.record_count(operation, name, value)
+
+    @contextmanager
+    def _locked(self, lock: "_FileLock") -> Iterator[None]:
+        """Acquires lock and records the time spent waiting for it"""
+        with self._phase("lock"):
+            lock.__enter__()
+        try:
+            yield
+        finally:
+            lock.__exit__(None, None, None)
 
     @abstractmethod
     def load(self, return_dataframe: bool = False):
@@ -298,14 +764,559 @@ class BaseStore(ABC):
         """
         pass
 
+    def add_many(self, notes: Sequence[Note]) -> None:
+        """Adds multiple notes to the store. The default implementation simply
+        calls add for each note. Subclasses should overwrite it if they can add
+        all notes at once and either add all of them or none, and then set
+        atomic_add_many to True.
+        """
+        for note in notes:
+            self.add(note)
+
+    def update(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Should replace the stored notes which have the same identifiers
+        as the passed in ones
+
+        This method is intended to be implemented by subclasses and so
+        raises a NotImplementedError.
+        """
+        raise NotImplementedError
+
+    def remove(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Should remove the passed in notes from the store
+
+        This method is intended to be implemented by subclasses and so
+        raises a NotImplementedError.
+        """
+        raise NotImplementedError
+
+    def query(
+        self,
+        where: Optional[_Where] = None,
+        columns: Optional[Sequence[str]] = None,
+        order_by: Optional[str] = None,
+        ascending: bool = True,
+        limit: Optional[int] = None,
+    ) -> Union[List[Note], List[Dict[str, Any]]]:
+        """Returns the notes which match the where condition. Only the notes
+        which are returned are converted to Note instances and if there is
+        no order_by, the search stops as soon as limit notes are found.
+
+        Subclasses can overwrite this method to evaluate parts of the
+        query more efficiently, e.g. in a database.
+
+        Parameters
+        ----------
+        where : Optional[Union[Callable[[Dict[str, Any]], bool], Dict[str, Any]]],
+        optional (default=None)
+            Either a function, which gets the flattened note as input (keys are
+            joined with ".", e.g. "metrics.auc") and returns True if the note should
+            be returned, or a dictionary with flattened keys and the values they need
+            to be equal to, e.g. {"model": "randomforest"}. If None, all notes match.
+        columns : Optional[Sequence[str]], optional (default=None)
+            If passed, flattened dictionaries are returned instead of notes, which
+            only contain these keys. A key also selects all nested keys, e.g.
+            "metrics" selects "metrics.auc" and "metrics.recall".
+        order_by : Optional[str], optional (default=None)
+            Flattened key by which the notes are sorted. Notes which do not have
+            this key are returned last. If None, the most recent note comes first.
+        ascending : bool, optional (default=True)
+            Sort order if order_by is passed
+        limit : Optional[int], optional (default=None)
+            Maximum number of notes which are returned
+
+        Returns
+        -------
+        Either List[Note] or, if columns are passed, List[Dict[str, Any]]
+        """
+        with self._operation("query"):
+            results = _query_raw_dicts(
+                self._iter_raw_dicts(),
+                where=where,
+                columns=columns,
+                order_by=order_by,
+                ascending=ascending,
+                limit=limit,
+            )
+            self._record_count("notes", len(results))
+            return results
+
+    def aggregate(
+        self,
+        group_by: Union[str, Sequence[str]],
+        metrics: Dict[str, Sequence[str]],
+        where: Optional[_Where] = None,
+    ) -> List[Dict[str, Any]]:
+        """Groups the notes by the values of the group_by keys and aggregates the
+        values of the metrics per group, e.g. the mean and maximum test recall
+        per model. The notes are processed in a single pass and only the running
+        statistics of each group are kept in memory, independent of the number
+        of notes. pandas is not required.
+
+        Parameters
+        ----------
+        group_by : Union[str, Sequence[str]]
+            One or more flattened keys, e.g. "model" or "git.branch". Notes which
+            do not have a key are grouped under the value None
+        metrics : Dict[str, Sequence[str]]
+            Flattened keys of the values which are aggregated, e.g.
+            "metrics.test.recall", and the names of the aggregations. Available
+            are "count", "sum", "mean", "std", "var", "min", and "max". Only
+            numbers are aggregated, other values (including booleans and NaN) and
+            missing keys are ignored. The standard deviation and variance are
+            sample statistics (ddof=1).
+        where : Optional[Union[Callable[[Dict[str, Any]], bool], Dict[str, Any]]],
+        optional (default=None)
+            Condition which notes need to fulfill to be aggregated, see query
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            One dictionary per group with the group_by keys and their values and
+            the aggregations under "<key>.<aggregation>", e.g.
+            "metrics.test.recall.mean". Aggregations without any numbers are None.
+            The groups are ordered by their most recent note.
+        """
+        with self._operation("aggregate"):
+            results = _aggregate_raw_dicts(
+                self._iter_raw_dicts(), group_by, metrics, where=where
+            )
+            return results
+
+    def top_k(
+        self,
+        metric: str,
+        k: int = 10,
+        ascending: bool = False,
+        where: Optional[_Where] = None,
+    ) -> List[Note]:
+        """Returns the k notes with the highest (or lowest) value of metric,
+        e.g. the best models by their test recall. The notes are scanned once
+        and only the best k of them are kept in a heap instead of sorting all.
+
+        Parameters
+        ----------
+        metric : str
+            Flattened key of the values by which the notes are ranked, e.g.
+            "metrics.test.recall". Notes which do not have a number as value
+            for it are not returned
+        k : int, optional (default=10)
+            Maximum number of returned notes. A ValueError is raised if it is
+            negative
+        ascending : bool, optional (default=False)
+            If True, the notes with the lowest values are returned,
+            e.g. for errors
+        where : Optional[Union[Callable[[Dict[str, Any]], bool], Dict[str, Any]]],
+        optional (default=None)
+            Condition which notes need to fulfill to be returned, see query
+
+        Returns
+        -------
+        List[Note]
+            The best note comes first. Notes with the same value are returned
+            with the most recent note first
+        """
+        _check_k(k)
+        with self._operation("top_k"):
+            notes = _top_k_raw_dicts(
+                self._iter_raw_dicts(), metric, k, ascending=ascending, where=where
+            )
+            self._record_count("notes", len(notes))
+            return notes
+
+    def _fingerprint(self) -> Optional[Hashable]:
+        """Should return a value which changes whenever the content of the store
+        changes, e.g. the modification time of its file, so that results based
+        on the content can be cached. None means that it is unknown.
+        """
+        return None
+
+    def iter_notes(self) -> Iterator[Note]:
+        """Yields all notes of the store one at a time with the most recent
+        note first.
+
+        Returns
+        -------
+        Iterator[Note]
+        """
+        for raw_dict in self._iter_raw_dicts():
+            yield Note(content=_copy_raw(raw_dict))
+
+    def _iter_raw_dicts(self) -> Iterator[dict]:
+        """Yields the raw dictionaries of all notes with the most recent note first.
+        They are not allowed to be modified. Subclasses can overwrite this method
+        if they can provide them without creating Note instances.
+        """
+        for note in self.load():
+            yield note
+
+
+def _query_raw_dicts(
+    raw_dicts: Iterable[dict],
+    where: Optional[_Where] = None,
+    columns: Optional[Sequence[str]] = None,
+    order_by: Optional[str] = None,
+    ascending: bool = True,
+    limit: Optional[int] = None,
+) -> Union[List[Note], List[Dict[str, Any]]]:
+    """Implementation of BaseStore.query for raw dictionaries of notes which are
+    sorted with the most recent note first. Only the selected dictionaries are
+    copied and returned either as Note instances or as flattened dictionaries
+    """
+    if isinstance(where, dict):
+        where = _equals_condition(where)
+    needs_flat_dict = where is not None or columns is not None or order_by is not None
+
+    # Tuples of flattened dictionary (if needed) and raw dictionary
+    matches = []  # type: List[Tuple[Dict[str, Any], dict]]
+    # Notes which do not have the order_by key and are sorted last
+    matches_without_key = []  # type: List[Tuple[Dict[str, Any], dict]]
+    for raw_dict in raw_dicts:
+        flat_dict = _flatten_dict(raw_dict) if needs_flat_dict else {}
+        if where is not None and not where(flat_dict):
+            continue
+        if order_by is not None and flat_dict.get(order_by) is None:
+            matches_without_key.append((flat_dict, raw_dict))
+            continue
+        matches.append((flat_dict, raw_dict))
+        if order_by is None and limit is not None and len(matches) >= limit:
+            break
+
+    if order_by is not None:
+        matches = _sort_by_key(matches, order_by, ascending=ascending, limit=limit)
+        matches.extend(matches_without_key)
+    if limit is not None:
+        matches = matches[:limit]
+
+    if columns is not None:
+        return [
+            {k: _copy_raw(v) for k, v in flat_dict.items() if _matches_any(k, columns)}
+            for flat_dict, _ in matches
+        ]
+    return [Note(content=_copy_raw(raw_dict)) for _, raw_dict in matches]
+
+
+def _check_k(k: int) -> None:
+    if k < 0:
+        raise ValueError(f"k needs to be at least 0, not {k}")
+
+
+def _top_k_raw_dicts(
+    raw_dicts: Iterable[dict],
+    metric: str,
+    k: int,
+    ascending: bool = False,
+    where: Optional[_Where] = None,
+) -> List[Note]:
+    """Implementation of BaseStore.top_k for raw dictionaries of notes which are
+    sorted with the most recent note first"""
+    if isinstance(where, dict):
+        where = _equals_condition(where)
+    candidates = (
+        (value, raw_dict)
+        for raw_dict in raw_dicts
+        for value in [_flat_value(raw_dict, metric)]
+        if _is_rankable(value) and (where is None or where(_flatten_dict(raw_dict)))
+    )
+    # Both functions keep the order of the notes for equal values
+    select = heapq.nsmallest if ascending else heapq.nlargest
+    top = select(k, candidates, key=lambda candidate: candidate[0])
+    return [Note(content=_copy_raw(raw_dict)) for _, raw_dict in top]
+
+
+def _is_rankable(value: Any) -> bool:
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and not math.isnan(value)
+    )
+
+
+def _metric_index_entries(raw_dicts: Sequence[dict], metric: str) -> List[list]:
+    """Returns pairs of value and identifier of all notes which have a number
+    as value for metric, sorted by the value in ascending order and notes with
+    the same value in the order of raw_dicts, i.e. with the most recent first"""
+    entries = []
+    for raw_dict in raw_dicts:
+        value = _flat_value(raw_dict, metric)
+        if _is_rankable(value):
+            entries.append([value, raw_dict[Note._identifier_key]])
+    # The sort is stable and therefore keeps the order of equal values
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def _largest_entries(entries: List[list], k: int) -> List[list]:
+    """Returns the k entries with the largest values of an index built by
+    _metric_index_entries, keeping the order of entries with equal values"""
+    largest = []  # type: List[list]
+    end = len(entries)
+    while end > 0 and len(largest) < k:
+        start = end - 1
+        while start > 0 and entries[start - 1][0] == entries[end - 1][0]:
+            start -= 1
+        largest.extend(entries[start:end])
+        end = start
+    return largest[:k]
+
+
+def _aggregate_raw_dicts(
+    raw_dicts: Iterable[dict],
+    group_by: Union[str, Sequence[str]],
+    metrics: Dict[str, Sequence[str]],
+    where: Optional[_Where] = None,
+) -> List[Dict[str, Any]]:
+    """Implementation of BaseStore.aggregate for raw dictionaries of notes"""
+    group_keys = [group_by] if isinstance(group_by, str) else list(group_by)
+    for key, aggregations in metrics.items():
+        unknown = [a for a in aggregations if a not in _RunningStatistics.aggregations]
+        if unknown:
+            raise ValueError(
+                f"Unknown aggregations {unknown} for {key!r}. Available are"
+                + f" {_RunningStatistics.aggregations}"
+            )
+    if isinstance(where, dict):
+        where = _equals_condition(where)
+    metric_keys = list(metrics)
+
+    groups = {}  # type: Dict[Tuple[Any, ...], List[_RunningStatistics]]
+    for raw_dict in raw_dicts:
+        if where is not None and not where(_flatten_dict(raw_dict)):
+            continue
+        group = tuple(_hashable(_flat_value(raw_dict, key)) for key in group_keys)
+        statistics = groups.get(group)
+        if statistics is None:
+            statistics = [_RunningStatistics() for _ in metric_keys]
+            groups[group] = statistics
+        for key, running_statistics in zip(metric_keys, statistics):
+            value = _flat_value(raw_dict, key)
+            if _is_rankable(value):
+                running_statistics.add(value)
+
+    results = []
+    for group, statistics in groups.items():
+        result = dict(zip(group_keys, group))  # type: Dict[str, Any]
+        for key, running_statistics in zip(metric_keys, statistics):
+            for aggregation in metrics[key]:
+                result[f"{key}.{aggregation}"] = running_statistics.result(aggregation)
+        results.append(result)
+    return results
+
+
+class _RunningStatistics:
+    """Count, sum, mean, variance, minimum, and maximum of a stream of numbers.
+    The mean and variance are updated with Welford's algorithm, which is
+    numerically stable and needs constant memory.
+    """
+
+    __slots__ = ("count", "sum", "mean", "_m2", "min", "max")
+    aggregations = ("count", "sum", "mean", "std", "var", "min", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def result(self, aggregation: str) -> Optional[float]:
+        if aggregation == "count":
+            return self.count
+        elif aggregation == "sum":
+            return self.sum
+        elif self.count == 0:
+            return None
+        elif aggregation in ("std", "var"):
+            if self.count < 2:
+                return None
+            variance = self._m2 / (self.count - 1)
+            return math.sqrt(variance) if aggregation == "std" else variance
+        return getattr(self, aggregation)
+
+
+def _flat_value(d: dict, key: str, sep: str = ".") -> Any:
+    """Returns the value of the flattened key (see _flatten_dict) without
+    flattening the whole dictionary, or None if it does not exist"""
+    value = d.get(key)
+    if value is not None and not isinstance(value, dict):
+        return value
+    # The key could also refer to nested dictionaries, e.g. "metrics.test.auc"
+    start = key.find(sep)
+    while start != -1:
+        nested = d.get(key[:start])
+        if isinstance(nested, dict):
+            nested_start = start + len(sep)
+            value = _flat_value(nested, key[nested_start:], sep=sep)
+            if value is not None:
+                return value
+        start = key.find(sep, start + 1)
+    return None
+
+
+def _hashable(value: Any) -> Any:
+    """Converts lists, e.g. of feature names, into tuples and dictionaries into
+    tuples of their sorted items so that they can be used as keys of a dictionary"""
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _equals_condition(values: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    def condition(flat_dict: Dict[str, Any]) -> bool:
+        return all(flat_dict.get(k) == v for k, v in values.items())
+
+    return condition
+
+
+def _sort_by_key(
+    items: List[Tuple[Dict[str, Any], dict]],
+    key: str,
+    ascending: bool = True,
+    limit: Optional[int] = None,
+) -> List[Tuple[Dict[str, Any], dict]]:
+    """Stable sort of (flattened dictionary, raw dictionary) tuples by the value of
+    key in the flattened dictionary. If limit is passed, only the first limit
+    items are kept by using a heap instead of sorting all items.
+    """
+
+    def sort_key(item: Tuple[Dict[str, Any], dict]) -> Tuple[int, Any]:
+        return _type_grouped_key(item[0][key])
 
-def _prepare_note_for_storing(note: Note) -> Note:
+    if limit is None:
+        return sorted(items, key=sort_key, reverse=not ascending)
+    elif ascending:
+        return heapq.nsmallest(limit, items, key=sort_key)
+    return heapq.nlargest(limit, items, key=sort_key)
+
+
+def _type_grouped_key(value: Any) -> Tuple[int, Any]:
+    # Values of different types cannot be compared directly and are therefore
+    # first grouped by their type, numbers before strings before everything else
+    if isinstance(value, (int, float)):
+        return (0, value)
+    elif isinstance(value, str):
+        return (1, value)
+    return (2, json.dumps(value, sort_keys=True, default=str))
+
+
+def _matches_any(key: str, prefixes: Sequence[str]) -> bool:
+    """Returns True if key is equal to one of the prefixes or nested below it"""
+    return any(key == prefix or key.startswith(prefix + ".") for prefix in prefixes)
+
+
+def _iter_json_array(
+    f: Union[TextIO, "_MeasuredReader"],
+    object_hook: Optional[Callable[[dict], Any]] = None,
+    chunk_size: int = 65536,
+) -> Iterator[Any]:
+    """Incrementally decodes a json array from f and yields its elements one at
+    a time. Besides the current element, at most one chunk of the file
+    is kept in memory.
+    """
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def read_more(min_size: int) -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(max(chunk_size, min_size))
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        """Skips whitespace and returns the next character or "" at the end"""
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()  # type: ignore
+            if pos < len(buffer):
+                return buffer[pos]
+            elif not read_more(0):
+                return ""
+
+    def expect_end(end: int) -> None:
+        """Raises if anything but whitespace follows the closing bracket,
+        as json.load does"""
+        nonlocal pos
+        pos = end
+        if next_char() != "":
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+
+    if next_char() != "[":
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+    if next_char() == "]":
+        expect_end(pos + 1)
+        return
+    while True:
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element is not yet completely in the buffer. Read at least as
+            # much again as is already buffered to avoid decoding it too often
+            if eof or not read_more(len(buffer) - pos):
+                raise
+            continue
+        if end == len(buffer) and not eof and read_more(0):
+            # Numbers could continue in the next chunk and need to be decoded again
+            continue
+        yield obj
+        pos = end
+        char = next_char()
+        if char == "]":
+            expect_end(pos + 1)
+            return
+        elif char != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+        pos += 1
+        next_char()
+
+
+class _MeasuredReader:
+    """Wraps a text file and measures the time spent in reading from it
+    and the number of characters which were read
+    """
+
+    def __init__(self, f: TextIO) -> None:
+        self._f = f
+        self.seconds = 0.0
+        self.size = 0
+
+    def read(self, size: int = -1) -> str:
+        start = time.perf_counter()
+        content = self._f.read(size)
+        self.seconds += time.perf_counter() - start
+        self.size += len(content)
+        return content
+
+
+def _prepare_note_for_storing(note: Note, memo: Optional[dict] = None) -> Note:
+    """Ends the note if not yet done and returns a copy of it. Pass the same memo
+    dictionary to copy objects which are shared by multiple notes, e.g. created
+    with Note.from_note(..., copy_on_write=True), only once.
+    """
     if note.end_datetime is None:
         note.end()
-    return copy.deepcopy(note)
+    return Note(content=_copy_raw(note, memo=memo))
 
 
-def _to_pandas(notes: List[Note]):
+def _to_pandas(notes: Iterable[dict]):
     try:
         import pandas as pd  # type: ignore
     except ImportError:
@@ -314,29 +1325,46 @@ def _to_pandas(notes: List[Note]):
             "conda install pandas\n"
             "or: pip install pandas"
         )
-    return pd.DataFrame(copy.deepcopy(_pandas_dict(notes)))
-
+    df = pd.DataFrame(_pandas_dict(notes))
+    for column in (Note._start_datetime_key, Note._end_datetime_key):
+        df[column] = pd.to_datetime(df[column])
+    for column in _filter_sequence_if_startswith(df.columns, Note._metrics_key):
+        if df[column].dtype == object:
+            try:
+                df[column] = pd.to_numeric(df[column])
+            except (ValueError, TypeError):
+                # Column contains values which are not numbers, e.g. strings
+                pass
+    return df
 
-def _pandas_dict(notes: List[Note]) -> dict:
-    flat_dicts = _flatten_notes(notes)
-    all_keys = _all_keys_from_dicts(flat_dicts)
 
-    # Create basic structure
+def _pandas_dict(notes: Iterable[dict]) -> dict:
+    """Returns a dictionary with the flattened keys of all notes as keys and their
+    values as lists, where None is used if a note does not have the key.
+    Dictionaries and lists are copied so that the returned values
+    do not share any objects with the passed in notes.
+    """
     column_dict = {}  # type: Dict[str, list]
-    for column in all_keys:
-        column_dict[column] = []
-
-    # Fill structure with values
-    for d in flat_dicts:
-        for column in all_keys:
-            column_dict[column].append(d.get(column))
+    n_rows = 0
+    for note in notes:
+        for column, value in _flatten_dict(note).items():
+            values = column_dict.get(column)
+            if values is None:
+                values = column_dict[column] = [None] * n_rows
+            elif len(values) < n_rows:
+                # Fill in missing values of the previous notes
+                values.extend([None] * (n_rows - len(values)))
+            values.append(value if _is_immutable(value) else _copy_raw(value))
+        n_rows += 1
+    for values in column_dict.values():
+        values.extend([None] * (n_rows - len(values)))
 
-    key_order = _key_order(all_keys)
-    ordered_dict = {k: column_dict[k] for k in key_order}
+    key_order = _key_order(list(column_dict))
+    ordered_dict = {k: column_dict.get(k, [None] * n_rows) for k in key_order}
     return ordered_dict
 
 
-def _flatten_notes(notes: Sequence[Note]) -> List[Dict[str, Any]]:
+def _flatten_notes(notes: Iterable[dict]) -> List[Dict[str, Any]]:
     flat_dicts = []
     for note in notes:
         flat_dicts.append(_flatten_dict(dict(note)))
@@ -373,7 +1401,8 @@ def _key_order(
             + _filter_sequence_if_startswith(keys, startswith=Note._git_key)
             + [Note._python_path_key]
         )
-        key_order.extend(sorted([k for k in keys if k not in key_order]))
+        ordered_keys = set(key_order)
+        key_order.extend(sorted([k for k in keys if k not in ordered_keys]))
     else:
         for k in additional_keys_subset:
             key_order += _filter_sequence_if_startswith(keys, startswith=k)
@@ -383,16 +1412,20 @@ def _key_order(
 def _flatten_dict(d: dict, parent_key: str = "", sep: str = ".") -> dict:
     """Flattens a dictionary by concatenating key names
 
-    Taken from https://stackoverflow.com/a/6027615
+    Idea taken from https://stackoverflow.com/a/6027615
     """
-    items = []  # type: List[Tuple[Any, Any]]
-    for k, v in d.items():
+    flat_dict = {}  # type: Dict[str, Any]
+    _flatten_dict_into(d, parent_key, sep, flat_dict)
+    return flat_dict
+
+
+def _flatten_dict_into(d: dict, parent_key: str, sep: str, flat_dict: dict) -> None:
+    for k, v in dict.items(d):
         new_key = parent_key + sep + k if parent_key else k
         if isinstance(v, dict):
-            items.extend(_flatten_dict(v, new_key, sep=sep).items())
+            _flatten_dict_into(v, new_key, sep, flat_dict)
         else:
-            items.append((new_key, v))
-    return dict(items)
+            flat_dict[new_key] = v
 
 
 def _filter_sequence_if_startswith(seq: Sequence[str], startswith: str) -> List[str]:
@@ -402,30 +1435,126 @@ def _filter_sequence_if_startswith(seq: Sequence[str], startswith: str) -> List[
 class Store(BaseStore):
     """Main purpose is to store Note instances in a json file. Additional methods are
     provided to load all notes, as well as update or remove specified notes.
+
+    The parsed content of the json file is cached in memory and only read again
+    if the file changed on disk since it was last read or written by this instance.
     """
 
-    def __init__(self, path: Union[str, Path]) -> None:
+    atomic_add_many = True
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        columnar: bool = False,
+        stats: Optional[StoreStats] = None,
+        index: bool = False,
+        buffered: bool = False,
+        flush_interval: float = 1.0,
+        max_buffered_notes: int = 100,
+        metric_indexes: Sequence[str] = (),
+    ) -> None:
         """
         Parameters
         ----------
         path : Union[str, Path]
             Path to the json file. If it does not yet exist, a new one will be created,
-            else, the Store will interact with the existing file and modify it
+            else, the Store will interact with the existing file and modify it.
+            If the path ends with ".gz" or ".xz", the file is compressed with gzip
+            or lzma. Compressed files are detected when they are read, independent
+            of the file extension
+        columnar : bool, optional (default=False)
+            If True, all numeric values of the notes (e.g. metrics) are additionally
+            saved in a columnar format in the folder "<path>.columns", which is
+            updated on every write. They can then be loaded with load_columns
+            without reading the json file.
+        stats : Optional[StoreStats], optional (default=None)
+            If passed, the durations of all operations and their phases as well as
+            the number of notes and bytes which were processed are recorded in it
+        index : bool, optional (default=False)
+            If True, the position of each note in the json file is additionally
+            saved in the file "<path>.index", which is updated on every write.
+            get and contains then only read the index and the requested note
+            instead of the whole json file. Not supported for compressed files.
+        buffered : bool, optional (default=False)
+            If True, added and updated notes are kept in memory and written to the
+            json file in batches by a background thread, see flush. Buffered notes
+            are written before notes are read or removed, when the store is closed,
+            e.g. at the end of a with statement, and at interpreter shutdown.
+            Notes which can not be written are moved to failed_notes.
+        flush_interval : float, optional (default=1.0)
+            Maximum number of seconds for which notes are buffered if buffered=True
+        max_buffered_notes : int, optional (default=100)
+            Buffered notes are written as soon as this many notes are buffered
+        metric_indexes : Sequence[str], optional (default=())
+            Flattened keys, e.g. "metrics.test.recall", for which the values of all
+            notes are kept sorted in the file "<path>.metrics", which is updated
+            on every write. top_k then looks up the best notes in it instead of
+            scanning all notes.
         """
-        super().__init__()
+        super().__init__(stats=stats)
         self.path = _convert_to_path(path)
+        self.compression = _COMPRESSIONS.get(self.path.suffix.lower())
+        if index and self.compression is not None:
+            raise ValueError(
+                "The positions of notes in compressed files can not be indexed."
+                + " Use index=False or a path without a compression extension."
+            )
+        self.columnar = columnar
+        self.index = index
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.max_buffered_notes = max_buffered_notes
+        self.metric_indexes = list(metric_indexes)
+        self._metric_indexes_path = self.path.with_name(self.path.name + ".metrics")
+        self._columns_path = self.path.with_name(self.path.name + ".columns")
+        self._index_path = self.path.with_name(self.path.name + ".index")
+        # Cached raw dictionaries of all notes, sorted with the most recent note
+        # first, together with the file identity for which the cache is valid
+        # and the position of each note, which is built when it is first needed.
+        # The raw dictionaries are shared between all users of the cache and must
+        # therefore never be modified in place. The cache is only replaced as a
+        # whole, so that readers running at the same time as a write, e.g. of
+        # the flush thread of a buffered store, always see matching values
+        self._cache = _StoreCache(None, [], None)
+        self._cache_lock = threading.Lock()
+        # Byte offset and length of each note in the json file with identity
+        # _cached_index_stamp as read from the index file
+        self._cached_index = {}  # type: Dict[str, List[int]]
+        self._cached_index_stamp = None  # type: Optional[Tuple[int, int, int]]
+        # Sorted values of the metric indexes, see _metric_index_entries
+        self._cached_metric_indexes = {}  # type: Dict[str, List[list]]
+        self._metric_indexes_stamp = None  # type: Optional[Tuple[int, int, int]]
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._lock = _FileLock(_lock_path(self.path))
+        # Prepared notes which are not yet written, as tuples of the kind of change
+        # ("add" or "update"), the raw dictionary, and the time when they were
+        # buffered. _buffered_identifiers contains the identifiers of added notes
+        self._buffered_records = []  # type: List[Tuple[str, dict, float]]
+        self._buffered_identifiers = set()  # type: Set[str]
+        # Buffered notes which could not be written, see flush
+        self.failed_notes = []  # type: List[Note]
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._flush_event = threading.Event()
+        self._flush_thread = None  # type: Optional[threading.Thread]
+        self._closed = False
         self._create_store_if_not_exists()
 
     def _create_store_if_not_exists(self):
-        store_exists = self.path.exists()
-        if not store_exists:
-            self._save_notes(notes=[])
+        with self._lock:
+            store_exists = self.path.exists()
+            if not store_exists:
+                self._save_notes(notes=[])
 
-    def load(self, return_dataframe: bool = False):
+    def load(self, return_dataframe: bool = False, lazy: bool = False):
         """Loads the entire json file and returns it as a list of Note instances
         with the most recent note first. Optionally, a pandas dataframe can be
         returned instead.
 
+        The returned notes are copies and can therefore be modified without
+        affecting the store or the results of other calls to this method.
+
         Parameters
         ----------
         return_dataframe : bool, optional (default=False)
@@ -433,91 +1562,1806 @@ class Store(BaseStore):
             where nested structures inside the notes are resolved as far as possible
             and the keys are joined with "." to form column names. This requires
             the pandas package to be installed.
+        lazy : bool, optional (default=False)
+            If True, a LazyNotes sequence is returned, which only creates the notes
+            when they are accessed. If the store was created with index=True,
+            the notes are also only decoded when they are accessed.
 
         Returns
         -------
-        Either List[str] or pd.DataFrame, depending on value of return_dataframe
+        Either List[Note], LazyNotes, or pd.DataFrame, depending on value of
+        return_dataframe and lazy
         """
-        loaded_notes = self._load()
-        if return_dataframe:
-            loaded_notes = _to_pandas(loaded_notes)
-        return loaded_notes
+        self._flush_buffered()
+        with self._operation("load"):
+            if return_dataframe:
+                raw_dicts = self._load_raw_dicts()
+                with self._phase("dataframe"):
+                    notes = _to_pandas(raw_dicts)
+            elif lazy:
+                notes = self._load_lazy()
+            else:
+                notes = self._load()
+            self._record_count("notes", len(notes))
+            return notes
 
     def _load(self) -> List[Note]:
-        notes_raw = self._json_load(self.path)
-        notes = _raw_dicts_to_notes(notes_raw)
-        return self._sort_notes(notes)
+        raw_dicts = self._load_raw_dicts()
+        with self._phase("copy"):
+            return [Note(content=_copy_raw(d)) for d in raw_dicts]
 
-    def add(self, note: Note) -> None:
-        """Adds the given note to the .json file of the store.
+    def _load_lazy(self) -> LazyNotes:
+        if self.index:
+            with self.path.open("rb") as f:
+                stat = os.fstat(f.fileno())
+                offsets = self._index_offsets(
+                    (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                )
+                if offsets is not None:
+                    # Only the encoded notes are kept in memory, which is
+                    # considerably less than their decoded dictionaries
+                    with self._phase("read"):
+                        content = f.read()
+                    self._record_count("bytes_read", len(content))
+                    return LazyNotes(
+                        list(offsets.values()),
+                        functools.partial(_decode_note_at, content),
+                    )
+        return LazyNotes(self._load_raw_dicts(), _copy_to_note)
 
-        Before storing the note, the .end method of it is called, if
-        not already done previously.
+    def _load_raw_dicts(self) -> List[dict]:
+        """Returns the cached raw dictionaries of all notes, with the most recent
+        note first, and reads them from the file if the cache is outdated.
+        The returned dictionaries must not be modified.
+        """
+        return self._load_cache().raw_dicts
 
-        Parameters
-        ----------
-        note : Note
-            The Note instance which should be added to the store. The note
-            needs to consist entirely of json serializable objects or
-            datetime.datetime instances
+    def _load_cache(self) -> _StoreCache:
+        cache = self._cache
+        cache_key = _file_identity(self.path)
+        if cache_key == cache.key:
+            self._cache_hits += 1
+            return cache
+        self._cache_misses += 1
+        raw_dicts = self._read_json()
+        with self._phase("sort"):
+            raw_dicts = _sort_notes(raw_dicts)
+        return self._update_cache(raw_dicts, cache_key)
 
-        Returns
-        -------
-        None
-        """
-        # As the whole json file needs to be loaded to add a new entry,
-        # changes made to the file between the call to self.load and
-        # the saving of the file will be overwritten.
-        all_notes = self.load()
-        if self._notes_are_subset(notes_subset=[note], all_notes=all_notes):
-            raise Exception(
-                f"The identifier for the note '{note.identifier}' "
-                + "already exists in the store."
-                + " The note was not added."
+    def _read_json(self) -> List[dict]:
+        with _open_for_reading(self.path) as f:
+            if self.stats is None:
+                return list(_iter_json_array(f, object_hook=_deserialize_datetime))
+            # Reading and decoding the file are interleaved and therefore the
+            # time spent in reading is measured separately by the reader
+            reader = _MeasuredReader(f)
+            start = time.perf_counter()
+            raw_dicts = list(
+                _iter_json_array(reader, object_hook=_deserialize_datetime)
             )
-        note = _prepare_note_for_storing(note)
-        all_notes.append(note)
-        self._save_notes(all_notes)
+            duration = time.perf_counter() - start
+        self._record_duration("read", reader.seconds)
+        self._record_duration("parse", duration - reader.seconds)
+        self._record_count("bytes_read", reader.size)
+        return raw_dicts
 
-    def update(self, notes: Union[Note, Sequence[Note]]) -> None:
-        """Updates the passed in notes in the .json file of the store
+    def _iter_raw_dicts(self) -> Iterator[dict]:
+        self._flush_buffered()
+        return iter(self._load_raw_dicts())
 
-        Uses the identifier attribute of the notes to find the original ones
-        and replaces them
+    def _fingerprint(self) -> Optional[Hashable]:
+        return _file_identity(self.path)
 
-        Parameters
-        ----------
-        notes: Union[Note, Sequence[Note]]
-            One or more notes which should be updated
+    def iter_notes(self) -> Iterator[Note]:
+        """Yields the notes of the store one at a time in the order in which they
+        are saved in the json file, which is with the most recent note first
+        for all files written by a Store.
+
+        If the content of the file is not yet cached, the file is decoded
+        incrementally and only one note at a time is kept in memory.
 
         Returns
         -------
-        None
+        Iterator[Note]
         """
-        if isinstance(notes, Note):
-            notes_to_be_updated = [notes]
+        self._flush_buffered()
+        cache = self._cache
+        if _file_identity(self.path) == cache.key:
+            self._cache_hits += 1
+            for raw_dict in cache.raw_dicts:
+                yield Note(content=_copy_raw(raw_dict))
         else:
-            notes_to_be_updated = list(notes)
-        # As the whole json file needs to be loaded to add a new entry,
-        # changes made to the file between the call to self.load and
-        # the saving of the file will be overwritten.
-        stored_notes = self.load()
-        # Update list by first filtering out notes which should be updated and
-        # then insert new version of notes
-        assert self._notes_are_subset(
-            notes_subset=notes_to_be_updated, all_notes=stored_notes
-        ), (
-            "Some of the notes do not yet exist in the store."
-            + " Add them with the .add method. Nothing was updated."
-        )
-        new_stored_notes = self._filter_notes(
-            notes_to_filter_out=notes_to_be_updated, all_notes=stored_notes
-        )
-        new_stored_notes.extend(notes_to_be_updated)
-        self._save_notes(new_stored_notes)
+            for raw_dict in self._json_iter(self.path):
+                yield Note(content=raw_dict)
+
+    def _update_cache(
+        self, raw_dicts: List[dict], cache_key: Optional[Tuple[int, int, int]]
+    ) -> _StoreCache:
+        cache = _StoreCache(cache_key, raw_dicts, None)
+        with self._cache_lock:
+            self._cache = cache
+        return cache
+
+    def _load_positioned_cache(self) -> _StoreCache:
+        """Returns the cache including the position of each note in its raw
+        dictionaries, keyed by the identifiers of the notes"""
+        cache = self._load_cache()
+        if cache.positions is None:
+            positions = {
+                raw_dict[Note._identifier_key]: i
+                for i, raw_dict in enumerate(cache.raw_dicts)
+            }
+            positioned_cache = cache._replace(positions=positions)
+            with self._cache_lock:
+                # Another thread could have replaced the cache in the meantime
+                if self._cache is cache:
+                    self._cache = positioned_cache
+            cache = positioned_cache
+        return cache
+
+    def _stored_positions(self) -> Dict[str, int]:
+        return self._load_positioned_cache().positions
+
+    def get(self, identifier: str) -> Optional[Note]:
+        """Returns the note with the given identifier or None if it does not exist
+        in the store.
+
+        If the store was created with index=True, only the index and the note
+        itself are read from disk. Otherwise, all notes are loaded once and
+        subsequent calls are answered from the in-memory cache.
+
+        Parameters
+        ----------
+        identifier : str
+            Identifier of the note
+
+        Returns
+        -------
+        Optional[Note]
+        """
+        self._flush_buffered()
+        with self._operation("get"):
+            found, raw_dict = None, None  # type: Tuple[Optional[bool], Optional[dict]]
+            if self.index:
+                found, raw_dict = self._get_indexed(identifier)
+                if found is None:
+                    self._rebuild_index()
+                    found, raw_dict = self._get_indexed(identifier)
+            if found is None:
+                cache = self._load_positioned_cache()
+                position = cache.positions.get(identifier)
+                if position is not None:
+                    raw_dict = _copy_raw(cache.raw_dicts[position])
+            self._record_count("notes", int(raw_dict is not None))
+        return None if raw_dict is None else Note(content=raw_dict)
+
+    def contains(self, identifier: str) -> bool:
+        """Returns True if a note with the given identifier exists in the store.
+        See get for which files are read.
+
+        Parameters
+        ----------
+        identifier : str
+            Identifier of the note
+
+        Returns
+        -------
+        bool
+        """
+        self._flush_buffered()
+        with self._operation("contains"):
+            if self.index:
+                offsets = self._index_offsets(_file_identity(self.path))
+                if offsets is None:
+                    self._rebuild_index()
+                    offsets = self._index_offsets(_file_identity(self.path))
+                if offsets is not None:
+                    return identifier in offsets
+            return identifier in self._stored_positions()
+
+    def _get_indexed(self, identifier: str) -> Tuple[Optional[bool], Optional[dict]]:
+        """Reads the note with the given identifier from the position saved in the
+        index. Returns whether the note was found and its raw dictionary, or
+        (None, None) if the index does not belong to the current json file.
+        """
+        raw_dicts = self._read_indexed([identifier])
+        if raw_dicts is None:
+            return None, None
+        elif not raw_dicts:
+            return False, None
+        return True, raw_dicts[0]
+
+    def _read_indexed(self, identifiers: Sequence[str]) -> Optional[List[dict]]:
+        """Reads the notes with the given identifiers from the positions saved in
+        the index and returns their raw dictionaries, skipping identifiers which
+        do not exist. Returns None if the index does not belong to the current
+        json file.
+        """
+        contents = []
+        with self.path.open("rb") as f:
+            # The identity of the opened file is used, as the file at self.path
+            # could be replaced by another process in the meantime
+            stat = os.fstat(f.fileno())
+            offsets = self._index_offsets((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            if offsets is None:
+                return None
+            with self._phase("read"):
+                for identifier in identifiers:
+                    if identifier in offsets:
+                        offset, length = offsets[identifier]
+                        f.seek(offset)
+                        contents.append(f.read(length))
+        self._record_count("bytes_read", sum(len(c) for c in contents))
+        with self._phase("parse"):
+            return [
+                json.loads(content.decode("utf-8"), object_hook=_deserialize_datetime)
+                for content in contents
+            ]
+
+    def top_k(
+        self,
+        metric: str,
+        k: int = 10,
+        ascending: bool = False,
+        where: Optional[_Where] = None,
+    ) -> List[Note]:
+        """Returns the k notes with the highest (or lowest) value of metric,
+        see BaseStore.top_k for a description of the parameters.
+
+        If metric is one of the metric_indexes of the store and no where condition
+        is passed, the identifiers of the best notes are looked up in the index
+        and only these notes are read, without their json file if the store
+        also has an index (index=True).
+
+        Returns
+        -------
+        List[Note]
+        """
+        _check_k(k)
+        self._flush_buffered()
+        if metric not in self.metric_indexes or where is not None:
+            return super().top_k(metric, k=k, ascending=ascending, where=where)
+        with self._operation("top_k"):
+            with self._phase("metric_index"):
+                entries = self._metric_index(metric)
+                top_entries = entries[:k] if ascending else _largest_entries(entries, k)
+            raw_dicts = self._read_notes([identifier for _, identifier in top_entries])
+            self._record_count("notes", len(raw_dicts))
+            return [Note(content=raw_dict) for raw_dict in raw_dicts]
+
+    def _read_notes(self, identifiers: Sequence[str]) -> List[dict]:
+        """Returns copies of the raw dictionaries of the notes with the given
+        identifiers, skipping identifiers which do not exist"""
+        if self.index:
+            raw_dicts = self._read_indexed(identifiers)
+            if raw_dicts is not None:
+                return raw_dicts
+        cache = self._load_positioned_cache()
+        return [
+            _copy_raw(cache.raw_dicts[cache.positions[identifier]])
+            for identifier in identifiers
+            if identifier in cache.positions
+        ]
+
+    def _metric_index(self, metric: str) -> List[list]:
+        """Returns the entries of the metric index of the current json file.
+        The index is built again if it is missing or outdated, e.g. because
+        the file was changed by a Store without this metric index.
+        """
+        identity = _file_identity(self.path)
+        if self._metric_indexes_stamp != identity:
+            try:
+                with self._metric_indexes_path.open("r", encoding="utf-8") as f:
+                    metric_indexes = json.load(f)
+            except FileNotFoundError:
+                metric_indexes = {"stamp": None, "metrics": {}}
+            stamp = metric_indexes["stamp"]
+            if (
+                stamp is not None
+                and tuple(stamp) == identity
+                and set(self.metric_indexes) <= set(metric_indexes["metrics"])
+            ):
+                self._cached_metric_indexes = metric_indexes["metrics"]
+                self._metric_indexes_stamp = identity
+            else:
+                with self._locked(self._lock):
+                    cache = self._load_cache()
+                    self._write_metric_indexes(cache.raw_dicts, cache.key)
+        return self._cached_metric_indexes[metric]
+
+    def _write_metric_indexes(
+        self, raw_dicts: List[dict], stamp: Optional[Tuple[int, int, int]]
+    ) -> None:
+        metric_indexes = {
+            metric: _metric_index_entries(raw_dicts, metric)
+            for metric in self.metric_indexes
+        }
+        _replace_file_content(
+            self._metric_indexes_path,
+            json.dumps({"stamp": stamp, "metrics": metric_indexes}),
+        )
+        self._cached_metric_indexes = metric_indexes
+        self._metric_indexes_stamp = stamp
+
+    def _index_offsets(
+        self, identity: Optional[Tuple[int, int, int]]
+    ) -> Optional[Dict[str, List[int]]]:
+        """Returns the byte offset and length of each note in the json file with
+        the given identity, or None if the index file is missing or outdated
+        """
+        if identity is None:
+            return None
+        if self._cached_index_stamp != identity:
+            try:
+                with self._phase("index"), self._index_path.open(
+                    "r", encoding="utf-8"
+                ) as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                return None
+            self._cached_index = index["offsets"]
+            self._cached_index_stamp = tuple(index["stamp"])  # type: ignore
+        if self._cached_index_stamp != identity:
+            return None
+        return self._cached_index
+
+    def _rebuild_index(self) -> None:
+        """Writes the json file again together with its index. This is only needed
+        if the file was changed without updating the index, e.g. by a Store
+        with index=False or by a previous version of hypernotes.
+        """
+        with self._locked(self._lock):
+            if self._index_offsets(_file_identity(self.path)) is None:
+                self._save_raw_dicts(list(self._load_raw_dicts()))
+
+    def cache_info(self) -> CacheInfo:
+        """Returns the number of hits and misses of the in-memory cache
+        of the store content as a named tuple (hits, misses)
+        """
+        return CacheInfo(self._cache_hits, self._cache_misses)
+
+    def add(self, note: Note) -> None:
+        """Adds the given note to the .json file of the store.
+
+        Before storing the note, the .end method of it is called, if
+        not already done previously.
+
+        Parameters
+        ----------
+        note : Note
+            The Note instance which should be added to the store. The note
+            needs to consist entirely of json serializable objects or
+            datetime.datetime instances
+
+        Returns
+        -------
+        None
+        """
+        with self._operation("add"):
+            self.add_many([note])
+            self._record_count("notes", 1)
+
+    def add_many(self, notes: Sequence[Note]) -> None:
+        """Adds all given notes to the .json file of the store with a single write.
+        Either all notes are added or, if one of them can not be added, none.
+
+        Before storing the notes, the .end method of each of them is called, if
+        not already done previously.
+
+        Parameters
+        ----------
+        notes : Sequence[Note]
+            The Note instances which should be added to the store. The notes
+            need to consist entirely of json serializable objects or
+            datetime.datetime instances
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_added = list(notes)
+        if self.buffered:
+            with self._operation("add_many"):
+                self._buffer("add", notes_to_be_added)
+                self._record_count("notes", len(notes_to_be_added))
+            return
+        # The lock prevents that changes made by other processes between reading
+        # and writing the file are overwritten
+        with self._operation("add_many"), self._locked(self._lock):
+            cache = self._load_positioned_cache()
+            stored_raw_dicts = cache.raw_dicts
+            with self._phase("validate"):
+                invalid_identifiers = _duplicated_identifiers(
+                    notes_to_be_added,
+                    existing_identifiers=cache.positions.keys(),
+                )
+            if invalid_identifiers:
+                raise Exception(
+                    "The identifiers of the following notes already exist in the"
+                    + f" store or occur multiple times: {invalid_identifiers}."
+                    + " No notes were added."
+                )
+            with self._phase("prepare"):
+                memo = {}  # type: dict
+                new_raw_dicts = [
+                    dict(_prepare_note_for_storing(note, memo))
+                    for note in notes_to_be_added
+                ]
+            self._save_raw_dicts(stored_raw_dicts + new_raw_dicts)
+            self._record_count("notes", len(new_raw_dicts))
+
+    def update(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Updates the passed in notes in the .json file of the store
+
+        Uses the identifier attribute of the notes to find the original ones
+        and replaces them
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(notes, Note):
+            notes = [notes]
+        with self._operation("update"):
+            self.update_many(notes)
+            self._record_count("notes", len(notes))
+
+    def update_many(self, notes: Sequence[Note]) -> None:
+        """Updates all passed in notes in the .json file of the store with a single
+        write. Either all notes are updated or, if one of them can not be
+        updated, none.
+
+        Uses the identifier attribute of the notes to find the original ones
+        and replaces them. Before storing the notes, the .end method of each of them
+        is called, if not already done previously.
+
+        Parameters
+        ----------
+        notes: Sequence[Note]
+            The notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_updated = list(notes)
+        if self.buffered:
+            with self._operation("update_many"):
+                self._buffer("update", notes_to_be_updated)
+                self._record_count("notes", len(notes_to_be_updated))
+            return
+        # The lock prevents that changes made by other processes between reading
+        # and writing the file are overwritten
+        with self._operation("update_many"), self._locked(self._lock):
+            cache = self._load_positioned_cache()
+            stored_raw_dicts = cache.raw_dicts
+            # Update list by first filtering out notes which should be updated and
+            # then insert new version of notes
+            with self._phase("validate"):
+                assert self._notes_are_subset(
+                    notes_subset=notes_to_be_updated,
+                    all_identifiers=cache.positions.keys(),
+                ), (
+                    "Some of the notes do not yet exist in the store."
+                    + " Add them with the .add method. Nothing was updated."
+                )
+                assert not _duplicated_identifiers(notes_to_be_updated), (
+                    "Some of the notes occur multiple times in the passed in notes."
+                    + " Nothing was updated."
+                )
+            with self._phase("prepare"):
+                memo = {}  # type: dict
+                new_raw_dicts = [
+                    dict(_prepare_note_for_storing(note, memo))
+                    for note in notes_to_be_updated
+                ]
+                new_stored_raw_dicts = self._filter_notes(
+                    notes_to_filter_out=notes_to_be_updated, all_notes=stored_raw_dicts
+                )
+            self._save_raw_dicts(new_stored_raw_dicts + new_raw_dicts)
+            self._record_count("notes", len(new_raw_dicts))
+
+    def remove(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Removes passed in notes from store
+
+        Uses the identifier attribute of the notes to find the original ones
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be removed
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(notes, Note):
+            notes_to_be_removed = [notes]
+        else:
+            notes_to_be_removed = list(notes)
+        self._flush_buffered()
+        with self._operation("remove"), self._locked(self._lock):
+            cache = self._load_positioned_cache()
+            stored_raw_dicts = cache.raw_dicts
+            with self._phase("validate"):
+                assert self._notes_are_subset(
+                    notes_subset=notes_to_be_removed,
+                    all_identifiers=cache.positions.keys(),
+                ), (
+                    "Some of the notes do not yet exist in the store."
+                    + " Nothing was removed. Only pass in notes which already"
+                    + " exist in the store."
+                )
+            with self._phase("prepare"):
+                new_stored_raw_dicts = self._filter_notes(
+                    notes_to_filter_out=notes_to_be_removed, all_notes=stored_raw_dicts
+                )
+            self._save_raw_dicts(new_stored_raw_dicts)
+            self._record_count("notes", len(notes_to_be_removed))
+
+    def _buffer(self, kind: str, notes: List[Note]) -> None:
+        """Validates and prepares the notes and adds them to the buffer
+        from which they are written by flush"""
+        with self._buffer_lock:
+            stored_identifiers = self._stored_positions().keys()
+            with self._phase("validate"):
+                if kind == "add":
+                    invalid_identifiers = _duplicated_identifiers(notes) + [
+                        n.identifier
+                        for n in notes
+                        if n.identifier in stored_identifiers
+                        or n.identifier in self._buffered_identifiers
+                    ]
+                    if invalid_identifiers:
+                        raise Exception(
+                            "The identifiers of the following notes already exist"
+                            + " in the store or occur multiple times:"
+                            + f" {invalid_identifiers}. No notes were added."
+                        )
+                else:
+                    assert all(
+                        n.identifier in stored_identifiers
+                        or n.identifier in self._buffered_identifiers
+                        for n in notes
+                    ), (
+                        "Some of the notes do not yet exist in the store."
+                        + " Add them with the .add method. Nothing was updated."
+                    )
+                    assert not _duplicated_identifiers(notes), (
+                        "Some of the notes occur multiple times in the passed in"
+                        + " notes. Nothing was updated."
+                    )
+            with self._phase("prepare"):
+                memo = {}  # type: dict
+                buffered_at = time.perf_counter()
+                records = [
+                    (kind, dict(_prepare_note_for_storing(note, memo)), buffered_at)
+                    for note in notes
+                ]
+            with self._phase("serialize"):
+                # Notes which can not be serialized raise here instead of
+                # preventing all other buffered notes from being written
+                for _, raw_dict, _ in records:
+                    json.dumps(raw_dict, cls=DatetimeJSONEncoder)
+            self._buffered_records += records
+            if kind == "add":
+                self._buffered_identifiers.update(n.identifier for n in notes)
+            if len(self._buffered_records) >= self.max_buffered_notes:
+                self._flush_event.set()
+        self._start_flush_thread()
+
+    def flush(self) -> None:
+        """Writes all buffered notes to the json file with a single write. This is
+        done automatically by a background thread if the store was created with
+        buffered=True, but can also be called explicitly to make sure that all
+        notes are written.
+
+        Notes which can not be written, e.g. because another store removed
+        them in the meantime, are moved to failed_notes and an exception
+        is raised after all other notes were written. If writing the file
+        fails, all notes of the batch are moved to failed_notes. Failed notes
+        are not written again, but can be passed to add or update once the
+        problem is resolved.
+
+        Returns
+        -------
+        None
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                records = self._buffered_records
+                self._buffered_records = []
+            if not records:
+                return
+            failed_records = records
+            try:
+                failed_records = self._write_buffered(records)
+            finally:
+                with self._buffer_lock:
+                    self._buffered_identifiers.difference_update(
+                        raw_dict[Note._identifier_key]
+                        for kind, raw_dict, _ in records
+                        if kind == "add"
+                    )
+                    self.failed_notes += [
+                        Note(content=raw_dict) for _, raw_dict, _ in failed_records
+                    ]
+            if failed_records:
+                raise Exception(
+                    "The following notes were added or removed by another store"
+                    + " since they were buffered and can therefore not be written:"
+                    + f" {[n[Note._identifier_key] for _, n, _ in failed_records]}."
+                    + " They were moved to failed_notes."
+                )
+
+    def _flush_buffered(self) -> None:
+        """Writes the buffered notes before the store is read. Errors are
+        reported as a warning as they do not concern the read itself"""
+        if self._buffered_records:
+            try:
+                self.flush()
+            except Exception as e:
+                self._warn_flush_failed(e)
+
+    def _warn_flush_failed(self, error: Exception) -> None:
+        warnings.warn(
+            f"Buffered notes could not be written to {self.path}: {error}",
+            RuntimeWarning,
+        )
+
+    def _write_buffered(
+        self, records: List[Tuple[str, dict, float]]
+    ) -> List[Tuple[str, dict, float]]:
+        """Writes all valid records and returns the ones which can not be written
+        because their notes were added or removed by another store"""
+        with self._operation("flush"), self._locked(self._lock):
+            # Time which the oldest note waited until it was written and the
+            # number of notes which were buffered
+            self._record_duration("queue", time.perf_counter() - records[0][2])
+            self._record_sample("queue_depth", len(records))
+            cache = self._load_positioned_cache()
+            stored_raw_dicts = cache.raw_dicts
+            stored_identifiers = cache.positions.keys()
+            new_raw_dicts = {}  # type: Dict[str, dict]
+            failed_records = []
+            with self._phase("validate"):
+                for record in records:
+                    kind, raw_dict, _ = record
+                    identifier = raw_dict[Note._identifier_key]
+                    exists = (
+                        identifier in stored_identifiers or identifier in new_raw_dicts
+                    )
+                    if exists != (kind == "update"):
+                        failed_records.append(record)
+                    else:
+                        new_raw_dicts[identifier] = raw_dict
+            if not new_raw_dicts:
+                return failed_records
+            self._save_raw_dicts(
+                self._filter_notes(
+                    notes_to_filter_out=list(new_raw_dicts.values()),
+                    all_notes=stored_raw_dicts,
+                )
+                + list(new_raw_dicts.values())
+            )
+            # Number of notes which were buffered
+            self._record_count("notes", len(records))
+        return failed_records
+
+    def _start_flush_thread(self) -> None:
+        with self._flush_lock:
+            if self._flush_thread is None or not self._flush_thread.is_alive():
+                self._closed = False
+                self._flush_thread = threading.Thread(
+                    target=self._flush_periodically,
+                    name=f"hypernotes-flush-{self.path.name}",
+                    daemon=True,
+                )
+                self._flush_thread.start()
+        _buffered_stores.add(self)
+
+    def _flush_periodically(self) -> None:
+        while not self._closed:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self._warn_flush_failed(e)
+
+    def close(self) -> None:
+        """Stops the background thread of a buffered store and writes all
+        buffered notes. The store can still be used afterwards.
+
+        Returns
+        -------
+        None
+        """
+        with self._flush_lock:
+            thread = self._flush_thread
+            self._closed = True
+            self._flush_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+        _buffered_stores.discard(self)
+
+    def __enter__(self) -> "Store":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _notes_are_subset(
+        self, notes_subset: Sequence[dict], all_identifiers: AbstractSet[str]
+    ) -> bool:
+        """Returns true if the identifiers of all notes in note_subset
+        are in all_identifiers, else False"""
+        return self._get_identifers_of_notes(notes_subset) <= all_identifiers
+
+    def _get_identifers_of_notes(self, notes: Sequence[dict]) -> Set[str]:
+        return {n[Note._identifier_key] for n in notes}
+
+    def _filter_notes(
+        self, notes_to_filter_out: Sequence[dict], all_notes: Sequence[_D]
+    ) -> List[_D]:
+        notes_to_filter_out_identifiers = self._get_identifers_of_notes(
+            notes_to_filter_out
+        )
+        return [
+            note
+            for note in all_notes
+            if note[Note._identifier_key] not in notes_to_filter_out_identifiers
+        ]
+
+    def _save_notes(self, notes: List[Note]) -> None:
+        self._save_raw_dicts([_copy_raw(note) for note in notes])
+
+    def _save_raw_dicts(self, raw_dicts: List[dict]) -> None:
+        """Writes raw_dicts to the json file and uses them as the new content
+        of the cache. They must therefore not be referenced anywhere else
+        where they could be modified.
+        """
+        with self._phase("sort"):
+            raw_dicts = _sort_notes(raw_dicts)
+        with self._phase("serialize"):
+            if self.index:
+                # Same content as json.dumps of the whole list, but the offset
+                # of each note is known
+                serialized_notes = [
+                    json.dumps(d, cls=DatetimeJSONEncoder) for d in raw_dicts
+                ]
+                json_str = "[" + ", ".join(serialized_notes) + "]"
+            else:
+                json_str = json.dumps(raw_dicts, cls=DatetimeJSONEncoder)
+        with self._phase("write"):
+            _replace_file_content(self.path, json_str, compression=self.compression)
+        cache_key = self._update_cache(raw_dicts, _file_identity(self.path)).key
+        if self.compression is None:
+            # Non-ascii characters are escaped and therefore each character
+            # is one byte
+            self._record_count("bytes_written", len(json_str))
+        elif cache_key is not None:
+            self._record_count("bytes_written", cache_key[2])
+        if self.index:
+            with self._phase("index"):
+                self._write_index(raw_dicts, serialized_notes, cache_key)
+        if self.metric_indexes:
+            with self._phase("metric_index"):
+                self._write_metric_indexes(raw_dicts, cache_key)
+        if self.columnar:
+            with self._phase("columns"):
+                _write_columns(self._columns_path, raw_dicts, stamp=cache_key)
+
+    def _write_index(
+        self,
+        raw_dicts: List[dict],
+        serialized_notes: List[str],
+        stamp: Optional[Tuple[int, int, int]],
+    ) -> None:
+        """Writes the byte offset and length of each note in the json file,
+        which consists of "[", the serialized notes separated by ", ", and "]"
+        """
+        offsets = {}  # type: Dict[str, List[int]]
+        offset = 1
+        for raw_dict, serialized_note in zip(raw_dicts, serialized_notes):
+            offsets[raw_dict[Note._identifier_key]] = [offset, len(serialized_note)]
+            offset += len(serialized_note) + 2
+        _replace_file_content(
+            self._index_path,
+            json.dumps({"stamp": stamp, "offsets": offsets}),
+        )
+        self._cached_index = offsets
+        self._cached_index_stamp = stamp
+
+    def load_columns(
+        self, columns: Optional[Sequence[str]] = None, return_dataframe: bool = False
+    ):
+        """Loads the numeric values of all notes as numpy arrays, one per flattened
+        key (e.g. "metrics.auc"), with the most recent note first. Notes which do not
+        have a key get NaN as value. A key is only considered numeric if all notes
+        have either a number (int or float, but not bool) or None as value for it
+        and at least one note has a number.
+        This requires the numpy package to be installed.
+
+        If the store was created with columnar=True, the arrays are memory-mapped
+        from the columnar files of the store and the json file is not read,
+        unless the columnar files are outdated and need to be written again.
+
+        Parameters
+        ----------
+        columns : Optional[Sequence[str]], optional (default=None)
+            Keys of the columns which are loaded. A key also selects all nested
+            keys, e.g. "metrics" selects "metrics.auc" and "metrics.recall".
+            If None, all numeric columns are loaded.
+        return_dataframe : bool, optional (default=False)
+            If True, a pandas dataframe is returned. This requires the pandas package
+            to be installed.
+
+        Returns
+        -------
+        Either Dict[str, np.ndarray] or pd.DataFrame, depending on value of
+        return_dataframe. The identifiers of the notes are always included
+        in the column "identifier".
+        """
+        self._flush_buffered()
+        with self._operation("load_columns"):
+            arrays = self._load_columns()
+            self._record_count("notes", len(arrays[Note._identifier_key]))
+        if columns is not None:
+            arrays = {
+                k: v
+                for k, v in arrays.items()
+                if k == Note._identifier_key or _matches_any(k, columns)
+            }
+        if return_dataframe:
+            try:
+                import pandas as pd  # type: ignore
+            except ImportError:
+                raise ImportError(
+                    "Pandas is not installed. You can install it via:\n"
+                    "conda install pandas\n"
+                    "or: pip install pandas"
+                )
+            return pd.DataFrame(arrays)
+        return arrays
+
+    def _load_columns(self) -> Dict[str, Any]:
+        if self.columnar:
+            with self._phase("read"):
+                arrays = _read_columns(self._columns_path, _file_identity(self.path))
+            if arrays is None:
+                with self._locked(self._lock):
+                    cache = self._load_cache()
+                    with self._phase("columns"):
+                        _write_columns(
+                            self._columns_path, cache.raw_dicts, stamp=cache.key
+                        )
+                    arrays = _read_columns(self._columns_path, cache.key)
+        else:
+            arrays = None
+        if arrays is None:
+            raw_dicts = self._load_raw_dicts()
+            with self._phase("columns"):
+                arrays = _columns_to_numpy(*_numeric_columns(raw_dicts))
+        return arrays
+
+    def _sort_notes(self, notes: List[Note]) -> List[Note]:
+        return _sort_notes(notes)
+
+    @staticmethod
+    def _json_iter(path: Path) -> Iterator[dict]:
+        with _open_for_reading(path) as f:
+            yield from _iter_json_array(f, object_hook=_deserialize_datetime)
+
+    def __repr__(self) -> str:
+        return f"Store('{self.path}')"
+
+
+# Buffered stores with a running flush thread, which are closed at interpreter
+# shutdown so that no buffered notes are lost
+_buffered_stores = set()  # type: Set[Store]
+
+
+@atexit.register
+def _close_buffered_stores() -> None:
+    for store in list(_buffered_stores):
+        try:
+            store.close()
+        except Exception as e:
+            store._warn_flush_failed(e)
+
+
+class JsonLinesStore(BaseStore):
+    """Stores Note instances in a JSON Lines file, i.e. one json object per line.
+
+    In contrast to Store, adding a note does not rewrite the whole file but only
+    appends a single line to it. Updates append the new version of a note and
+    removals append a tombstone record. Both are resolved when loading the store
+    and can be removed permanently from the file with the compact method.
+    """
+
+    atomic_add_many = True
+
+    _tombstone_key = "_removed"
+
+    def __init__(
+        self, path: Union[str, Path], stats: Optional[StoreStats] = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        path : Union[str, Path]
+            Path to the json lines file. If it does not yet exist, a new one will be
+            created, else, the store will interact with the existing file
+        stats : Optional[StoreStats], optional (default=None)
+            If passed, the durations of all operations and their phases as well as
+            the number of processed notes are recorded in it
+        """
+        super().__init__(stats=stats)
+        self.path = _convert_to_path(path)
+        self._lock = _FileLock(_lock_path(self.path))
+        if not self.path.exists():
+            self.path.touch()
+        # Identifiers of all notes in the store. Kept up to date by only parsing
+        # the lines which were appended since the last time it was refreshed
+        self._identifiers = set()  # type: Set[str]
+        self._indexed_inode = None  # type: Optional[int]
+        self._indexed_offset = 0
+
+    def load(self, return_dataframe: bool = False, lazy: bool = False):
+        """Loads the entire store and returns it as a list of Note instances
+        with the most recent note first. Optionally, a pandas dataframe can be
+        returned instead.
+
+        Parameters
+        ----------
+        return_dataframe : bool, optional (default=False)
+            If True, a pandas dataframe is returned with one row per note,
+            see Store.load for details. This requires the pandas package
+            to be installed.
+        lazy : bool, optional (default=False)
+            If True, a LazyNotes sequence is returned, which only creates the notes
+            when they are accessed
+
+        Returns
+        -------
+        Either List[Note], LazyNotes, or pd.DataFrame, depending on value of
+        return_dataframe and lazy
+        """
+        with self._operation("load"):
+            raw_dicts = {}  # type: Dict[str, dict]
+            with self._phase("read"), self.path.open("rb") as f:
+                for record in self._read_records(f):
+                    self._apply_record(record, raw_dicts)
+                self._record_count("bytes_read", f.tell())
+            with self._phase("sort"):
+                sorted_raw_dicts = _sort_notes(list(raw_dicts.values()))
+            self._record_count("notes", len(sorted_raw_dicts))
+            if return_dataframe:
+                with self._phase("dataframe"):
+                    return _to_pandas(sorted_raw_dicts)
+            elif lazy:
+                return LazyNotes(sorted_raw_dicts, _to_note)
+            return _raw_dicts_to_notes(sorted_raw_dicts)
+
+    def add(self, note: Note) -> None:
+        """Appends the given note to the store.
+
+        Before storing the note, the .end method of it is called, if
+        not already done previously.
+
+        Parameters
+        ----------
+        note : Note
+            The Note instance which should be added to the store. The note
+            needs to consist entirely of json serializable objects or
+            datetime.datetime instances
+
+        Returns
+        -------
+        None
+        """
+        with self._operation("add"):
+            self.add_many([note])
+            self._record_count("notes", 1)
+
+    def add_many(self, notes: Sequence[Note]) -> None:
+        """Appends all given notes to the store with a single write. Either all
+        notes are added or, if one of them can not be added, none.
+
+        Parameters
+        ----------
+        notes : Sequence[Note]
+            The Note instances which should be added to the store
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_added = list(notes)
+        with self._operation("add_many"), self._locked(self._lock):
+            self._refresh_identifiers()
+            with self._phase("validate"):
+                invalid_identifiers = _duplicated_identifiers(
+                    notes_to_be_added, existing_identifiers=self._identifiers
+                )
+            if invalid_identifiers:
+                raise Exception(
+                    "The identifiers of the following notes already exist in the"
+                    + f" store or occur multiple times: {invalid_identifiers}."
+                    + " No notes were added."
+                )
+            with self._phase("prepare"):
+                memo = {}  # type: dict
+                records = [
+                    dict(_prepare_note_for_storing(n, memo)) for n in notes_to_be_added
+                ]
+            self._append_records(records)
+            self._record_count("notes", len(records))
+
+    def update(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Appends a new version of the passed in notes to the store, which
+        replaces the previous one when the store is loaded
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(notes, Note):
+            notes = [notes]
+        with self._operation("update"):
+            self.update_many(notes)
+            self._record_count("notes", len(notes))
+
+    def update_many(self, notes: Sequence[Note]) -> None:
+        """Appends a new version of all passed in notes to the store with a single
+        write. Either all notes are updated or, if one of them can not be
+        updated, none.
+
+        Parameters
+        ----------
+        notes: Sequence[Note]
+            The notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_updated = list(notes)
+        with self._operation("update_many"), self._locked(self._lock):
+            self._refresh_identifiers()
+            assert all(
+                n.identifier in self._identifiers for n in notes_to_be_updated
+            ), (
+                "Some of the notes do not yet exist in the store."
+                + " Add them with the .add method. Nothing was updated."
+            )
+            with self._phase("prepare"):
+                memo = {}  # type: dict
+                records = [
+                    dict(_prepare_note_for_storing(n, memo))
+                    for n in notes_to_be_updated
+                ]
+            self._append_records(records)
+            self._record_count("notes", len(records))
+
+    def remove(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Appends a tombstone record for each of the passed in notes, which
+        removes them from the store
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be removed
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_removed = [notes] if isinstance(notes, Note) else list(notes)
+        with self._operation("remove"), self._locked(self._lock):
+            self._refresh_identifiers()
+            assert all(
+                n.identifier in self._identifiers for n in notes_to_be_removed
+            ), (
+                "Some of the notes do not yet exist in the store."
+                + " Nothing was removed. Only pass in notes which already"
+                + " exist in the store."
+            )
+            self._append_records(
+                [{self._tombstone_key: n.identifier} for n in notes_to_be_removed]
+            )
+            self._record_count("notes", len(notes_to_be_removed))
+
+    def compact(self) -> None:
+        """Rewrites the file so that it only contains the latest version of each
+        note, i.e. without any outdated versions of updated notes or tombstones.
+        The notes are written with the oldest one first so that new notes can
+        again simply be appended.
+        """
+        with self._operation("compact"), self._locked(self._lock):
+            notes = self.load()
+            with self._phase("serialize"):
+                content = "".join(
+                    self._dump_record(dict(note)) for note in reversed(notes)
+                )
+            with self._phase("write"):
+                _replace_file_content(self.path, content)
+            self._record_count("bytes_written", len(content))
+
+    def _fingerprint(self) -> Optional[Hashable]:
+        return _file_identity(self.path)
+
+    def _refresh_identifiers(self) -> None:
+        stat = self.path.stat()
+        if stat.st_ino != self._indexed_inode or stat.st_size < self._indexed_offset:
+            # File was replaced, e.g. by compact, and needs to be read again
+            self._identifiers = set()
+            self._indexed_inode = stat.st_ino
+            self._indexed_offset = 0
+        if stat.st_size == self._indexed_offset:
+            return
+        with self._phase("read"), self.path.open("rb") as f:
+            f.seek(self._indexed_offset)
+            for record in self._read_records(f):
+                if self._tombstone_key in record:
+                    self._identifiers.discard(record[self._tombstone_key])
+                else:
+                    self._identifiers.add(record[Note._identifier_key])
+            self._record_count("bytes_read", f.tell() - self._indexed_offset)
+            self._indexed_offset = f.tell()
+
+    def _read_records(self, f: BinaryIO) -> Iterator[dict]:
+        """Yields all complete records from the current position of f onwards.
+        An incomplete last line is not yet fully written by another process
+        and is therefore ignored and f is positioned at its start.
+        """
+        while True:
+            line_start = f.tell()
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                f.seek(line_start)
+                return
+            if line.strip():
+                yield json.loads(line, object_hook=_deserialize_datetime)
+
+    def _apply_record(self, record: dict, raw_dicts: Dict[str, dict]) -> None:
+        if self._tombstone_key in record:
+            raw_dicts.pop(record[self._tombstone_key], None)
+        else:
+            raw_dicts[record[Note._identifier_key]] = record
+
+    def _append_records(self, records: List[dict]) -> None:
+        # Encode all records before opening the file so that nothing is written
+        # if one of them is not json serializable
+        with self._phase("serialize"):
+            content = "".join(self._dump_record(record) for record in records)
+        with self._phase("write"), self.path.open("a", encoding="utf-8") as f:
+            f.write(content)
+        self._record_count("bytes_written", len(content))
+
+    @staticmethod
+    def _dump_record(record: dict) -> str:
+        return json.dumps(record, cls=DatetimeJSONEncoder) + "\n"
+
+    def __repr__(self) -> str:
+        return f"JsonLinesStore('{self.path}')"
+
+
+class SqliteStore(BaseStore):
+    """Stores Note instances in a SQLite database with one row per note.
+
+    The identifier, start and end datetime, model, and text of a note are stored
+    in separate, indexed columns and the whole note is stored as json in an
+    additional column. Adding, updating, or removing notes therefore only
+    modifies the affected rows instead of rewriting the whole store.
+    Only the sqlite3 module of the Python standard library is required.
+    """
+
+    atomic_add_many = True
+
+    _table_name = "notes"
+    _content_column = "content"
+    _indexed_keys = (
+        Note._identifier_key,
+        Note._start_datetime_key,
+        Note._end_datetime_key,
+        Note._model_key,
+        Note._text_key,
+    )
+
+    def __init__(
+        self, path: Union[str, Path], stats: Optional[StoreStats] = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        path : Union[str, Path]
+            Path to the SQLite database file. If it does not yet exist, a new one
+            will be created, else, the store will interact with the existing file
+        stats : Optional[StoreStats], optional (default=None)
+            If passed, the durations of all operations and their phases as well as
+            the number of processed notes are recorded in it
+        """
+        super().__init__(stats=stats)
+        self.path = _convert_to_path(path)
+        self._create_table_if_not_exists()
+
+    def _fingerprint(self) -> Optional[Hashable]:
+        # Changes might only be written to the write-ahead log if it is enabled
+        wal_path = self.path.with_name(self.path.name + "-wal")
+        return (_file_identity(self.path), _file_identity(wal_path))
+
+    def _connect(self) -> sqlite3.Connection:
+        # Other processes might hold a write lock on the database, e.g. if they
+        # add notes at the same time, and so the timeout is set generously
+        return sqlite3.connect(str(self.path), timeout=60)
+
+    def _create_table_if_not_exists(self) -> None:
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table_name} ("
+                + f"{Note._identifier_key} TEXT PRIMARY KEY, "
+                + f"{Note._start_datetime_key} TEXT, "
+                + f"{Note._end_datetime_key} TEXT, "
+                + f"{Note._model_key} TEXT, "
+                + f"{Note._text_key} TEXT, "
+                + f"{self._content_column} TEXT NOT NULL)"
+            )
+            for key in self._indexed_keys[1:]:
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self._table_name}_{key}"
+                    + f" ON {self._table_name} ({key})"
+                )
+            # Matches the order in which notes are loaded, see _sort_notes
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._table_name}_order"
+                + f" ON {self._table_name}"
+                + f" ({Note._end_datetime_key}, {Note._identifier_key})"
+            )
+
+    def load(self, return_dataframe: bool = False, lazy: bool = False):
+        """Loads all notes of the store and returns them as a list of Note instances
+        with the most recent note first. Optionally, a pandas dataframe can be
+        returned instead.
+
+        Parameters
+        ----------
+        return_dataframe : bool, optional (default=False)
+            If True, a pandas dataframe is returned with one row per note,
+            see Store.load for details. This requires the pandas package
+            to be installed.
+        lazy : bool, optional (default=False)
+            If True, a LazyNotes sequence is returned, which only decodes the
+            notes when they are accessed
+
+        Returns
+        -------
+        Either List[Note], LazyNotes, or pd.DataFrame, depending on value of
+        return_dataframe and lazy
+        """
+        with self._operation("load"):
+            if lazy and not return_dataframe:
+                with self._phase("read"):
+                    encoded_notes = list(self._iter_encoded_notes())
+                self._record_count("notes", len(encoded_notes))
+                return LazyNotes(encoded_notes, _decode_note)
+            with self._phase("read"):
+                raw_dicts = list(self._iter_raw_dicts())
+            self._record_count("notes", len(raw_dicts))
+            if return_dataframe:
+                with self._phase("dataframe"):
+                    return _to_pandas(raw_dicts)
+            return [Note(content=raw_dict) for raw_dict in raw_dicts]
+
+    def _iter_raw_dicts(self) -> Iterator[dict]:
+        for content in self._iter_encoded_notes():
+            yield json.loads(content, object_hook=_deserialize_datetime)
+
+    def _iter_encoded_notes(self) -> Iterator[str]:
+        statement, parameters = self._select_statement({})
+        with closing(self._connect()) as connection:
+            for (content,) in connection.execute(statement, parameters):
+                yield content
+
+    def add(self, note: Note) -> None:
+        """Adds the given note to the store.
+
+        Before storing the note, the .end method of it is called, if
+        not already done previously.
+
+        Parameters
+        ----------
+        note : Note
+            The Note instance which should be added to the store. The note
+            needs to consist entirely of json serializable objects or
+            datetime.datetime instances
+
+        Returns
+        -------
+        None
+        """
+        with self._operation("add"):
+            self.add_many([note])
+            self._record_count("notes", 1)
+
+    def add_many(self, notes: Sequence[Note]) -> None:
+        """Adds all given notes to the store in a single transaction. Either all
+        notes are added or, if one of them can not be added, none.
+
+        Parameters
+        ----------
+        notes : Sequence[Note]
+            The Note instances which should be added to the store
+
+        Returns
+        -------
+        None
+        """
+        with self._operation("add_many"):
+            rows = self._notes_to_rows(notes)
+            with self._phase("write"):
+                self._insert_rows(rows)
+            self._record_count("notes", len(rows))
+
+    def _insert_rows(self, rows: List[Tuple[Any, ...]]) -> None:
+        placeholders = ", ".join("?" * (len(self._indexed_keys) + 1))
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    f"INSERT INTO {self._table_name}"
+                    + f" ({', '.join(self._indexed_keys)}, {self._content_column})"
+                    + f" VALUES ({placeholders})",
+                    rows,
+                )
+        except sqlite3.IntegrityError:
+            raise Exception(
+                "The identifiers of some of the notes already exist in the store"
+                + " or occur multiple times. No notes were added."
+            )
+
+    def update(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Updates the passed in notes in the store
+
+        Uses the identifier attribute of the notes to find the original ones
+        and replaces them
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(notes, Note):
+            notes = [notes]
+        with self._operation("update"):
+            self.update_many(notes)
+            self._record_count("notes", len(notes))
+
+    def update_many(self, notes: Sequence[Note]) -> None:
+        """Updates all passed in notes in a single transaction. Either all notes
+        are updated or, if one of them can not be updated, none.
+
+        Parameters
+        ----------
+        notes: Sequence[Note]
+            The notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        with self._operation("update_many"):
+            rows = self._notes_to_rows(notes)
+            with self._phase("write"):
+                self._update_rows(rows)
+            self._record_count("notes", len(rows))
+
+    def _update_rows(self, rows: List[Tuple[Any, ...]]) -> None:
+        assignments = ", ".join(
+            f"{column} = ?"
+            for column in self._indexed_keys[1:] + (self._content_column,)
+        )
+        with closing(self._connect()) as connection, connection:
+            n_updated = 0
+            for row in rows:
+                n_updated += connection.execute(
+                    f"UPDATE {self._table_name} SET {assignments}"
+                    + f" WHERE {Note._identifier_key} = ?",
+                    row[1:] + row[:1],
+                ).rowcount
+            # Raising inside of the with statement rolls back the transaction
+            assert n_updated == len(rows), (
+                "Some of the notes do not yet exist in the store."
+                + " Add them with the .add method. Nothing was updated."
+            )
+
+    def remove(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Removes passed in notes from store
+
+        Uses the identifier attribute of the notes to find the original ones
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be removed
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(notes, Note):
+            notes = [notes]
+        identifiers = {note.identifier for note in notes}
+        with self._operation("remove"):
+            with self._phase("write"):
+                self._delete_rows(identifiers)
+            self._record_count("notes", len(identifiers))
+
+    def _delete_rows(self, identifiers: Set[str]) -> None:
+        with closing(self._connect()) as connection, connection:
+            n_removed = 0
+            for identifier in identifiers:
+                n_removed += connection.execute(
+                    f"DELETE FROM {self._table_name}"
+                    + f" WHERE {Note._identifier_key} = ?",
+                    (identifier,),
+                ).rowcount
+            assert n_removed == len(identifiers), (
+                "Some of the notes do not yet exist in the store."
+                + " Nothing was removed. Only pass in notes which already"
+                + " exist in the store."
+            )
+
+    def query(
+        self,
+        where: Optional[_Where] = None,
+        columns: Optional[Sequence[str]] = None,
+        order_by: Optional[str] = None,
+        ascending: bool = True,
+        limit: Optional[int] = None,
+    ) -> Union[List[Note], List[Dict[str, Any]]]:
+        """Same as BaseStore.query, but conditions on and sorting by the indexed
+        columns (identifier, start_datetime, end_datetime, model, and text) are
+        evaluated by SQLite. If the whole query can be evaluated by SQLite, this
+        also applies to the limit. Conditions can only be evaluated by SQLite if
+        they are passed as a dictionary.
+        """
+        sql_conditions = {}  # type: Dict[str, Any]
+        if isinstance(where, dict):
+            sql_conditions = {k: v for k, v in where.items() if k in self._indexed_keys}
+            where = {k: v for k, v in where.items() if k not in sql_conditions} or None
+        sql_order_by = order_by if order_by in self._indexed_keys else None
+        query_in_sql = where is None and order_by == sql_order_by
+        statement, parameters = self._select_statement(
+            sql_conditions,
+            order_by=sql_order_by,
+            ascending=ascending,
+            limit=limit if query_in_sql else None,
+        )
+        with self._operation("query"), closing(self._connect()) as connection:
+            # Rows are decoded lazily so that the search can stop early
+            raw_dicts = (
+                json.loads(content, object_hook=_deserialize_datetime)
+                for (content,) in connection.execute(statement, parameters)
+            )
+            results = _query_raw_dicts(
+                raw_dicts,
+                where=where,
+                columns=columns,
+                order_by=None if sql_order_by is not None else order_by,
+                ascending=ascending,
+                limit=limit,
+            )
+            self._record_count("notes", len(results))
+            return results
+
+    def _select_statement(
+        self,
+        conditions: Dict[str, Any],
+        order_by: Optional[str] = None,
+        ascending: bool = True,
+        limit: Optional[int] = None,
+    ) -> Tuple[str, List[Any]]:
+        statement = f"SELECT {self._content_column} FROM {self._table_name}"
+        parameters = []  # type: List[Any]
+        if conditions:
+            # IS instead of = so that conditions on None match NULL values
+            statement += " WHERE " + " AND ".join(f"{k} IS ?" for k in conditions)
+            parameters.extend(_to_sql_value(v) for v in conditions.values())
+        # Same order as _sort_notes, optionally preceded by order_by
+        # where NULL values are always sorted last
+        ordering = [
+            f"{Note._end_datetime_key} DESC",
+            f"{Note._identifier_key} DESC",
+        ]
+        if order_by is not None:
+            direction = "ASC" if ascending else "DESC"
+            ordering = [f"{order_by} IS NULL", f"{order_by} {direction}"] + ordering
+        statement += " ORDER BY " + ", ".join(ordering)
+        if limit is not None:
+            statement += " LIMIT ?"
+            parameters.append(limit)
+        return statement, parameters
+
+    def _notes_to_rows(self, notes: Sequence[Note]) -> List[Tuple[Any, ...]]:
+        with self._phase("prepare"):
+            memo = {}  # type: dict
+            prepared_notes = [_prepare_note_for_storing(n, memo) for n in notes]
+        with self._phase("serialize"):
+            return [self._note_to_row(note) for note in prepared_notes]
+
+    def _note_to_row(self, note: Note) -> Tuple[Any, ...]:
+        content = json.dumps(dict(note), cls=DatetimeJSONEncoder)
+        return tuple(_to_sql_value(note.get(key)) for key in self._indexed_keys) + (
+            content,
+        )
+
+    def __repr__(self) -> str:
+        return f"SqliteStore('{self.path}')"
+
+
+class ShardedStore(BaseStore):
+    """Stores Note instances in a directory with one json file per shard and
+    a manifest, which maps the identifier of each note to its shard.
+
+    Notes are assigned to a shard when they are added, either by the month of
+    their end datetime (e.g. "2019-05.json") or by filling up numbered shards
+    with a fixed number of notes. Updating or removing notes therefore only
+    rewrites the shards which contain them instead of all notes. Each file is
+    replaced atomically. Changes of multiple shards are only applied once all
+    of them were written to temporary files, but are not atomic as a whole.
+    """
+
+    _manifest_name = "manifest.json"
+    _shard_suffix = ".json"
+    _shard_by_options = ("month", "count")
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        shard_by: str = "month",
+        notes_per_shard: int = 10000,
+        stats: Optional[StoreStats] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        path : Union[str, Path]
+            Path to the directory of the store. If it does not yet exist, a new one
+            will be created, else, the store will interact with the existing one
+        shard_by : str, optional (default="month")
+            Either "month", to assign notes to shards by the month of their end
+            datetime, or "count", to add notes to the newest shard until it
+            contains notes_per_shard notes. Existing stores keep the settings
+            with which they were created
+        notes_per_shard : int, optional (default=10000)
+            Maximum number of notes per shard if shard_by="count"
+        stats : Optional[StoreStats], optional (default=None)
+            If passed, the durations of all operations and their phases as well as
+            the number of processed notes are recorded in it
+        """
+        if shard_by not in self._shard_by_options:
+            raise ValueError(
+                f"shard_by needs to be one of {self._shard_by_options},"
+                + f" not {shard_by!r}"
+            )
+        super().__init__(stats=stats)
+        self.path = _convert_to_path(path)
+        self._manifest_path = self.path / self._manifest_name
+        # Manifest and shards are cached in the same way as in Store and must
+        # therefore not be modified, except by _modify_manifest
+        self._manifest = {}  # type: dict
+        self._manifest_key = None  # type: Optional[Tuple[int, int, int]]
+        self._shard_cache = (
+            {}
+        )  # type: Dict[str, Tuple[Optional[Tuple[int, int, int]], List[dict]]]
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = _FileLock(_lock_path(self.path))
+        with self._lock:
+            if not self._manifest_path.exists():
+                self._write_manifest(
+                    {
+                        "shard_by": shard_by,
+                        "notes_per_shard": notes_per_shard,
+                        "shards": {},
+                        "identifiers": {},
+                    }
+                )
+        manifest = self._read_manifest()
+        self.shard_by = manifest["shard_by"]  # type: str
+        self.notes_per_shard = manifest["notes_per_shard"]  # type: int
+
+    def load(self, return_dataframe: bool = False, lazy: bool = False):
+        """Loads all shards and returns their notes as a list of Note instances
+        with the most recent note first. Optionally, a pandas dataframe can be
+        returned instead.
+
+        Parameters
+        ----------
+        return_dataframe : bool, optional (default=False)
+            If True, a pandas dataframe is returned with one row per note,
+            see Store.load for details. This requires the pandas package
+            to be installed.
+        lazy : bool, optional (default=False)
+            If True, a LazyNotes sequence is returned, which only creates the notes
+            when they are accessed
+
+        Returns
+        -------
+        Either List[Note], LazyNotes, or pd.DataFrame, depending on value of
+        return_dataframe and lazy
+        """
+        with self._operation("load"):
+            raw_dicts = list(self._iter_raw_dicts())
+            self._record_count("notes", len(raw_dicts))
+            if return_dataframe:
+                with self._phase("dataframe"):
+                    return _to_pandas(raw_dicts)
+            elif lazy:
+                return LazyNotes(raw_dicts, _copy_to_note)
+            with self._phase("copy"):
+                return [Note(content=_copy_raw(d)) for d in raw_dicts]
+
+    def _iter_raw_dicts(self) -> Iterator[dict]:
+        shards = [self._read_shard(name) for name in self._read_manifest()["shards"]]
+        # Each shard is already sorted and therefore they only need to be merged
+        return heapq.merge(*shards, key=_note_order_key, reverse=True)
+
+    def _fingerprint(self) -> Optional[Hashable]:
+        # Updates only change the affected shards but not the manifest
+        shard_identities = tuple(
+            _file_identity(self._shard_path(name))
+            for name in self._read_manifest()["shards"]
+        )
+        return (_file_identity(self._manifest_path),) + shard_identities
+
+    def add(self, note: Note) -> None:
+        """Adds the given note to its shard.
+
+        Before storing the note, the .end method of it is called, if
+        not already done previously.
+
+        Parameters
+        ----------
+        note : Note
+            The Note instance which should be added to the store. The note
+            needs to consist entirely of json serializable objects or
+            datetime.datetime instances
+
+        Returns
+        -------
+        None
+        """
+        with self._operation("add"):
+            self.add_many([note])
+            self._record_count("notes", 1)
+
+    def add_many(self, notes: Sequence[Note]) -> None:
+        """Adds all given notes to their shards. If one of the notes can not be
+        added because its identifier already exists, none of them are added.
+
+        Parameters
+        ----------
+        notes : Sequence[Note]
+            The Note instances which should be added to the store
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_added = list(notes)
+        with self._operation("add_many"), self._locked(self._lock):
+            with self._modify_manifest() as manifest:
+                identifiers = manifest["identifiers"]
+                with self._phase("validate"):
+                    invalid_identifiers = _duplicated_identifiers(
+                        notes_to_be_added, existing_identifiers=identifiers.keys()
+                    )
+                if invalid_identifiers:
+                    raise Exception(
+                        "The identifiers of the following notes already exist in the"
+                        + f" store or occur multiple times: {invalid_identifiers}."
+                        + " No notes were added."
+                    )
+                with self._phase("prepare"):
+                    memo = {}  # type: dict
+                    new_raw_dicts = [
+                        dict(_prepare_note_for_storing(note, memo))
+                        for note in notes_to_be_added
+                    ]
+                shards = manifest["shards"]
+                changed_shards = {}  # type: Dict[str, List[dict]]
+                for name, raw_dicts in self._assign_shards(
+                    new_raw_dicts, shards
+                ).items():
+                    changed_shards[name] = self._read_shard(name) + raw_dicts
+                    shards[name] = shards.get(name, 0) + len(raw_dicts)
+                    for raw_dict in raw_dicts:
+                        identifiers[raw_dict[Note._identifier_key]] = name
+                self._write_shards(changed_shards)
+            self._record_count("notes", len(new_raw_dicts))
+
+    def update(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """Updates the passed in notes in the shards which contain them
+
+        Uses the identifier attribute of the notes to find the original ones
+        and replaces them
+
+        Parameters
+        ----------
+        notes: Union[Note, Sequence[Note]]
+            One or more notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(notes, Note):
+            notes = [notes]
+        with self._operation("update"):
+            self.update_many(notes)
+            self._record_count("notes", len(notes))
+
+    def update_many(self, notes: Sequence[Note]) -> None:
+        """Updates all passed in notes in the shards which contain them. Notes stay
+        in their shard, even if their end datetime changed.
+
+        Parameters
+        ----------
+        notes: Sequence[Note]
+            The notes which should be updated
+
+        Returns
+        -------
+        None
+        """
+        notes_to_be_updated = list(notes)
+        with self._operation("update_many"), self._locked(self._lock):
+            identifiers = self._read_manifest()["identifiers"]
+            with self._phase("validate"):
+                assert all(n.identifier in identifiers for n in notes_to_be_updated), (
+                    "Some of the notes do not yet exist in the store."
+                    + " Add them with the .add method. Nothing was updated."
+                )
+                assert not _duplicated_identifiers(notes_to_be_updated), (
+                    "Some of the notes occur multiple times in the passed in notes."
+                    + " Nothing was updated."
+                )
+            with self._phase("prepare"):
+                memo = {}  # type: dict
+                new_raw_dicts = [
+                    dict(_prepare_note_for_storing(note, memo))
+                    for note in notes_to_be_updated
+                ]
+            changed_shards = {}  # type: Dict[str, List[dict]]
+            for name, raw_dicts in _group_by_shard(new_raw_dicts, identifiers).items():
+                updated_identifiers = {d[Note._identifier_key] for d in raw_dicts}
+                stored_raw_dicts = [
+                    d
+                    for d in self._read_shard(name)
+                    if d[Note._identifier_key] not in updated_identifiers
+                ]
+                changed_shards[name] = stored_raw_dicts + raw_dicts
+            self._write_shards(changed_shards)
+            self._record_count("notes", len(new_raw_dicts))
 
     def remove(self, notes: Union[Note, Sequence[Note]]) -> None:
-        """Removes passed in notes from store
+        """Removes passed in notes from the shards which contain them
 
         Uses the identifier attribute of the notes to find the original ones
 
@@ -530,76 +3374,307 @@ class Store(BaseStore):
         -------
         None
         """
-        if isinstance(notes, Note):
-            notes_to_be_removed = [notes]
+        notes_to_be_removed = [notes] if isinstance(notes, Note) else list(notes)
+        with self._operation("remove"), self._locked(self._lock):
+            with self._modify_manifest() as manifest:
+                identifiers = manifest["identifiers"]
+                assert all(n.identifier in identifiers for n in notes_to_be_removed), (
+                    "Some of the notes do not yet exist in the store."
+                    + " Nothing was removed. Only pass in notes which already"
+                    + " exist in the store."
+                )
+                removed_raw_dicts = [dict(n) for n in notes_to_be_removed]
+                shards = manifest["shards"]
+                changed_shards = {}  # type: Dict[str, List[dict]]
+                for name, raw_dicts in _group_by_shard(
+                    removed_raw_dicts, identifiers
+                ).items():
+                    removed_identifiers = {d[Note._identifier_key] for d in raw_dicts}
+                    remaining_raw_dicts = [
+                        d
+                        for d in self._read_shard(name)
+                        if d[Note._identifier_key] not in removed_identifiers
+                    ]
+                    changed_shards[name] = remaining_raw_dicts
+                    for identifier in removed_identifiers:
+                        del identifiers[identifier]
+                    if remaining_raw_dicts:
+                        shards[name] = len(remaining_raw_dicts)
+                    else:
+                        del shards[name]
+                self._write_shards(changed_shards)
+            self._record_count("notes", len(notes_to_be_removed))
+
+    def _assign_shards(
+        self, raw_dicts: List[dict], shards: Dict[str, int]
+    ) -> Dict[str, List[dict]]:
+        """Returns the new notes grouped by the names of the shards
+        to which they should be added"""
+        assigned = {}  # type: Dict[str, List[dict]]
+        if self.shard_by == "month":
+            for raw_dict in raw_dicts:
+                end_datetime = raw_dict[Note._end_datetime_key]
+                name = f"{end_datetime.year:04d}-{end_datetime.month:02d}"
+                assigned.setdefault(name, []).append(raw_dict)
         else:
-            notes_to_be_removed = list(notes)
-        stored_notes = self.load()
-        assert self._notes_are_subset(
-            notes_subset=notes_to_be_removed, all_notes=stored_notes
-        ), (
-            "Some of the notes do not yet exist in the store."
-            + " Nothing was removed. Only pass in notes which already"
-            + " exist in the store."
-        )
-        new_stored_notes = self._filter_notes(
-            notes_to_filter_out=notes_to_be_removed, all_notes=stored_notes
-        )
-        self._save_notes(new_stored_notes)
+            index = max((int(name) for name in shards), default=0)
+            n_notes = shards.get(_count_shard_name(index), 0)
+            for raw_dict in raw_dicts:
+                if n_notes >= self.notes_per_shard:
+                    index += 1
+                    n_notes = 0
+                assigned.setdefault(_count_shard_name(index), []).append(raw_dict)
+                n_notes += 1
+        return assigned
 
-    def _notes_are_subset(
-        self, notes_subset: List[Note], all_notes: List[Note]
-    ) -> bool:
-        """Returns true if all notes in note_subset exist in all_notes, else False"""
-        notes_subset_identifiers = self._get_identifers_of_notes(notes_subset)
-        all_notes_identifiers = self._get_identifers_of_notes(all_notes)
-        return all(
-            identifier in all_notes_identifiers
-            for identifier in notes_subset_identifiers
-        )
+    def _shard_path(self, name: str) -> Path:
+        return self.path / (name + self._shard_suffix)
+
+    def _read_shard(self, name: str) -> List[dict]:
+        """Returns the raw dictionaries of the notes in the shard with the most
+        recent note first. They are cached and must not be modified.
+        """
+        shard_path = self._shard_path(name)
+        cache_key = _file_identity(shard_path)
+        cached = self._shard_cache.get(name)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        raw_dicts = []  # type: List[dict]
+        if cache_key is not None:
+            with self._phase("read"), shard_path.open("r", encoding="utf-8") as f:
+                raw_dicts = list(_iter_json_array(f, object_hook=_deserialize_datetime))
+            self._record_count("bytes_read", cache_key[2])
+        with self._phase("sort"):
+            raw_dicts = _sort_notes(raw_dicts)
+        self._shard_cache[name] = (cache_key, raw_dicts)
+        return raw_dicts
 
-    def _get_identifers_of_notes(self, notes: List[Note]) -> List[str]:
-        return [n.identifier for n in notes]
+    def _write_shards(self, shards: Dict[str, List[dict]]) -> None:
+        """Writes the raw dictionaries of each shard, or removes shards without
+        notes. All shards are serialized and written to temporary files before
+        the first one is replaced, so that a note which can not be serialized
+        does not leave some of the shards changed without the manifest.
+        """
+        sorted_shards = {}  # type: Dict[str, List[dict]]
+        serialized_shards = {}  # type: Dict[str, str]
+        for name, raw_dicts in shards.items():
+            if raw_dicts:
+                with self._phase("sort"):
+                    sorted_shards[name] = _sort_notes(raw_dicts)
+                with self._phase("serialize"):
+                    serialized_shards[name] = json.dumps(
+                        sorted_shards[name], cls=DatetimeJSONEncoder
+                    )
+        tmp_paths = {}  # type: Dict[str, Path]
+        try:
+            with self._phase("write"):
+                for name, json_str in serialized_shards.items():
+                    tmp_paths[name] = _write_temporary_file(
+                        self._shard_path(name), json_str
+                    )
+                for name, tmp_path in tmp_paths.items():
+                    os.replace(str(tmp_path), str(self._shard_path(name)))
+        finally:
+            for tmp_path in tmp_paths.values():
+                if tmp_path.exists():
+                    tmp_path.unlink()
+        for name, json_str in serialized_shards.items():
+            self._record_count("bytes_written", len(json_str))
+            shard_path = self._shard_path(name)
+            self._shard_cache[name] = (_file_identity(shard_path), sorted_shards[name])
+        for name, raw_dicts in shards.items():
+            if not raw_dicts:
+                shard_path = self._shard_path(name)
+                if shard_path.exists():
+                    shard_path.unlink()
+                self._shard_cache.pop(name, None)
 
-    def _filter_notes(
-        self, notes_to_filter_out: List[Note], all_notes: List[Note]
-    ) -> List[Note]:
-        notes_to_filter_out_identifiers = self._get_identifers_of_notes(
-            notes_to_filter_out
-        )
-        return [
-            note
-            for note in all_notes
-            if note.identifier not in notes_to_filter_out_identifiers
-        ]
+    def _read_manifest(self) -> dict:
+        cache_key = _file_identity(self._manifest_path)
+        if cache_key != self._manifest_key:
+            with self._manifest_path.open("r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            self._manifest_key = cache_key
+        return self._manifest
 
-    def _save_notes(self, notes: List[Note]) -> None:
-        notes = self._sort_notes(notes)
-        raw_dicts = _notes_to_raw_dicts(notes)
-        self._json_dump(raw_dicts, self.path)
+    def _write_manifest(self, manifest: dict) -> None:
+        with self._phase("manifest"):
+            _replace_file_content(self._manifest_path, json.dumps(manifest))
+        self._manifest = manifest
+        self._manifest_key = _file_identity(self._manifest_path)
 
-    def _sort_notes(self, notes: List[Note]) -> List[Note]:
-        """Sorted by end datetime (descending order, i.e. newest first)
-        and if there is a tie also by the identifier to get a deterministic order.
+    @contextmanager
+    def _modify_manifest(self) -> Iterator[dict]:
+        """Yields the manifest, which can be modified in place, and writes it
+        afterwards. The lock needs to be held while it is modified.
         """
-        return list(
-            sorted(notes, key=lambda x: (x.end_datetime, x.identifier), reverse=True)
-        )
+        manifest = self._read_manifest()
+        try:
+            yield manifest
+            self._write_manifest(manifest)
+        except BaseException:
+            # The cached manifest might have been modified partially
+            self._manifest = {}
+            self._manifest_key = None
+            raise
 
-    @staticmethod
-    def _json_load(path: Path) -> List[dict]:
-        with path.open("r", encoding="utf-8") as f:
-            content = json.load(f, object_hook=_deserialize_datetime)
-        return content
+    def __repr__(self) -> str:
+        return f"ShardedStore('{self.path}')"
 
-    @staticmethod
-    def _json_dump(obj: List[dict], path: Path) -> None:
-        json_str = json.dumps(obj, cls=DatetimeJSONEncoder)
-        with path.open("w", encoding="utf-8") as f:
-            f.write(json_str)
+
+def _count_shard_name(index: int) -> str:
+    return f"{index:06d}"
+
+
+def _group_by_shard(
+    raw_dicts: List[dict], identifiers: Dict[str, str]
+) -> Dict[str, List[dict]]:
+    """Groups the notes by the shards which contain them
+    according to the identifiers of the manifest"""
+    grouped = {}  # type: Dict[str, List[dict]]
+    for raw_dict in raw_dicts:
+        shard = identifiers[raw_dict[Note._identifier_key]]
+        grouped.setdefault(shard, []).append(raw_dict)
+    return grouped
+
+
+class AsyncStore:
+    """Wraps a store so that its methods can be awaited in asyncio applications.
+    All calls of the wrapped store, and therefore all file I/O and json encoding,
+    are run in an executor instead of blocking the event loop.
+
+    Notes which are added concurrently (e.g. by several tasks before the first
+    write started) are collected and added to the store with a single call
+    of add_many.
+    """
+
+    def __init__(self, store: BaseStore, executor: Optional[Executor] = None) -> None:
+        """
+        Parameters
+        ----------
+        store : BaseStore
+            The store which is wrapped, e.g. a Store or SqliteStore instance
+        executor : Optional[concurrent.futures.Executor], optional (default=None)
+            Executor in which the methods of the store are run. If None, the
+            default executor of the event loop is used
+        """
+        self.store = store
+        self._executor = executor
+        self._pending_adds = []  # type: List[Tuple[Note, asyncio.Future]]
+        self._add_task = None  # type: Optional[asyncio.Future]
+
+    async def add(self, note: Note) -> None:
+        """Adds the given note to the store together with all other notes which
+        are added concurrently. If the combined write fails, e.g. because
+        the identifier of another note already exists, the notes are added
+        one by one and only the calls of invalid notes raise an exception.
+        Stores whose add_many is not atomic (see BaseStore.atomic_add_many)
+        always add the notes one by one.
+
+        Parameters
+        ----------
+        note : Note
+            The Note instance which should be added to the store
+
+        Returns
+        -------
+        None
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending_adds.append((note, future))
+        if self._add_task is None or self._add_task.done():
+            self._add_task = asyncio.ensure_future(self._add_pending())
+        await future
+
+    async def _add_pending(self) -> None:
+        # Notes which are added while a write is running are written afterwards
+        pending = []  # type: List[Tuple[Note, asyncio.Future]]
+        try:
+            while self._pending_adds:
+                pending, self._pending_adds = self._pending_adds, []
+                await self._add_batch(pending)
+        except BaseException as e:
+            # E.g. the executor was shut down. The callers of add would otherwise
+            # wait forever
+            pending, self._pending_adds = pending + self._pending_adds, []
+            for _, future in pending:
+                _set_future_exception(future, e)
+            if not isinstance(e, Exception):
+                raise
+
+    async def _add_batch(self, pending: List[Tuple[Note, asyncio.Future]]) -> None:
+        notes = [note for note, _ in pending]
+        if self.store.atomic_add_many:
+            try:
+                await self._run(self.store.add_many, notes)
+            except Exception:
+                # Nothing was added and the notes can be tried one by one
+                pass
+            else:
+                for _, future in pending:
+                    _set_future_result(future, None)
+                return
+        # Notes which were added before a failure of a non-atomic add_many
+        # would otherwise be added twice
+        errors = await self._run(self._add_each, notes)
+        for (_, future), error in zip(pending, errors):
+            if error is None:
+                _set_future_result(future, None)
+            else:
+                _set_future_exception(future, error)
+
+    def _add_each(self, notes: List[Note]) -> List[Optional[Exception]]:
+        """Adds the notes one by one and returns the exception raised for
+        each note or None if it was added"""
+        errors = []  # type: List[Optional[Exception]]
+        for note in notes:
+            try:
+                self.store.add(note)
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+
+    async def add_many(self, notes: Sequence[Note]) -> None:
+        """See add_many of the wrapped store"""
+        await self._run(self.store.add_many, notes)
+
+    async def update(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """See update of the wrapped store"""
+        await self._run(self.store.update, notes)
+
+    async def remove(self, notes: Union[Note, Sequence[Note]]) -> None:
+        """See remove of the wrapped store"""
+        await self._run(self.store.remove, notes)
+
+    async def load(self, *args, **kwargs):
+        """See load of the wrapped store"""
+        return await self._run(self.store.load, *args, **kwargs)
+
+    async def query(self, *args, **kwargs) -> Union[List[Note], List[Dict[str, Any]]]:
+        """See query of the wrapped store"""
+        return await self._run(self.store.query, *args, **kwargs)
+
+    async def _run(self, function: Callable[..., _T], *args, **kwargs) -> _T:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs)
+        )
 
     def __repr__(self) -> str:
-        return f"Store('{self.path}')"
+        return f"AsyncStore({self.store!r})"
+
+
+def _set_future_result(future: asyncio.Future, result: Any) -> None:
+    # The awaiting task could have been cancelled in the meantime
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_future_exception(future: asyncio.Future, exception: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exception)
 
 
 class DatetimeJSONEncoder(JSONEncoder):
@@ -624,18 +3699,396 @@ def _deserialize_datetime(obj):
     Idea for this function comes from
     https://stackoverflow.com/a/52838324
     """
-    _datetime = obj.get("_datetime")
-    if _datetime is not None:
-        return _parse_datetime(_datetime)
+    # This is called for every dictionary in a store but only dictionaries
+    # with the single key "_datetime" can be an encoded datetime
+    if len(obj) == 1 and "_datetime" in obj:
+        return _parse_datetime(obj["_datetime"])
     return obj
 
 
 def _format_datetime(dt: datetime) -> str:
-    return dt.strftime(DATETIME_STRING_FORMAT)
+    """Returns the datetime in ISO 8601 format, including microseconds
+    if they are not 0"""
+    return dt.isoformat()
 
 
 def _parse_datetime(dt_str: str) -> datetime:
-    return datetime.strptime(dt_str, DATETIME_STRING_FORMAT)
+    """Parses datetimes formatted by _format_datetime as well as datetimes
+    in the format DATETIME_STRING_FORMAT, which was used by previous versions"""
+    if len(dt_str) == 19 and dt_str[13] == "-":
+        return datetime.strptime(dt_str, DATETIME_STRING_FORMAT)
+    return _fromisoformat(dt_str)
+
+
+def _fromisoformat_fallback(dt_str: str) -> datetime:
+    """Parses the output of datetime.isoformat for Python versions
+    without datetime.fromisoformat"""
+    dt_format = "%Y-%m-%dT%H:%M:%S"
+    if "." in dt_str:
+        dt_format += ".%f"
+    if len(dt_str) > 19 and dt_str[-6] in "+-":
+        # strptime of Python 3.6 does not support a colon in the UTC offset
+        dt_str = dt_str[:-3] + dt_str[-2:]
+        dt_format += "%z"
+    return datetime.strptime(dt_str, dt_format)
+
+
+_fromisoformat = getattr(
+    datetime, "fromisoformat", _fromisoformat_fallback
+)  # type: Callable[[str], datetime]
+
+
+def _sort_notes(notes: Sequence[_D]) -> List[_D]:
+    """Sorted by end datetime (descending order, i.e. newest first)
+    and if there is a tie also by the identifier to get a deterministic order.
+    Works for Note instances as well as for their raw dictionaries.
+    """
+    return list(sorted(notes, key=_note_order_key, reverse=True))
+
+
+def _note_order_key(note: dict) -> Tuple[Any, Any]:
+    return (note[Note._end_datetime_key], note[Note._identifier_key])
+
+
+def _duplicated_identifiers(
+    notes: Sequence[Note], existing_identifiers: Optional[AbstractSet[str]] = None
+) -> List[str]:
+    """Returns the identifiers of all notes which occur multiple times in notes
+    or are already part of existing_identifiers
+    """
+    if existing_identifiers is None:
+        existing_identifiers = set()
+    seen = set()  # type: Set[str]
+    duplicated = []
+    for note in notes:
+        if note.identifier in seen or note.identifier in existing_identifiers:
+            duplicated.append(note.identifier)
+        seen.add(note.identifier)
+    return duplicated
+
+
+def _file_identity(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Returns inode, modification time in nanoseconds, and size of the file,
+    which together change whenever the file is written to or replaced.
+    Returns None if the file does not exist.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _copy_raw(obj: Any, memo: Optional[dict] = None) -> Any:
+    """Copies the dictionaries and lists of a note, including the note itself, which
+    is returned as a normal dictionary. All other objects are expected to be
+    immutable (strings, numbers, datetimes, ...) and are not copied.
+
+    Tuples are converted to lists and dictionary keys to strings, in the same way
+    as json would do it, so that a copied note equals the note after it has been
+    stored and loaded again.
+
+    If memo is passed, objects which were already copied are not copied
+    again but the existing copy is returned. As in copy.deepcopy, the copied
+    objects are identified by their id and so the originals must stay alive
+    as long as memo is used.
+    """
+    if isinstance(obj, dict):
+        if memo is not None and id(obj) in memo:
+            return memo[id(obj)]
+        copied = {
+            (k if isinstance(k, str) else json.dumps(k)): _copy_raw(v, memo)
+            for k, v in dict.items(obj)
+        }  # type: Any
+    elif isinstance(obj, (list, tuple)):
+        if memo is not None and id(obj) in memo:
+            return memo[id(obj)]
+        copied = [_copy_raw(v, memo) for v in obj]
+    else:
+        return obj
+    if memo is not None:
+        memo[id(obj)] = copied
+    return copied
+
+
+def _is_immutable(obj: Any) -> bool:
+    return obj is None or isinstance(obj, (str, int, float, bool, datetime))
+
+
+def _replace_file_content(
+    path: Path, content: str, compression: Optional[str] = None
+) -> None:
+    """Writes content to a temporary file in the same directory and then
+    replaces path with it, so that readers either see the old or the new
+    content but never a partially written file. If compression is "gzip"
+    or "lzma", the content is compressed while it is written.
+    """
+    tmp_path = _write_temporary_file(path, content, compression=compression)
+    try:
+        os.replace(str(tmp_path), str(path))
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _write_temporary_file(
+    path: Path, content: str, compression: Optional[str] = None
+) -> Path:
+    """Writes content to a new temporary file next to path and returns its path.
+    The caller is responsible for replacing path with it or removing it.
+    """
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        if compression is None:
+            with tmp_path.open("w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with tmp_path.open("wb") as raw_file:
+                with _open_compressed(raw_file, "w", compression) as f:
+                    # Encoding the content in chunks avoids an encoded copy
+                    # of the whole content in memory
+                    for start in range(0, len(content), _WRITE_CHUNK_SIZE):
+                        end = start + _WRITE_CHUNK_SIZE
+                        f.write(content[start:end])
+                raw_file.flush()
+                os.fsync(raw_file.fileno())
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return tmp_path
+
+
+def _open_for_reading(path: Path) -> TextIO:
+    """Opens the file in text mode and decompresses it while it is read
+    if it starts with the magic bytes of gzip or lzma"""
+    with path.open("rb") as f:
+        start = f.read(max(len(magic) for magic in _MAGIC_BYTES))
+    for magic, compression in _MAGIC_BYTES.items():
+        if start.startswith(magic):
+            return _open_compressed(str(path), "r", compression)
+    return path.open("r", encoding="utf-8")
+
+
+def _open_compressed(file: Union[str, BinaryIO], mode: str, compression: str) -> TextIO:
+    if compression == "gzip":
+        # Level 6 is considerably faster than the default of 9
+        # while the files are only slightly larger
+        return gzip.open(  # type: ignore
+            file, mode + "t", compresslevel=6, encoding="utf-8"
+        )
+    return lzma.open(file, mode + "t", encoding="utf-8")  # type: ignore
+
+
+def _numeric_columns(
+    raw_dicts: Sequence[dict],
+) -> Tuple[List[str], Dict[str, "array[float]"]]:
+    """Returns the identifiers of the notes together with a float array for each
+    flattened key which has at least one number and otherwise only None as values.
+    NaN is used for missing values and None.
+    """
+    identifiers = []  # type: List[str]
+    columns = {}  # type: Dict[str, array[float]]
+    non_numeric_keys = set()  # type: Set[str]
+    nan = float("nan")
+    for n_rows, raw_dict in enumerate(raw_dicts):
+        identifiers.append(raw_dict[Note._identifier_key])
+        for key, value in _flatten_dict(raw_dict).items():
+            if key in non_numeric_keys:
+                continue
+            if value is None:
+                # Filled in with NaN like missing values
+                continue
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                non_numeric_keys.add(key)
+                columns.pop(key, None)
+                continue
+            values = columns.get(key)
+            if values is None:
+                values = columns[key] = array("d", [nan]) * n_rows
+            elif len(values) < n_rows:
+                values.extend(array("d", [nan]) * (n_rows - len(values)))
+            values.append(value)
+    for values in columns.values():
+        values.extend(array("d", [nan]) * (len(identifiers) - len(values)))
+    return identifiers, columns
+
+
+def _write_columns(
+    path: Path, raw_dicts: Sequence[dict], stamp: Optional[Tuple[int, int, int]]
+) -> None:
+    """Writes the numeric columns of raw_dicts to the folder path, one binary file of
+    float64 values per column and one with the utf-8 encoded identifiers, each
+    padded with null bytes to the same width. The manifest.json file
+    describes the columns and contains the stamp (identity) of the json file
+    of the store they were created from.
+
+    Files of previous versions are removed after the new manifest is written.
+    Readers which already opened them can still use them.
+    """
+    identifiers, columns = _numeric_columns(raw_dicts)
+    encoded_identifiers = [i.encode("utf-8") for i in identifiers]
+    width = max((len(i) for i in encoded_identifiers), default=1)
+
+    path.mkdir(exist_ok=True)
+    version = uuid.uuid4().hex
+    files = {}  # type: Dict[str, str]
+    file_name = f"{version}.{Note._identifier_key}"
+    (path / file_name).write_bytes(
+        b"".join(i.ljust(width, b"\0") for i in encoded_identifiers)
+    )
+    for i, (key, values) in enumerate(columns.items()):
+        files[key] = f"{version}.{i}.f8"
+        (path / files[key]).write_bytes(values.tobytes())
+    manifest = {
+        "stamp": stamp,
+        "rows": len(identifiers),
+        "byteorder": sys.byteorder,
+        "identifier": {"file": file_name, "width": width},
+        "columns": files,
+    }
+    _replace_file_content(path / "manifest.json", json.dumps(manifest))
+    for old_file in path.iterdir():
+        if old_file.name != "manifest.json" and not old_file.name.startswith(version):
+            try:
+                old_file.unlink()
+            except OSError:
+                # Still in use on Windows, will be removed by one of the next writes
+                pass
+
+
+def _read_columns(
+    path: Path, stamp: Optional[Tuple[int, int, int]]
+) -> Optional[Dict[str, Any]]:
+    """Returns the identifiers and the memory-mapped numeric columns written by
+    _write_columns, or None if they do not exist or were not written for the
+    json file with the identity stamp
+    """
+    np = _import_numpy()
+    try:
+        manifest = json.loads((path / "manifest.json").read_text())
+    except FileNotFoundError:
+        return None
+    if stamp is None or manifest["stamp"] != list(stamp):
+        return None
+    n_rows = manifest["rows"]
+    dtype = np.dtype("<f8" if manifest["byteorder"] == "little" else ">f8")
+
+    def memmap(file_name: str, dtype: Any) -> Any:
+        if n_rows == 0:
+            # Empty files can not be memory-mapped
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path / file_name, dtype=dtype, mode="r", shape=(n_rows,))
+
+    try:
+        identifiers = memmap(
+            manifest["identifier"]["file"], f"S{manifest['identifier']['width']}"
+        )
+        arrays = {Note._identifier_key: np.char.decode(identifiers, "utf-8")}
+        for key, file_name in manifest["columns"].items():
+            arrays[key] = memmap(file_name, dtype)
+    except FileNotFoundError:
+        # Replaced by a newer version in the meantime
+        return None
+    return arrays
+
+
+def _columns_to_numpy(
+    identifiers: List[str], columns: Dict[str, "array[float]"]
+) -> Dict[str, Any]:
+    np = _import_numpy()
+    arrays = {Note._identifier_key: np.array(identifiers, dtype=str)}
+    for key, values in columns.items():
+        arrays[key] = np.frombuffer(values, dtype=np.float64)
+    return arrays
+
+
+def _import_numpy():
+    try:
+        import numpy as np  # type: ignore
+    except ImportError:
+        raise ImportError(
+            "Numpy is not installed. You can install it via:\n"
+            "conda install numpy\n"
+            "or: pip install numpy"
+        )
+    return np
+
+
+def _lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+class _FileLock:
+    """Exclusive advisory lock which is shared between processes and threads.
+    It is based on a separate lock file so that the locked file itself can
+    be replaced while the lock is held. The lock is reentrant, i.e. it can be
+    acquired multiple times by the same thread.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None  # type: Optional[IO[str]]
+
+    def __enter__(self) -> "_FileLock":
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = self.path.open("a")
+                _lock_file(self._file)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            _unlock_file(self._file)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+def _lock_file(f: IO[str]) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 seconds, keep on waiting
+                pass
+
+
+def _unlock_file(f: IO[str]) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _to_sql_value(value: Any) -> Union[str, int, float, None]:
+    """Converts the value of a note to a value of an indexed column in SqliteStore.
+    Datetimes are stored in the ISO 8601 format so that their string
+    representations sort in the same order as the datetimes themselves.
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    elif isinstance(value, datetime):
+        return _format_datetime(value)
+    return json.dumps(value, cls=DatetimeJSONEncoder)
 
 
 def _convert_to_path(path: Union[str, Path]) -> Path:
@@ -644,11 +4097,25 @@ def _convert_to_path(path: Union[str, Path]) -> Path:
     return path
 
 
+def _to_note(raw_dict: dict) -> Note:
+    return Note(content=raw_dict)
+
+
+def _copy_to_note(raw_dict: dict) -> Note:
+    return Note(content=_copy_raw(raw_dict))
+
+
+def _decode_note(encoded_note: Union[str, bytes]) -> Note:
+    return Note(content=json.loads(encoded_note, object_hook=_deserialize_datetime))
+
+
+def _decode_note_at(content: bytes, position: List[int]) -> Note:
+    """Decodes the note at position, i.e. offset and length, of content"""
+    offset, length = position
+    end = offset + length
+    return _decode_note(content[offset:end])
+
+
 def _raw_dicts_to_notes(raw_dicts: List[dict]) -> List[Note]:
     converted_notes = [Note(content=raw_content) for raw_content in raw_dicts]
     return converted_notes
-
-
-def _notes_to_raw_dicts(notes: List[Note]) -> List[dict]:
-    raw_dicts = [dict(note) for note in notes]
-    return raw_dicts
@@ -1,15 +1,28 @@
 import argparse
+import gzip
+import hashlib
+import html
 import json
 import sys
 import textwrap
+import threading
+import time
 import webbrowser
+from collections import namedtuple
 from datetime import datetime
+from email.utils import formatdate
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from json import JSONEncoder
-from typing import List
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
 
 from hypernotes import (
+    BaseStore,
+    JsonLinesStore,
     Note,
+    ShardedStore,
+    SqliteStore,
     Store,
     _all_keys_from_dicts,
     _flatten_notes,
@@ -18,35 +31,130 @@ from hypernotes import (
 )
 
 
-class DatetimeNonReversibleJSONEncoder(JSONEncoder):
-    """Encodes datetime objects as a string representation"""
+_TableData = namedtuple("_TableData", ["columns", "rows", "search_texts"])
 
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return _format_datetime(obj)
-        return super().default(obj)
 
-
-def _format_notes_as_html(notes: List[Note]):
+def _table_data(notes: List[Note]) -> _TableData:
+    """Converts notes to the rows of the table shown in the browser. Each row is a
+    json-serializable dictionary with all columns, where missing values are
+    an empty string. The lowercase search texts of the rows are precomputed so
+    that searching the table does not need to encode the rows again.
+    """
     flat_dicts = _flatten_notes(notes)
     all_keys = _all_keys_from_dicts(flat_dicts)
     key_order = _key_order(all_keys)
 
-    data = []  # type: List[dict]
+    rows = []  # type: List[dict]
+    search_texts = []  # type: List[str]
     for d in flat_dicts:
         row = {}  # type: dict
         for col in key_order:
-            row[col] = d.get(col, "")
-        data.append(row)
-
-    js_var_data = json.dumps(data, cls=DatetimeNonReversibleJSONEncoder)
+            row[col] = _to_json_compatible(d.get(col, ""))
+        rows.append(row)
+        search_texts.append(
+            " ".join(
+                value if isinstance(value, str) else json.dumps(value)
+                for value in row.values()
+            ).lower()
+        )
+    return _TableData(key_order, rows, search_texts)
+
+
+def _to_json_compatible(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return _format_datetime(value)
+    elif isinstance(value, (list, tuple)):
+        return [_to_json_compatible(v) for v in value]
+    elif isinstance(value, dict):
+        return {str(k): _to_json_compatible(v) for k, v in value.items()}
+    return value
+
+
+def _datatables_response(table: _TableData, params: Dict[str, str]) -> dict:
+    """Implements the server-side processing protocol of DataTables, see
+    https://datatables.net/manual/server-side. Rows are filtered by the
+    global search value (case-insensitive), sorted by all requested columns,
+    and only the requested page of rows is returned.
+    """
+    draw = _int_param(params, "draw", 0)
+    start = max(_int_param(params, "start", 0), 0)
+    length = _int_param(params, "length", 10)
+    search = params.get("search[value]", "").strip().lower()
+
+    indices = list(range(len(table.rows)))
+    if search:
+        indices = [i for i in indices if search in table.search_texts[i]]
+
+    # Sorting is stable and therefore the least important column is sorted first
+    for column, descending in reversed(_order_columns(table, params)):
+        present = [i for i in indices if table.rows[i][column] not in ("", None)]
+        missing = [i for i in indices if table.rows[i][column] in ("", None)]
+        present.sort(key=lambda i: _sort_key(table.rows[i][column]), reverse=descending)
+        # Missing values are always shown last, independent of the sort direction
+        indices = present + missing
+
+    if length < 0:
+        page = indices[start:]
+    else:
+        stop = start + length
+        page = indices[start:stop]
+    return {
+        "draw": draw,
+        "recordsTotal": len(table.rows),
+        "recordsFiltered": len(indices),
+        "data": [table.rows[i] for i in page],
+    }
+
+
+def _int_param(params: Dict[str, str], name: str, default: int) -> int:
+    try:
+        return int(params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _order_columns(table: _TableData, params: Dict[str, str]) -> List[Tuple[str, bool]]:
+    """Returns the requested columns to sort by, most important first, together
+    with a flag if they should be sorted in descending order"""
+    orders = []
+    i = 0
+    while f"order[{i}][column]" in params:
+        index = _int_param(params, f"order[{i}][column]", -1)
+        descending = params.get(f"order[{i}][dir]", "asc") == "desc"
+        i += 1
+        # The name of the column is preferred over its index as the columns of
+        # the store might have changed since the page was loaded
+        column = params.get(f"columns[{index}][data]", "").replace("\\.", ".")
+        if column not in table.columns:
+            if not 0 <= index < len(table.columns):
+                continue
+            column = table.columns[index]
+        if params.get(f"columns[{index}][orderable]") == "false":
+            continue
+        orders.append((column, descending))
+    return orders
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # Values of different types cannot be compared directly and are therefore
+    # first grouped by their type
+    if isinstance(value, (int, float)):
+        return (0, value)
+    elif isinstance(value, str):
+        return (1, value)
+    return (2, json.dumps(value))
+
+
+def _format_html(columns: List[str]) -> str:
+    """Returns the page with an empty table of the passed in columns. The rows are
+    requested from the server as they are needed"""
     # Points in column names need to be escaped for the 'data' attribute in datatables
-    escaped_columns = [col.replace(".", "\\\\.") for col in key_order]
+    escaped_columns = [col.replace(".", "\\\\.") for col in columns]
     js_columns = "[" + ", ".join(f'{{data: "{col}"}}' for col in escaped_columns) + "]"
-    js_table_tr = "<tr>" + "".join(f"<th>{col}</th>" for col in key_order) + "</tr>"
+    js_table_tr = "<tr>" + "".join(f"<th>{col}</th>" for col in columns) + "</tr>"
 
     html_start = _html_start()
-    html_header = _html_header(js_var_data, js_columns)
+    html_header = _html_header(js_columns)
     html_body = _html_body(js_table_tr)
     html_end = "</html>"
 
@@ -62,7 +170,7 @@ def _html_start() -> str:
     )
 
 
-def _html_header(js_var_data: str, js_columns: str) -> str:
+def _html_header(js_columns: str) -> str:
     return textwrap.dedent(
         f"""\
         <head>
@@ -74,10 +182,13 @@ def _html_header(js_var_data: str, js_columns: str) -> str:
             <script type="text/javascript" language="javascript" src="https://cdn.datatables.net/1.10.19/js/dataTables.bootstrap4.min.js"></script>
 
             <script type="text/javascript" class="init">
-                        var data = {js_var_data}
                         $(document).ready(function () {{
                             $('#store_table').DataTable({{
-                                data: data,
+                                serverSide: true,
+                                processing: true,
+                                ajax: 'data',
+                                searchDelay: 400,
+                                order: [],
                                 columns: {js_columns},
                                 scrollX: true,
                                 scrollY: '60vh',
@@ -85,6 +196,35 @@ def _html_header(js_var_data: str, js_columns: str) -> str:
                             }}
 
                             );
+
+                            // Changes to the store are pushed by the server
+                            if (window.EventSource) {{
+                                var source = new EventSource('events');
+                                source.addEventListener('change', function (event) {{
+                                    var change = JSON.parse(event.data);
+                                    if (change.columns_changed) {{
+                                        window.location.reload();
+                                        return;
+                                    }}
+                                    var table = $('#store_table').DataTable();
+                                    var added = change.added.length;
+                                    if (added + change.removed.length > 0) {{
+                                        // Only the visible rows are requested again
+                                        table.ajax.reload(null, false);
+                                        return;
+                                    }}
+                                    var updated = {{}};
+                                    change.updated.forEach(function (row) {{
+                                        updated[row.identifier] = row;
+                                    }});
+                                    table.rows().every(function () {{
+                                        var row = updated[this.data().identifier];
+                                        if (row !== undefined) {{
+                                            this.data(row);
+                                        }}
+                                    }});
+                                }});
+                            }}
                         }});
 
                     </script>
@@ -111,6 +251,7 @@ def _html_body(js_table_tr: str) -> str:
         <body>
             <div class="page-header text-center">
                 <h1>Store Content</h1>
+                <a href="summary">Summary per model</a>
             </div>
             <hr>
             <div class="container-fluid">
@@ -127,13 +268,377 @@ def _html_body(js_table_tr: str) -> str:
     )
 
 
+# Aggregations which are shown on the summary page if none are requested
+_SUMMARY_AGGREGATIONS = ["mean", "max", "count"]
+
+
+def _summary(
+    store: BaseStore, table: _TableData, params: Dict[str, List[str]]
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Returns the columns and rows of the summary table of the store. The
+    notes are grouped by the "group_by" parameters (default: model) and the
+    "aggregation" parameters (default: mean, max, and count) are computed for
+    all "metric" parameters (default: all keys starting with "metrics.")
+    """
+    group_by = params.get("group_by") or [Note._model_key]
+    metric_keys = params.get("metric") or [
+        col for col in table.columns if col.startswith(Note._metrics_key + ".")
+    ]
+    aggregations = params.get("aggregation") or _SUMMARY_AGGREGATIONS
+    rows = store.aggregate(group_by, {key: aggregations for key in metric_keys})
+    columns = group_by + [f"{key}.{a}" for key in metric_keys for a in aggregations]
+    return columns, rows
+
+
+def _format_summary_html(columns: List[str], rows: List[Dict[str, Any]]) -> str:
+    """Returns a page with the summary table. As it only has one row per group,
+    it is sorted in the browser"""
+    table_head = "<tr>" + "".join(f"<th>{html.escape(c)}</th>" for c in columns)
+    table_body = "".join(
+        "<tr>"
+        + "".join(f"<td>{_format_summary_value(row.get(c))}</td>" for c in columns)
+        + "</tr>"
+        for row in rows
+    )
+    return (
+        _html_start()
+        + _summary_html_header()
+        + _summary_html_body(table_head + "</tr>", table_body)
+        + "</html>"
+    )
+
+
+def _format_summary_value(value: Any) -> str:
+    if value is None:
+        return ""
+    elif isinstance(value, float):
+        return f"{value:.4g}"
+    elif isinstance(value, str):
+        return html.escape(value)
+    return html.escape(json.dumps(_to_json_compatible(value)))
+
+
+def _summary_html_header() -> str:
+    return textwrap.dedent(
+        """\
+        <head>
+            <link rel="stylesheet" type="text/css" href="https://cdnjs.cloudflare.com/ajax/libs/twitter-bootstrap/4.1.3/css/bootstrap.css">
+            <link rel="stylesheet" type="text/css" href="https://cdn.datatables.net/1.10.19/css/dataTables.bootstrap4.min.css">
+
+            <script src="https://code.jquery.com/jquery-3.4.1.min.js"></script>
+            <script type="text/javascript" language="javascript" src="https://cdn.datatables.net/1.10.19/js/jquery.dataTables.min.js"></script>
+            <script type="text/javascript" language="javascript" src="https://cdn.datatables.net/1.10.19/js/dataTables.bootstrap4.min.js"></script>
+
+            <script type="text/javascript" class="init">
+                $(document).ready(function () {
+                    $('#summary_table').DataTable({paging: false, order: [], scrollX: true});
+                });
+            </script>
+
+            <meta charset=utf-8 />
+            <title>Store - Summary</title>
+        </head>
+        """
+    )
+
+
+def _summary_html_body(table_head: str, table_body: str) -> str:
+    return textwrap.dedent(
+        f"""\
+        <body>
+            <div class="page-header text-center">
+                <h1>Store Summary</h1>
+                <a href=".">Back to all notes</a>
+            </div>
+            <hr>
+            <div class="container-fluid">
+                <div class="row mx-5">
+                    <table id="summary_table" class="table table-striped table-bordered" style="width:100%">
+                        <thead>
+                            {table_head}
+                        </thead>
+                        <tbody>
+                            {table_body}
+                        </tbody>
+                    </table>
+                </div>
+            </div>
+        </body>
+        """
+    )
+
+
+_Page = namedtuple("_Page", ["html", "gzipped_html", "etag", "last_modified"])
+_View = namedtuple("_View", ["table", "page"])
+
+
+class _ViewCache:
+    """Keeps the table data and the rendered page of a store until the content
+    of the store changes. They are computed at most once per change, even if
+    multiple requests arrive at the same time.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._fingerprint = None  # type: Optional[object]
+        self._view = None  # type: Optional[_View]
+
+    def get(self, store: BaseStore) -> _View:
+        with self._lock:
+            fingerprint = store._fingerprint()
+            if (
+                self._view is None
+                or fingerprint is None
+                or fingerprint != self._fingerprint
+            ):
+                table = _table_data(store.load())
+                self._view = _View(table, _render_page(store, table, fingerprint))
+                self._fingerprint = fingerprint
+            return self._view
+
+
+def _render_page(
+    store: BaseStore, table: _TableData, fingerprint: Optional[object]
+) -> _Page:
+    html = _format_html(table.columns).encode("utf-8")
+    etag = None
+    last_modified = None
+    if fingerprint is not None:
+        etag = '"' + hashlib.sha1(repr(fingerprint).encode()).hexdigest() + '"'
+        path = getattr(store, "path", None)
+        if path is not None:
+            last_modified = formatdate(Path(path).stat().st_mtime, usegmt=True)
+    return _Page(html, gzip.compress(html), etag, last_modified)
+
+
+class _StoreWatcher:
+    """Checks the store for changes in regular intervals and keeps the most recent
+    changes, i.e. which rows were added, updated, or removed, so that they can be
+    sent to all connected browsers.
+    """
+
+    _max_changes = 100
+
+    def __init__(
+        self, store: BaseStore, view_cache: _ViewCache, interval: float = 1.0
+    ) -> None:
+        self.store = store
+        self.view_cache = view_cache
+        self.interval = interval
+        self.version = 0
+        self._changes = []  # type: List[Tuple[int, dict]]
+        self._table = None  # type: Optional[_TableData]
+        self._condition = threading.Condition()
+
+    def start(self) -> None:
+        self.check()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                # The store might, for example, be replaced in the moment it is read
+                print(f"Could not check store for changes: {e!r}", file=sys.stderr)
+
+    def check(self) -> None:
+        table = self.view_cache.get(self.store).table
+        if self._table is None:
+            self._table = table
+            return
+        elif table is self._table:
+            return
+        change = _diff_tables(self._table, table)
+        self._table = table
+        if change is None:
+            return
+        with self._condition:
+            self.version += 1
+            self._changes.append((self.version, change))
+            del self._changes[: -self._max_changes]
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> List[Tuple[int, dict]]:
+        """Waits until there are changes after the passed in version or until
+        the timeout is reached and returns them together with their versions"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > version, timeout)
+            if self.version == version:
+                return []
+            elif not self._changes or self._changes[0][0] > version + 1:
+                # Some changes are no longer available and therefore the whole
+                # page needs to be reloaded
+                return [(self.version, _full_change())]
+            return [(v, change) for v, change in self._changes if v > version]
+
+
+def _diff_tables(old: _TableData, new: _TableData) -> Optional[dict]:
+    """Returns the rows which were added or updated and the identifiers of the
+    removed rows, or None if the tables are the same. If the columns changed,
+    the whole table needs to be loaded again and no rows are returned.
+    """
+    if old.columns != new.columns:
+        return _full_change()
+
+    old_rows = {row[Note._identifier_key]: row for row in old.rows}
+    new_identifiers = set()
+    added = []
+    updated = []
+    for row in new.rows:
+        identifier = row[Note._identifier_key]
+        new_identifiers.add(identifier)
+        old_row = old_rows.get(identifier)
+        if old_row is None:
+            added.append(row)
+        elif old_row != row:
+            updated.append(row)
+    removed = [i for i in old_rows if i not in new_identifiers]
+
+    if not (added or updated or removed):
+        return None
+    return {
+        "columns_changed": False,
+        "added": added,
+        "updated": updated,
+        "removed": removed,
+    }
+
+
+def _full_change() -> dict:
+    return {"columns_changed": True, "added": [], "updated": [], "removed": []}
+
+
+def _format_event(version: int, change: dict) -> bytes:
+    data = json.dumps(change)
+    return f"id: {version}\nevent: change\ndata: {data}\n\n".encode("utf-8")
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    if not accept_encoding:
+        return False
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
 class HTMLResponder(BaseHTTPRequestHandler):
     def do_GET(self):
-        html = _format_notes_as_html(store.load())
+        url = urlparse(self.path)
+        if url.path == "/":
+            self._send_page(view_cache.get(store).page)
+        elif url.path == "/data":
+            params = {
+                name: values[0]
+                for name, values in parse_qs(url.query, keep_blank_values=True).items()
+            }
+            response = _datatables_response(view_cache.get(store).table, params)
+            body = json.dumps(response).encode("utf-8")
+            self._send_body(body, "application/json")
+        elif url.path == "/events":
+            self._send_events(store_watcher)
+        elif url.path == "/summary":
+            try:
+                columns, rows = _summary(
+                    store, view_cache.get(store).table, parse_qs(url.query)
+                )
+            except ValueError as e:
+                # E.g. an unknown aggregation in the query string
+                self.send_error(400, str(e))
+                return
+            body = _format_summary_html(columns, rows).encode("utf-8")
+            self._send_body(body, "text/html; charset=utf-8")
+        else:
+            self.send_error(404)
+
+    def _send_events(self, watcher: _StoreWatcher) -> None:
+        """Sends all changes of the store as server-sent events until the browser
+        closes the connection"""
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        # Browsers send the id of the last received event if they reconnect
+        last_event_id = self.headers.get("Last-Event-ID", "")
+        version = watcher.version
+        if last_event_id.isdigit():
+            version = min(int(last_event_id), version)
+        try:
+            while True:
+                changes = watcher.wait(version, timeout=15)
+                if not changes:
+                    # Comments keep the connection open and detect closed ones
+                    self.wfile.write(b": keep-alive\n\n")
+                for version, change in changes:
+                    self.wfile.write(_format_event(version, change))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def _send_page(self, page: _Page) -> None:
+        if page.etag is not None and page.etag == self.headers.get("If-None-Match"):
+            self.send_response(304)
+            self._send_cache_headers(page)
+            self.end_headers()
+            return
+        self._send_body(
+            page.html, "text/html; charset=utf-8", page=page, gzipped=page.gzipped_html
+        )
+
+    def _send_body(
+        self,
+        body: bytes,
+        content_type: str,
+        page: Optional[_Page] = None,
+        gzipped: Optional[bytes] = None,
+    ) -> None:
+        use_gzip = _accepts_gzip(self.headers.get("Accept-Encoding"))
+        if use_gzip:
+            body = gzipped if gzipped is not None else gzip.compress(body)
         self.send_response(200)
-        self.send_header("Content-type", "text/html")
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        if page is not None:
+            self._send_cache_headers(page)
+        else:
+            self.send_header("Cache-Control", "no-store")
+            self.send_header("Vary", "Accept-Encoding")
         self.end_headers()
-        self.wfile.write(html.encode("utf-8"))
+        self.wfile.write(body)
+
+    def _send_cache_headers(self, page: _Page) -> None:
+        # Browsers should always ask if the page is still up to date
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if page.etag is not None:
+            self.send_header("ETag", page.etag)
+        if page.last_modified is not None:
+            self.send_header("Last-Modified", page.last_modified)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handles each request in a separate thread so that a slow client does not
+    block all others"""
+
+    daemon_threads = True
+
+
+def _store_from_path(path: str) -> BaseStore:
+    """Returns a store of the type matching the file extension of path
+    or a ShardedStore if path is a directory"""
+    if Path(path).is_dir():
+        return ShardedStore(path)
+    suffix = Path(path).suffix.lower()
+    if suffix in (".db", ".sqlite", ".sqlite3"):
+        return SqliteStore(path)
+    elif suffix == ".jsonl":
+        return JsonLinesStore(path)
+    return Store(path)
 
 
 def _parse_args(args):
@@ -144,7 +649,12 @@ def _parse_args(args):
         + " The page will contain an interactive table showing the most relevant"
         + " information of all notes in the store such as metrics, parameters, etc."
     )
-    parser.add_argument("store_path", type=str, help="path to json store")
+    parser.add_argument(
+        "store_path",
+        type=str,
+        help="path to store. Files ending with .jsonl are opened as a JsonLinesStore,"
+        + " with .db, .sqlite or .sqlite3 as a SqliteStore, and all others as a Store",
+    )
     parser.add_argument(
         "--ip",
         type=str,
@@ -159,17 +669,27 @@ def _parse_args(args):
         action="store_true",
         help="can be passed to prevent automatic opening of web browser",
     )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="seconds between checks of the store for changes, which are then"
+        + " shown in the browser (default=1)",
+    )
 
     return parser.parse_args(args)
 
 
 def main(raw_args):
-    global store
+    global store, view_cache, store_watcher
     args = _parse_args(raw_args)
-    store = Store(args.store_path)
+    store = _store_from_path(args.store_path)
+    view_cache = _ViewCache()
+    store_watcher = _StoreWatcher(store, view_cache, interval=args.interval)
+    store_watcher.start()
 
     try:
-        server = HTTPServer((args.ip, args.port), HTMLResponder)
+        server = _ThreadingHTTPServer((args.ip, args.port), HTMLResponder)
         url = f"http://{args.ip}:{args.port}"
         print(f"Started server on {url}. Server can be stopped with control+c / ctrl+c")
         if not args.no_browser:
@@ -1,14 +1,49 @@
+import asyncio
+import copy
+import gzip
+import io
+import json
 import multiprocessing as mp
+import subprocess
+import sys
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Sequence
 
 import pytest  # type: ignore
 import requests
 
-from hypernotes import Note, Store, _pandas_dict, _format_datetime
-from hypernotes.__main__ import _format_notes_as_html, main
+from hypernotes import (
+    AsyncStore,
+    BaseStore,
+    DatetimeJSONEncoder,
+    JsonLinesStore,
+    LazyNotes,
+    Note,
+    ShardedStore,
+    SqliteStore,
+    Store,
+    StoreStats,
+    _deserialize_datetime,
+    _format_datetime,
+    _fromisoformat_fallback,
+    _iter_json_array,
+    _pandas_dict,
+)
+from hypernotes.__main__ import (
+    _accepts_gzip,
+    _datatables_response,
+    _diff_tables,
+    _format_html,
+    _store_from_path,
+    _StoreWatcher,
+    _summary,
+    _table_data,
+    _ViewCache,
+    main,
+)
 
 
 class TestNote:
@@ -47,6 +82,36 @@ class TestNote:
             assert isinstance(git_value, str)
             assert len(git_value) > 1
 
+    def test_git_info_is_cached(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        subprocess.check_call(git + ["init", "-q"])
+        subprocess.check_call(git + ["symbolic-ref", "HEAD", "refs/heads/main"])
+        subprocess.check_call(git + ["commit", "-q", "--allow-empty", "-m", "1"])
+        calls = []
+        check_output = subprocess.check_output
+
+        def counting_check_output(*args, **kwargs):
+            calls.append(args)
+            return check_output(*args, **kwargs)
+
+        monkeypatch.setattr(subprocess, "check_output", counting_check_output)
+        note = Note()
+        assert Note().git == note.git
+        assert note.git["branch"] == "main"
+        assert len(calls) == 1
+
+        # New commits and branches are detected
+        subprocess.check_call(git + ["commit", "-q", "--allow-empty", "-m", "2"])
+        assert Note().git["commit"] != note.git["commit"]
+        subprocess.check_call(git + ["checkout", "-q", "-b", "other"])
+        assert Note().git["branch"] == "other"
+        assert len(calls) == 3
+
+        monkeypatch.setattr(Note, "capture_git_info", False)
+        assert Note().git == {}
+        assert len(calls) == 3
+
     def test_pass_content(self):
         content = {
             Note._start_datetime_key: datetime.now(),
@@ -127,6 +192,49 @@ class TestNote:
 
         assert old_identifier != note.identifier
 
+    def test_from_note_copy_on_write(self, tmp_path):
+        original_note = Note("original note")
+        original_note.info["folds"] = [[0.1, 0.2], [0.3, 0.4]]
+        new_notes = [
+            Note.from_note(original_note, copy_on_write=True) for _ in range(2)
+        ]
+
+        # Content which is not accessed is shared
+        assert all(
+            dict.__getitem__(note, "info") is dict.__getitem__(original_note, "info")
+            for note in new_notes
+        )
+        # but copied as soon as it is accessed, no matter on which note
+        new_notes[0].features["numerical"].append("num1")
+        new_notes[0]["info"]["folds"].append([0.5])
+        original_note.parameters["max_depth"] = 3
+        new_notes[1].info.get("folds")[0].append(0.0)
+
+        assert original_note.features["numerical"] == []
+        assert original_note.info == {"folds": [[0.1, 0.2], [0.3, 0.4]]}
+        assert new_notes[0].info == {"folds": [[0.1, 0.2], [0.3, 0.4], [0.5]]}
+        assert new_notes[1].info == {"folds": [[0.1, 0.2, 0.0], [0.3, 0.4]]}
+        assert new_notes[0].parameters == new_notes[1].parameters == {}
+        assert new_notes[0].identifier != new_notes[1].identifier
+
+        # Shallow copies keep track of the shared content as well
+        original_note.parameters["nested"] = {"x": 1}
+        base_note = Note.from_note(original_note, copy_on_write=True)
+        sibling_note = Note.from_note(base_note, copy_on_write=True)
+        copied_note = copy.copy(base_note)
+        copied_note.parameters["nested"]["x"] = 2
+        assert base_note.parameters["nested"] == {"x": 1}
+        assert sibling_note.parameters["nested"] == {"x": 1}
+        assert original_note.parameters["nested"] == {"x": 1}
+        assert copied_note.parameters["nested"] == {"x": 2}
+        assert copied_note.identifier == base_note.identifier
+
+        store = Store(tmp_path / "test_store.json")
+        store.add_many(new_notes + [original_note])
+        assert sorted(store.load(), key=lambda n: n.identifier) == sorted(
+            new_notes + [original_note], key=lambda n: n.identifier
+        )
+
 
 class TestStore:
     def test_roundtrip(self, tmp_path):
@@ -214,6 +322,50 @@ class TestStore:
         loaded_notes_again = store.load()
         assert note_1 not in loaded_notes_again and note_2 in loaded_notes
 
+    def test_add_and_update_many(self, tmp_path):
+        original_note = Note("original")
+        notes = [Note.from_note(original_note) for _ in range(3)]
+        store = Store(tmp_path / "test_store.json")
+        store.add(original_note)
+
+        # Batch fails as a whole if one identifier is already part of the store
+        with pytest.raises(Exception):
+            store.add_many(notes + [original_note])
+        with pytest.raises(Exception):
+            store.add_many(notes + [notes[0]])
+        assert len(store.load()) == 1
+
+        store.add_many(notes)
+        assert all(note.end_datetime is not None for note in notes)
+        assert len(store.load()) == 4
+
+        for i, note in enumerate(notes):
+            note.metrics["accuracy"] = i
+        with pytest.raises(AssertionError):
+            store.update_many(notes + [Note()])
+        store.update_many(notes)
+        loaded_metrics = [note.metrics for note in store.load()]
+        assert loaded_metrics.count({}) == 1
+        assert all({"accuracy": i} in loaded_metrics for i in range(3))
+
+    def test_concurrent_writers(self, tmp_path):
+        store_path = tmp_path / "test_store.json"
+        processes = [
+            mp.Process(target=_add_notes, args=(store_path, 10)) for _ in range(4)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+
+        assert all(p.exitcode == 0 for p in processes)
+        assert len(Store(store_path).load()) == 40
+        # No temporary files are left behind
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "test_store.json",
+            "test_store.json.lock",
+        ]
+
     def test_writing_invalid_note(self, tmp_path):
         invalid_note = Note("Invalid note")
         invalid_note.info["invalid_object"] = InvalidObject()
@@ -250,6 +402,322 @@ class TestStore:
             == loaded_notes
         )
 
+    def test_cache(self, tmp_path):
+        note = Note("Note")
+        note.info["some_tuple"] = (1, 2)
+        store_path = tmp_path / "test_store.json"
+        store = Store(store_path)
+        store.add(note)
+
+        hits, misses = store.cache_info()
+        loaded_notes = store.load()
+        assert store.cache_info() == (hits + 1, misses)
+        # Cached content equals what would be read from the file
+        assert loaded_notes == Store(store_path).load()
+        assert loaded_notes[0].info["some_tuple"] == [1, 2]
+
+        # Returned notes are copies and modifying them does not affect the cache
+        loaded_notes[0].metrics["accuracy"] = 0.5
+        assert store.load()[0].metrics == {}
+
+        # Changes made through another instance invalidate the cache
+        Store(store_path).add(Note("Other note"))
+        assert len(store.load()) == 2
+        assert store.cache_info() == (hits + 2, misses + 1)
+
+    def test_query(self, tmp_path):
+        _validate_query(Store(tmp_path / "test_store.json"))
+
+    @pytest.mark.parametrize("index", [False, True])
+    def test_get_and_contains(self, tmp_path, index):
+        notes = [Note(f"Note {i}") for i in range(3)]
+        notes[1].info["some_dates"] = [datetime(2019, 1, 3, 10, 0, 1)]
+        notes[1].text = "Non-ascii text: äöü"
+        store_path = tmp_path / "test_store.json"
+        store = Store(store_path, index=index)
+        store.add_many(notes)
+
+        assert store.get(notes[1].identifier) == notes[1]
+        assert store.contains(notes[1].identifier)
+        assert store.get("missing") is None
+        assert not store.contains("missing")
+        # Returned notes are copies
+        store.get(notes[0].identifier).metrics["accuracy"] = 0.5
+        assert Store(store_path, index=index).get(notes[0].identifier) == notes[0]
+
+        store.remove(notes[0])
+        assert not store.contains(notes[0].identifier)
+        # Changes made by a store without an index are detected
+        Store(store_path).update(notes[2])
+        Store(store_path).add(Note("New note"))
+        assert store.get(notes[2].identifier) == notes[2]
+        assert len(store.load()) == 3
+        # The json file is the same as if it was written without an index
+        assert json.loads(store_path.read_text()) == json.loads(
+            json.dumps(store.load(), cls=DatetimeJSONEncoder)
+        )
+
+    @pytest.mark.parametrize("suffix", [".json.gz", ".json.xz"])
+    def test_compression(self, tmp_path, suffix):
+        notes = [Note(f"Note {i}") for i in range(3)]
+        notes[0].info["some_dates"] = [datetime(2019, 1, 3, 10, 0, 1)]
+        store_path = tmp_path / ("test_store" + suffix)
+        store = Store(store_path)
+        store.add_many(notes[:2])
+        store.add(notes[2])
+        store.remove(notes[1])
+
+        assert not store_path.read_bytes().startswith(b"[")
+        loaded_notes = Store(store_path).load()
+        assert loaded_notes == [notes[2], notes[0]]
+        assert list(Store(store_path).iter_notes()) == loaded_notes
+        # Compressed files are detected independent of their extension
+        renamed_path = store_path.rename(tmp_path / "test_store.json")
+        assert Store(renamed_path).load() == loaded_notes
+        with pytest.raises(ValueError):
+            Store(tmp_path / ("indexed" + suffix), index=True)
+
+    def test_buffered(self, tmp_path):
+        stats = StoreStats()
+        store_path = tmp_path / "test_store.json"
+        notes = [Note(f"Note {i}") for i in range(4)]
+        with Store(store_path, buffered=True, flush_interval=60, stats=stats) as store:
+            store.add_many(notes[:2])
+            notes[0].model = "updated"
+            store.update(notes[0])
+            with pytest.raises(Exception):
+                store.add(notes[1])
+            with pytest.raises(AssertionError):
+                store.update(notes[2])
+            assert Store(store_path).load() == []
+
+            # Buffered notes are written before the store is read
+            assert store.get(notes[0].identifier).model == "updated"
+            assert Store(store_path).load() == [notes[1], notes[0]]
+            store.add(notes[2])
+            store.add(notes[3])
+        assert Store(store_path).load() == list(reversed(notes))
+
+        summary = stats.summary()
+        assert summary["flush"]["calls"] == 2
+        assert summary["flush"]["notes"] == 5
+        assert "queue" in summary["flush"]["phases"]
+        queue_depth = summary["flush"]["samples"]["queue_depth"]
+        # One sample of the number of buffered notes per flush
+        assert queue_depth["count"] == 2
+        assert queue_depth["p50"] == 2
+        assert queue_depth["max"] == 3
+        output = io.StringIO()
+        stats.dump(output)
+        assert "queue_depth (mean=2.5" in output.getvalue()
+
+    def test_get_uses_a_consistent_cache(self, tmp_path):
+        class ChangingStore(Store):
+            changed = False
+
+            def _read_json(self):
+                raw_dicts = super()._read_json()
+                # The file changes while the positions of the notes are looked up,
+                # as it could if the flush thread of a buffered store writes
+                if not self.changed:
+                    self.changed = True
+                    Store(self.path).add(Note("Newer note"))
+                return raw_dicts
+
+        store_path = tmp_path / "test_store.json"
+        notes = [Note(f"Note {i}") for i in range(3)]
+        Store(store_path).add_many(notes)
+        store = ChangingStore(store_path)
+        assert store.get(notes[0].identifier) == notes[0]
+        assert len(store.load()) == 4
+
+    def test_buffered_invalid_notes_do_not_block_others(self, tmp_path):
+        store_path = tmp_path / "test_store.json"
+        notes = [Note(f"Note {i}") for i in range(3)]
+        with Store(store_path, buffered=True, flush_interval=60) as store:
+            invalid_note = Note("Not serializable")
+            invalid_note.info["object"] = object()
+            with pytest.raises(TypeError):
+                store.add(invalid_note)
+            store.add(notes[0])
+            assert store.load() == [notes[0]]
+
+            # Notes which were removed by another store in the meantime
+            # are moved to failed_notes and the other ones are written
+            store.update(notes[0])
+            store.add(notes[1])
+            Store(store_path).remove(notes[0])
+            with pytest.raises(Exception):
+                store.flush()
+            assert store.failed_notes == [notes[0]]
+            assert Store(store_path).load() == [notes[1]]
+
+            store.add(notes[2])
+        assert Store(store_path).load() == [notes[2], notes[1]]
+
+    @pytest.mark.parametrize(
+        "flush_interval,max_buffered_notes", [(60, 2), (0.05, 100)]
+    )
+    def test_buffered_notes_are_flushed_in_background(
+        self, tmp_path, flush_interval, max_buffered_notes
+    ):
+        store_path = tmp_path / "test_store.json"
+        store = Store(
+            store_path,
+            buffered=True,
+            flush_interval=flush_interval,
+            max_buffered_notes=max_buffered_notes,
+        )
+        store.add_many([Note(), Note()])
+        for _ in range(100):
+            if len(Store(store_path).load()) == 2:
+                break
+            time.sleep(0.05)
+        assert len(Store(store_path).load()) == 2
+        store.close()
+
+    def test_buffered_notes_are_flushed_at_exit(self, tmp_path):
+        store_path = tmp_path / "test_store.json"
+        code = (
+            "from hypernotes import Note, Store;"
+            + f"store = Store({str(store_path)!r}, buffered=True, flush_interval=60);"
+            + "store.add(Note('Note'))"
+        )
+        subprocess.check_call([sys.executable, "-c", code])
+        assert len(Store(store_path).load()) == 1
+
+    def test_index_reads_only_requested_note(self, tmp_path):
+        stats = StoreStats()
+        store_path = tmp_path / "test_store.json"
+        notes = [Note(f"Note {i}") for i in range(3)]
+        Store(store_path, index=True).add_many(notes)
+
+        store = Store(store_path, index=True, stats=stats)
+        assert store.get(notes[2].identifier) == notes[2]
+        assert store.cache_info() == (0, 0)
+        summary = stats.summary()
+        assert 0 < summary["get"]["bytes_read"] < store_path.stat().st_size
+
+    def test_stats(self, tmp_path):
+        stats = StoreStats()
+        store_path = tmp_path / "test_store.json"
+        store = Store(store_path, stats=stats)
+        notes = [Note(f"Note {i}") for i in range(3)]
+        for note in notes:
+            store.add(note)
+        Store(store_path, stats=stats).load()
+        file_size = store_path.stat().st_size
+        store.update(notes[0])
+        store.remove(notes[1:])
+        with pytest.raises(Exception):
+            store.add(notes[0])
+
+        summary = stats.summary()
+        # Operations which are called by other ones are not recorded separately
+        assert sorted(summary) == ["add", "load", "remove", "update"]
+        assert summary["add"]["calls"] == 4
+        assert summary["add"]["notes"] == 3
+        assert summary["add"]["bytes_written"] > 0
+        assert summary["remove"]["notes"] == 2
+        assert summary["load"]["notes"] == 3
+        assert summary["load"]["bytes_read"] == file_size
+        assert set(summary["load"]["phases"]) == {
+            "read",
+            "parse",
+            "sort",
+            "copy",
+            "total",
+        }
+        assert {"lock", "validate", "prepare", "sort", "serialize", "write"} <= set(
+            summary["add"]["phases"]
+        )
+        add_total = summary["add"]["phases"]["total"]
+        assert add_total["count"] == 4
+        assert add_total["p50"] <= add_total["p90"] <= add_total["p99"]
+        assert add_total["p99"] <= add_total["max"] <= add_total["total"]
+
+        output = io.StringIO()
+        stats.dump(output)
+        assert "add (calls=4, notes=3" in output.getvalue()
+        assert "serialize" in output.getvalue()
+
+        stats.reset()
+        assert stats.summary() == {}
+
+    def test_stats_percentiles(self):
+        stats = StoreStats(max_samples=100)
+        for i in range(1, 201):
+            stats.record_duration("add", "write", i)
+        write = stats.summary(percentiles=[50, 100])["add"]["phases"]["write"]
+        assert write["count"] == 200
+        assert write["total"] == sum(range(1, 201))
+        # Percentiles are based on the most recent 100 durations
+        assert write["p50"] == 150
+        assert write["p100"] == write["max"] == 200
+
+    @pytest.mark.parametrize("columnar", [True, False])
+    def test_load_columns(self, tmp_path, columnar):
+        np = pytest.importorskip("numpy")
+        notes = [Note(f"Note {i}") for i in range(3)]
+        for i, note in enumerate(notes):
+            note.end()
+            note.end_datetime += timedelta(seconds=i)
+            note.metrics["auc"] = i / 10
+            note.parameters["is_numeric"] = i if i != 1 else None
+            note.parameters["not_numeric"] = i if i != 1 else "text"
+        notes[0].metrics["recall"] = 0.5
+        store = Store(tmp_path / "test_store.json", columnar=columnar)
+        assert list(store.load_columns()) == ["identifier"]
+        store.add_many(notes)
+
+        columns = store.load_columns()
+        assert set(columns) == {
+            "identifier",
+            "metrics.auc",
+            "metrics.recall",
+            "parameters.is_numeric",
+        }
+        assert list(columns["identifier"]) == [n.identifier for n in notes[::-1]]
+        assert list(columns["metrics.auc"]) == [0.2, 0.1, 0.0]
+        assert np.isnan(columns["metrics.recall"][:2]).all()
+        assert columns["metrics.recall"][2] == 0.5
+        assert np.isnan(columns["parameters.is_numeric"][1])
+        assert set(store.load_columns(columns=["metrics"])) == {
+            "identifier",
+            "metrics.auc",
+            "metrics.recall",
+        }
+        if columnar:
+            assert (store.path.parent / "test_store.json.columns").is_dir()
+            # Changes made by a store without columnar=True are detected
+            Store(store.path).remove(notes[2])
+            assert len(store.load_columns()["metrics.auc"]) == 2
+
+    def test_iter_notes(self, tmp_path):
+        notes = [Note(f"Note {i}") for i in range(3)]
+        notes[0].info["nested"] = {"list": [1, {"a": "]}["}]}
+        store = Store(tmp_path / "test_store.json")
+        store.add_many(notes)
+
+        assert list(store.iter_notes()) == store.load()
+        assert list(Store(store.path).iter_notes()) == store.load()
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+    @pytest.mark.parametrize(
+        "content",
+        [[], [{}], [1, 22, 333], [{"a": [1, {"b": "c"}]}, {"d": "]"}, "e", None]],
+    )
+    def test_iter_json_array(self, content, chunk_size):
+        for indent in (None, 4):
+            f = io.StringIO(json.dumps(content, indent=indent) + "\n ")
+            assert list(_iter_json_array(f, chunk_size=chunk_size)) == content
+        with pytest.raises(json.JSONDecodeError):
+            list(_iter_json_array(io.StringIO(json.dumps(content)[:-1])))
+        # Content after the array is reported instead of being ignored
+        f = io.StringIO(json.dumps(content) + " garbage")
+        with pytest.raises(json.JSONDecodeError):
+            list(_iter_json_array(f, chunk_size=chunk_size))
+
     def test_from_note(self):
         original_note = Note("original note")
         precision_value = 0.5
@@ -269,6 +737,315 @@ class TestStore:
         assert len(original_note.features["numerical"]) == 0
 
 
+class TestJsonLinesStore:
+    def test_roundtrip(self, tmp_path):
+        note = Note("Desc")
+        note.metrics["accuracy"] = 0.8
+        note.info["some_dates"] = [datetime(2019, 1, 3, 10, 0, 1)]
+        note_2 = Note("Desc 2")
+        note_2.end()
+        note_2.end_datetime += timedelta(seconds=1)
+
+        store = JsonLinesStore(tmp_path / "test_store.jsonl")
+        store.add(note)
+        store.add(note_2)
+
+        loaded_notes = store.load()
+        assert loaded_notes == [note_2, note]
+        assert list(loaded_notes[1].keys()) == list(note.keys())
+        # Each note is stored in its own line
+        assert len(store.path.read_text().splitlines()) == 2
+        with pytest.raises(Exception):
+            store.add(note)
+
+    def test_update_remove_and_compact(self, tmp_path):
+        note_1 = Note("Note 1")
+        note_2 = Note("Note 2")
+        store_path = tmp_path / "test_store.jsonl"
+        store = JsonLinesStore(store_path)
+        store.add(note_1)
+        store.add(note_2)
+
+        note_1.model = "updated"
+        store.update(note_1)
+        store.remove([note_2])
+        with pytest.raises(AssertionError):
+            store.remove([note_2])
+
+        # Another store instance on the same file sees all changes
+        loaded_notes = JsonLinesStore(store_path).load()
+        assert loaded_notes == [note_1]
+        assert loaded_notes[0].model == "updated"
+        assert len(store_path.read_text().splitlines()) == 4
+
+        store.compact()
+        assert len(store_path.read_text().splitlines()) == 1
+        assert store.load() == [note_1]
+        store.add(note_2)
+        assert len(store.load()) == 2
+
+    def test_incomplete_last_line_is_ignored(self, tmp_path):
+        note = Note()
+        store = JsonLinesStore(tmp_path / "test_store.jsonl")
+        store.add(note)
+        with store.path.open("a") as f:
+            f.write('{"identifier": "partially written')
+
+        assert store.load() == [note]
+
+    def test_stats(self, tmp_path):
+        store = JsonLinesStore(tmp_path / "test_store.jsonl", stats=StoreStats())
+        _validate_stats(store)
+
+
+class TestSqliteStore:
+    def test_roundtrip(self, tmp_path):
+        note = Note("Desc")
+        note.model = "randomforest"
+        note.metrics["accuracy"] = 0.8
+        note.info["some_dates"] = [datetime(2019, 1, 3, 10, 0, 1)]
+        note_2 = Note("Desc 2")
+        note_2.end()
+        note_2.end_datetime += timedelta(seconds=1)
+
+        store = SqliteStore(tmp_path / "test_store.db")
+        store.add(note)
+        store.add(note_2)
+
+        loaded_notes = SqliteStore(store.path).load()
+        assert loaded_notes == [note_2, note]
+        assert list(loaded_notes[1].keys()) == list(note.keys())
+        with pytest.raises(Exception):
+            store.add_many([Note(), note])
+        assert len(store.load()) == 2
+
+    def test_update_and_remove(self, tmp_path):
+        note_1 = Note("Note 1")
+        note_2 = Note("Note 2")
+        store = SqliteStore(tmp_path / "test_store.db")
+        store.add_many([note_1, note_2])
+
+        note_1.model = "updated"
+        note_2.model = "updated"
+        with pytest.raises(AssertionError):
+            store.update([note_1, Note()])
+        assert all(note.model is None for note in store.load())
+        store.update(note_1)
+        assert {note.model for note in store.load()} == {"updated", None}
+
+        with pytest.raises(AssertionError):
+            store.remove([note_2, Note()])
+        store.remove([note_2])
+        assert store.load() == [note_1]
+
+    def test_query(self, tmp_path):
+        _validate_query(SqliteStore(tmp_path / "test_store.db"))
+
+    def test_stats(self, tmp_path):
+        _validate_stats(SqliteStore(tmp_path / "test_store.db", stats=StoreStats()))
+
+
+class TestShardedStore:
+    def test_roundtrip(self, tmp_path):
+        notes = []
+        for i, month in enumerate([1, 3, 1, 2]):
+            note = Note(f"Note {i}")
+            note.info["some_dates"] = [datetime(2019, 1, 3, 10, 0, 1)]
+            note.end()
+            note.end_datetime = datetime(2019, month, 10 + i)
+            notes.append(note)
+
+        store = ShardedStore(tmp_path / "store")
+        store.add_many(notes[:3])
+        store.add(notes[3])
+
+        # Shards are merged with the most recent note first
+        loaded_notes = ShardedStore(store.path).load()
+        assert loaded_notes == [notes[1], notes[3], notes[2], notes[0]]
+        assert list(loaded_notes[0].keys()) == list(notes[1].keys())
+        assert sorted(p.name for p in store.path.iterdir()) == [
+            "2019-01.json",
+            "2019-02.json",
+            "2019-03.json",
+            "manifest.json",
+        ]
+        with pytest.raises(Exception):
+            store.add_many([Note(), notes[0]])
+        assert len(store.load()) == 4
+        _validate_query(ShardedStore(tmp_path / "query_store"))
+
+    def test_failed_write_does_not_change_any_shard(self, tmp_path):
+        notes = []
+        for month in [1, 2]:
+            note = Note(f"Note {month}")
+            note.end()
+            note.end_datetime = datetime(2019, month, 1)
+            notes.append(note)
+        store = ShardedStore(tmp_path / "store")
+        store.add(notes[0])
+        january_content = (store.path / "2019-01.json").read_text()
+
+        # The note of the second shard can not be serialized
+        new_notes = [Note.from_note(notes[0]), notes[1]]
+        new_notes[1].info["object"] = object()
+        with pytest.raises(TypeError):
+            store.add_many(new_notes)
+        assert (store.path / "2019-01.json").read_text() == january_content
+        assert sorted(p.name for p in store.path.iterdir()) == [
+            "2019-01.json",
+            "manifest.json",
+        ]
+        assert ShardedStore(store.path).load() == [notes[0]]
+
+        # None of the notes were added and can therefore be added again
+        new_notes[1].info.pop("object")
+        store.add_many(new_notes)
+        assert len(ShardedStore(store.path).load()) == 3
+
+        new_notes[0].info["object"] = object()
+        new_notes[1].model = "updated"
+        with pytest.raises(TypeError):
+            store.update([new_notes[1], new_notes[0]])
+        assert [n.model for n in ShardedStore(store.path).load()] == [None] * 3
+
+    def test_update_and_remove_rewrite_only_affected_shards(self, tmp_path):
+        notes = []
+        for month in [1, 2, 2]:
+            note = Note()
+            note.end()
+            note.end_datetime = datetime(2019, month, 1)
+            notes.append(note)
+        store = ShardedStore(tmp_path / "store")
+        store.add_many(notes)
+        january_shard = store.path / "2019-01.json"
+        january_content = january_shard.read_text()
+
+        notes[1].model = "updated"
+        store.update(notes[1])
+        store.remove(notes[2])
+        with pytest.raises(AssertionError):
+            store.remove(notes[2])
+        with pytest.raises(AssertionError):
+            store.update(Note())
+        assert january_shard.read_text() == january_content
+
+        loaded_notes = ShardedStore(store.path).load()
+        assert loaded_notes == [notes[1], notes[0]]
+        assert loaded_notes[0].model == "updated"
+
+        store.remove(notes[1])
+        assert not (store.path / "2019-02.json").exists()
+        assert store.load() == [notes[0]]
+
+    def test_shard_by_count(self, tmp_path):
+        store = ShardedStore(tmp_path / "store", shard_by="count", notes_per_shard=2)
+        notes = [Note(f"Note {i}") for i in range(5)]
+        store.add_many(notes[:3])
+        store.add(notes[3])
+        store.add(notes[4])
+        assert sorted(p.name for p in store.path.glob("0*.json")) == [
+            "000000.json",
+            "000001.json",
+            "000002.json",
+        ]
+        assert store.load() == list(reversed(notes))
+        # Settings of existing stores are read from the manifest
+        assert ShardedStore(store.path).shard_by == "count"
+        with pytest.raises(ValueError):
+            ShardedStore(tmp_path / "other_store", shard_by="day")
+
+    def test_stats(self, tmp_path):
+        _validate_stats(ShardedStore(tmp_path / "store", stats=StoreStats()))
+
+
+class TestAsyncStore:
+    def test_roundtrip(self, tmp_path):
+        stats = StoreStats()
+        store = AsyncStore(Store(tmp_path / "test_store.json", stats=stats))
+        notes = [Note(f"Note {i}") for i in range(3)]
+
+        async def run():
+            # Concurrent adds are written together
+            await asyncio.gather(*(store.add(note) for note in notes))
+            notes[0].model = "updated"
+            await store.update(notes[0])
+            await store.remove(notes[1])
+            loaded_notes = await store.load()
+            queried_notes = await store.query(where={"model": "updated"})
+            return loaded_notes, queried_notes
+
+        loaded_notes, queried_notes = _run_async(run())
+        assert loaded_notes == [notes[2], notes[0]]
+        assert queried_notes == [notes[0]]
+        summary = stats.summary()
+        assert summary["add_many"]["calls"] == 1
+        assert summary["add_many"]["notes"] == 3
+
+    def test_invalid_notes_do_not_prevent_others_from_being_added(self, tmp_path):
+        existing_note = Note("Existing note")
+        store = AsyncStore(JsonLinesStore(tmp_path / "test_store.jsonl"))
+        store.store.add(existing_note)
+        new_notes = [Note("New note 1"), Note("New note 2")]
+
+        async def run():
+            return await asyncio.gather(
+                store.add(new_notes[0]),
+                store.add(existing_note),
+                store.add(new_notes[1]),
+                return_exceptions=True,
+            )
+
+        results = _run_async(run())
+        assert results[0] is None and results[2] is None
+        assert isinstance(results[1], Exception)
+        assert len(store.store.load()) == 3
+
+    def test_add_raises_if_executor_is_shut_down(self, tmp_path):
+        executor = ThreadPoolExecutor()
+        executor.shutdown()
+        store = AsyncStore(Store(tmp_path / "test_store.json"), executor=executor)
+
+        async def run():
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    store.add(Note()), store.add(Note()), return_exceptions=True
+                ),
+                timeout=5,
+            )
+
+        results = _run_async(run())
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    def test_notes_are_added_once_to_non_atomic_stores(self):
+        class DictStore(BaseStore):
+            def __init__(self):
+                super().__init__()
+                self.notes = {}
+
+            def load(self):
+                return list(self.notes.values())
+
+            def add(self, note):
+                if note.identifier in self.notes:
+                    raise Exception("exists")
+                self.notes[note.identifier] = note
+
+        existing_note = Note("Existing note")
+        store = AsyncStore(DictStore())
+        store.store.add(existing_note)
+        new_note = Note("New note")
+
+        async def run():
+            return await asyncio.gather(
+                store.add(new_note), store.add(existing_note), return_exceptions=True
+            )
+
+        results = _run_async(run())
+        assert results[0] is None
+        assert isinstance(results[1], Exception)
+        assert len(store.store.load()) == 2
+
+
 class TestMain:
     def test_html_format(self):
         expected_test_value = "expected_test_value"
@@ -282,10 +1059,18 @@ class TestMain:
         note.info["some_dates"] = [dt_1, dt_2]
         note.end()
 
-        html = _format_notes_as_html([note])
-        self.validate_html(
-            html, [expected_test_value, _format_datetime(dt_1), _format_datetime(dt_2)]
-        )
+        table = _table_data([note])
+        html = _format_html(table.columns)
+        self.validate_html(html, ["parameters.find_this_value", "info.some_dates"])
+        assert "serverSide: true" in html
+        assert expected_test_value not in html
+
+        assert table.rows[0]["parameters.find_this_value"] == expected_test_value
+        assert table.rows[0]["info.some_dates"] == [
+            _format_datetime(dt_1),
+            _format_datetime(dt_2),
+        ]
+        json.dumps(table.rows)
 
     def test_command_line_interface(self, tmp_path):
         note_1 = Note("Note 1")
@@ -301,26 +1086,274 @@ class TestMain:
         store.add(note_2)
 
         port = 8080
+        url = f"http://localhost:{port}"
         p = mp.Process(
             target=main, args=([str(store_path), "--port", str(port), "--no-browser"],)
         )
         try:
             p.start()
             time.sleep(1)
-            html = requests.get(f"http://localhost:{port}").text
+            response = requests.get(url)
             self.validate_html(
-                html,
+                response.text, ["parameters.find_this_value", "info.some_dates"]
+            )
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert "Last-Modified" in response.headers
+
+            data = requests.get(
+                url + "/data", params={"draw": "1", "start": "0", "length": "10"}
+            ).json()
+            assert data["draw"] == 1
+            assert data["recordsTotal"] == 2
+            assert data["recordsFiltered"] == 2
+            self.validate_values(
+                json.dumps(data),
                 [expected_test_value, _format_datetime(dt_1), _format_datetime(dt_2)],
             )
+
+            etag = response.headers["ETag"]
+            response = requests.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.content == b""
+
+            note_3 = Note("Note 3")
+            note_3.info["new_column"] = 1
+            store.add(note_3)
+            response = requests.get(
+                url, headers={"If-None-Match": etag, "Accept-Encoding": "identity"}
+            )
+            assert response.status_code == 200
+            assert "Content-Encoding" not in response.headers
+            assert response.headers["ETag"] != etag
+            assert "info.new_column" in response.text
+
+            data = requests.get(url + "/data", params={"search[value]": "note 3"})
+            assert [row["text"] for row in data.json()["data"]] == ["Note 3"]
+
+            response = requests.get(url + "/summary", params={"group_by": "text"})
+            self.validate_values(response.text, ["<th>text</th>", "<td>Note 3</td>"])
+            response = requests.get(
+                url + "/summary", params={"metric": "text", "aggregation": "median"}
+            )
+            assert response.status_code == 400
+
+            assert requests.get(url + "/unknown").status_code == 404
         finally:
             p.terminate()
 
+    def test_events(self, tmp_path):
+        store_path = tmp_path / "test_store.json"
+        store = Store(store_path)
+        store.add(Note("Note 1"))
+
+        port = 8081
+        args = [str(store_path), "--port", str(port), "--no-browser"]
+        p = mp.Process(target=main, args=(args + ["--interval", "0.1"],))
+        try:
+            p.start()
+            time.sleep(1)
+            with requests.get(
+                f"http://localhost:{port}/events", stream=True, timeout=10
+            ) as response:
+                assert response.headers["Content-Type"] == "text/event-stream"
+                note_2 = Note("Note 2")
+                store.add(note_2)
+                lines = response.iter_lines(chunk_size=1, decode_unicode=True)
+                assert next(lines) == "id: 1"
+                assert next(lines) == "event: change"
+                change = json.loads(next(lines).split("data: ", 1)[1])
+        finally:
+            p.terminate()
+        assert [row["identifier"] for row in change["added"]] == [note_2.identifier]
+        assert change["updated"] == change["removed"] == []
+
+    def test_diff_tables(self):
+        notes = [Note(f"Note {i}") for i in range(3)]
+        table = _table_data(notes)
+        assert _diff_tables(table, _table_data(notes)) is None
+
+        notes[0].text = "Updated"
+        new_note = Note("New")
+        new_table = _table_data([new_note] + notes[:2])
+        change = _diff_tables(table, new_table)
+        assert not change["columns_changed"]
+        assert [row["identifier"] for row in change["added"]] == [new_note.identifier]
+        assert [row["text"] for row in change["updated"]] == ["Updated"]
+        assert change["removed"] == [notes[2].identifier]
+
+        notes[1].metrics["accuracy"] = 0.5
+        change = _diff_tables(new_table, _table_data(notes))
+        assert change["columns_changed"]
+
+    def test_store_watcher(self, tmp_path):
+        store = Store(tmp_path / "test_store.json")
+        store.add(Note("Note 1"))
+        watcher = _StoreWatcher(store, _ViewCache())
+        watcher.check()
+        assert watcher.wait(0, timeout=0) == []
+
+        store.add(Note("Note 2"))
+        watcher.check()
+        watcher.check()
+        changes = watcher.wait(0, timeout=0)
+        assert [version for version, _ in changes] == [1]
+        assert [row["text"] for row in changes[0][1]["added"]] == ["Note 2"]
+        assert watcher.wait(1, timeout=0) == []
+
+        watcher._max_changes = 1
+        for i in range(2):
+            store.add(Note(f"Note {i + 3}"))
+            watcher.check()
+        # The changes after version 1 are no longer all available
+        changes = watcher.wait(1, timeout=0)
+        assert [version for version, _ in changes] == [3]
+        assert changes[0][1]["columns_changed"]
+
+    def test_view_cache(self, tmp_path):
+        store = Store(tmp_path / "test_store.json")
+        store.add(Note("Note 1"))
+        view_cache = _ViewCache()
+        view = view_cache.get(store)
+        assert view_cache.get(store) is view
+        assert gzip.decompress(view.page.gzipped_html) == view.page.html
+
+        store.add(Note("Note 2"))
+        new_view = view_cache.get(store)
+        assert new_view is not view
+        assert new_view.page.etag != view.page.etag
+        assert len(new_view.table.rows) == 2
+
+    def test_datatables_response(self):
+        notes = []
+        for i, accuracy in enumerate([0.5, None, 0.9, 0.1]):
+            note = Note(f"Note {i}")
+            note.model = "forest" if i % 2 else "tree"
+            if accuracy is not None:
+                note.metrics["accuracy"] = accuracy
+            notes.append(note)
+        table = _table_data(notes)
+        accuracy_index = table.columns.index("metrics.accuracy")
+
+        def texts(params):
+            return [row["text"] for row in _datatables_response(table, params)["data"]]
+
+        response = _datatables_response(table, {"draw": "3"})
+        assert response["draw"] == 3
+        assert response["recordsTotal"] == response["recordsFiltered"] == 4
+        assert texts({}) == ["Note 0", "Note 1", "Note 2", "Note 3"]
+        assert texts({"start": "1", "length": "2"}) == ["Note 1", "Note 2"]
+        assert texts({"start": "2", "length": "-1"}) == ["Note 2", "Note 3"]
+
+        # Missing values are last in both directions
+        order = {
+            "order[0][column]": str(accuracy_index),
+            "order[0][dir]": "desc",
+            f"columns[{accuracy_index}][data]": "metrics\\.accuracy",
+        }
+        assert texts(order) == ["Note 2", "Note 0", "Note 3", "Note 1"]
+        order["order[0][dir]"] = "asc"
+        assert texts(order) == ["Note 3", "Note 0", "Note 2", "Note 1"]
+
+        order_by_model = {
+            "order[0][column]": str(table.columns.index("model")),
+            "order[1][column]": str(accuracy_index),
+            "order[1][dir]": "desc",
+        }
+        assert texts(order_by_model) == ["Note 3", "Note 1", "Note 2", "Note 0"]
+
+        search = {"search[value]": "FOREST", "length": "1"}
+        response = _datatables_response(table, search)
+        assert response["recordsFiltered"] == 2
+        assert [row["text"] for row in response["data"]] == ["Note 1"]
+
+    def test_accepts_gzip(self):
+        assert _accepts_gzip("gzip, deflate")
+        assert _accepts_gzip("deflate, gzip;q=0.5")
+        assert _accepts_gzip("*")
+        assert not _accepts_gzip("gzip;q=0")
+        assert not _accepts_gzip("identity")
+        assert not _accepts_gzip(None)
+
+    def test_summary(self, tmp_path):
+        store = Store(tmp_path / "test_store.json")
+        for model, recall in [("a", 0.5), ("b", 0.9), ("a", 0.7)]:
+            note = Note()
+            note.model = model
+            note.metrics["recall"] = recall
+            note.info["n_rows"] = 10
+            store.add(note)
+        table = _table_data(store.load())
+
+        columns, rows = _summary(store, table, {})
+        assert columns == [
+            "model",
+            "metrics.recall.mean",
+            "metrics.recall.max",
+            "metrics.recall.count",
+        ]
+        assert rows[0] == {
+            "model": "a",
+            "metrics.recall.mean": pytest.approx(0.6),
+            "metrics.recall.max": 0.7,
+            "metrics.recall.count": 2,
+        }
+
+        columns, rows = _summary(
+            store, table, {"metric": ["info.n_rows"], "aggregation": ["sum"]}
+        )
+        assert columns == ["model", "info.n_rows.sum"]
+        assert [row["info.n_rows.sum"] for row in rows] == [20, 10]
+
+    def test_store_from_path(self, tmp_path):
+        assert isinstance(_store_from_path(str(tmp_path / "store.json")), Store)
+        assert isinstance(
+            _store_from_path(str(tmp_path / "store.jsonl")), JsonLinesStore
+        )
+        assert isinstance(_store_from_path(str(tmp_path / "store.db")), SqliteStore)
+        assert isinstance(_store_from_path(str(tmp_path)), ShardedStore)
+
     def validate_html(self, html: str, expected_test_values: Sequence[str]) -> None:
-        for value in expected_test_values:
-            assert value in html
+        self.validate_values(html, expected_test_values)
         assert "<!DOCTYPE html>" in html
         assert "datatables" in html.lower()
 
+    def validate_values(self, text: str, expected_test_values: Sequence[str]) -> None:
+        for value in expected_test_values:
+            assert value in text
+
+
+@pytest.mark.parametrize(
+    "dt",
+    [
+        datetime(2019, 5, 21, 11, 3, 20),
+        datetime(2019, 5, 21, 11, 3, 20, 123),
+        datetime(2019, 5, 21, 11, 3, 20, 123456, tzinfo=timezone(timedelta(hours=2))),
+    ],
+)
+def test_datetime_encoding(dt):
+    encoded = json.dumps({"dt": dt, "dts": [dt]}, cls=DatetimeJSONEncoder)
+    assert _format_datetime(dt) in encoded
+    decoded = json.loads(encoded, object_hook=_deserialize_datetime)
+    assert decoded == {"dt": dt, "dts": [dt]}
+    assert _fromisoformat_fallback(_format_datetime(dt)) == dt
+
+
+def test_datetime_decoding_of_previous_versions(tmp_path):
+    store_path = tmp_path / "test_store.json"
+    content = [
+        {
+            "identifier": "1",
+            "start_datetime": {"_datetime": "2019-05-21T11-03-20"},
+            "end_datetime": {"_datetime": "2019-05-21T11-04-00"},
+            "info": {"not_a_datetime": {"_datetime": "value", "other": 1}},
+        }
+    ]
+    store_path.write_text(json.dumps(content))
+    note = Store(store_path).load()[0]
+    assert note.start_datetime == datetime(2019, 5, 21, 11, 3, 20)
+    assert note.end_datetime == datetime(2019, 5, 21, 11, 4, 0)
+    assert note.info["not_a_datetime"] == {"_datetime": "value", "other": 1}
+
 
 def test_to_pandas_dict():
     note_1 = Note()
@@ -332,9 +1365,257 @@ def test_to_pandas_dict():
     note_2.parameters["impute_missings"] = impute_missings_value
     note_2.end()
 
-    pandas_dict = _pandas_dict([note_1, note_2])
-    assert pandas_dict["metrics.recall"] == [recall_value, None]
-    assert pandas_dict["parameters.impute_missings"] == [None, impute_missings_value]
+    note_3 = Note()
+    note_3.end()
+
+    pandas_dict = _pandas_dict([note_1, note_2, note_3])
+    assert pandas_dict["metrics.recall"] == [recall_value, None, None]
+    assert pandas_dict["parameters.impute_missings"] == [
+        None,
+        impute_missings_value,
+        None,
+    ]
+    assert all(len(values) == 3 for values in pandas_dict.values())
+    # Lists are copied
+    pandas_dict["features.numerical"][0].append("num1")
+    assert note_1.features["numerical"] == []
+
+    assert all(values == [] for values in _pandas_dict([]).values())
+
+
+@pytest.mark.parametrize(
+    "store_class,file_name,kwargs",
+    [
+        (Store, "store.json", {}),
+        (Store, "store.json", {"index": True}),
+        (JsonLinesStore, "store.jsonl", {}),
+        (SqliteStore, "store.db", {}),
+        (ShardedStore, "store", {}),
+    ],
+)
+def test_lazy_load(tmp_path, store_class, file_name, kwargs):
+    notes = [Note(f"Note {i}") for i in range(5)]
+    notes[0].info["some_dates"] = [datetime(2019, 1, 3, 10, 0, 1)]
+    store_path = tmp_path / file_name
+    store_class(store_path, **kwargs).add_many(notes)
+
+    store = store_class(store_path, **kwargs)
+    lazy_notes = store.load(lazy=True)
+    assert isinstance(lazy_notes, LazyNotes)
+    assert len(lazy_notes) == 5
+    latest_notes = lazy_notes[:2]
+    assert isinstance(latest_notes, LazyNotes)
+    assert latest_notes == [notes[4], notes[3]]
+    assert lazy_notes == list(reversed(notes))
+    assert lazy_notes[-1].info["some_dates"] == [datetime(2019, 1, 3, 10, 0, 1)]
+    if kwargs.get("index"):
+        # The notes are read from the file without decoding all of them at once
+        assert store.cache_info() == (0, 0)
+    # Accessed notes are kept and can be modified like the ones of a list
+    lazy_notes[0].model = "updated"
+    assert lazy_notes[0].model == "updated"
+    assert store.load()[0].model is None
+
+
+@pytest.mark.parametrize(
+    "store_class,file_name",
+    [
+        (Store, "store.json"),
+        (JsonLinesStore, "store.jsonl"),
+        (SqliteStore, "store.db"),
+        (ShardedStore, "store"),
+    ],
+)
+def test_aggregate(tmp_path, store_class, file_name):
+    notes = []
+    for model, auc, branch in [
+        ("a", 0.5, "master"),
+        ("b", 0.9, "master"),
+        ("a", 0.7, "dev"),
+        ("a", None, "dev"),
+        ("a", float("nan"), "master"),
+        ("b", True, "master"),
+    ]:
+        note = Note()
+        note.model = model
+        note.metrics["test"] = {"auc": auc}
+        note.git = {"branch": branch}
+        notes.append(note)
+    notes.append(Note())
+    store = store_class(tmp_path / file_name)
+    store.add_many(notes)
+
+    results = store.aggregate(
+        "model", {"metrics.test.auc": ["mean", "std", "min", "max", "count"]}
+    )
+    results_by_model = {r["model"]: r for r in results}
+    assert len(results) == 3
+    assert results_by_model["a"]["metrics.test.auc.mean"] == pytest.approx(0.6)
+    assert results_by_model["a"]["metrics.test.auc.std"] == pytest.approx(0.1414, 1e-3)
+    assert results_by_model["a"]["metrics.test.auc.min"] == 0.5
+    assert results_by_model["a"]["metrics.test.auc.count"] == 2
+    # Booleans and NaN are not aggregated and a single value has no standard
+    # deviation
+    assert results_by_model["b"]["metrics.test.auc.max"] == 0.9
+    assert results_by_model["b"]["metrics.test.auc.std"] is None
+    assert results_by_model[None]["metrics.test.auc.count"] == 0
+    assert results_by_model[None]["metrics.test.auc.mean"] is None
+
+    results = store.aggregate(
+        ["model", "git.branch"],
+        {"metrics.test.auc": ["sum"]},
+        where={"model": "a"},
+    )
+    assert sorted((r["git.branch"], r["metrics.test.auc.sum"]) for r in results) == [
+        ("dev", 0.7),
+        ("master", 0.5),
+    ]
+    with pytest.raises(ValueError):
+        store.aggregate("model", {"metrics.test.auc": ["median"]})
+
+    # Lists of dictionaries are grouped by their content
+    notes[0].parameters["steps"] = [{"scale": True, "impute": "mean"}]
+    notes[2].parameters["steps"] = [{"impute": "mean", "scale": True}]
+    store.update([notes[0], notes[2]])
+    results = store.aggregate("parameters.steps", {"metrics.test.auc": ["count"]})
+    assert sorted(r["metrics.test.auc.count"] for r in results) == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "store_class,file_name,kwargs",
+    [
+        (Store, "store.json", {}),
+        (Store, "store.json", {"metric_indexes": ["metrics.auc"]}),
+        (Store, "store.json", {"metric_indexes": ["metrics.auc"], "index": True}),
+        (JsonLinesStore, "store.jsonl", {}),
+        (SqliteStore, "store.db", {}),
+        (ShardedStore, "store", {}),
+    ],
+)
+def test_top_k(tmp_path, store_class, file_name, kwargs):
+    store_path = tmp_path / file_name
+    store = store_class(store_path, **kwargs)
+    notes = []
+    for i, auc in enumerate([0.5, 0.9, 0.7, None, True, float("nan"), 0.9, 0.1]):
+        note = Note(f"Note {i}")
+        note.model = "a" if i % 2 else "b"
+        note.metrics["auc"] = auc
+        note.end()
+        note.end_datetime += timedelta(seconds=i)
+        notes.append(note)
+    store.add_many(notes)
+
+    def texts(top_notes):
+        return [n.text for n in top_notes]
+
+    store = store_class(store_path, **kwargs)
+    # Notes with equal values are returned with the most recent note first
+    assert texts(store.top_k("metrics.auc", k=3)) == ["Note 6", "Note 1", "Note 2"]
+    assert texts(store.top_k("metrics.auc", k=2, ascending=True)) == [
+        "Note 7",
+        "Note 0",
+    ]
+    if kwargs.get("index"):
+        # Only the index files and the returned notes were read
+        assert store.cache_info() == (0, 0)
+    assert texts(store.top_k("metrics.auc", k=10, where={"model": "a"})) == [
+        "Note 1",
+        "Note 7",
+    ]
+    assert len(store.top_k("metrics.auc", k=10)) == 5
+    assert store.top_k("metrics.missing") == []
+    assert store.top_k("metrics.auc", k=0, ascending=True) == []
+    with pytest.raises(ValueError):
+        store.top_k("metrics.auc", k=-1, ascending=True)
+
+    notes[7].metrics["auc"] = 1.0
+    store.update(notes[7])
+    store.remove(notes[6])
+    assert texts(store.top_k("metrics.auc", k=2)) == ["Note 7", "Note 1"]
+    if store_class is Store:
+        # Indexes are built again if the store was changed without them
+        Store(store_path).remove(notes[7])
+        assert texts(store.top_k("metrics.auc", k=2)) == ["Note 1", "Note 2"]
+
+
+def _validate_query(store: BaseStore) -> None:
+    notes = []
+    for i, model in enumerate(["a", "b", "a", "b", "a"]):
+        note = Note(f"Note {i}")
+        note.model = model
+        note.end()
+        note.end_datetime += timedelta(seconds=i)
+        if i != 3:
+            note.metrics["auc"] = i / 10
+        notes.append(note)
+    store.add_many(notes)
+
+    # Most recent notes first if there is no order_by
+    assert store.query(limit=2) == [notes[4], notes[3]]
+    assert store.query(where={"model": "a"}) == [notes[4], notes[2], notes[0]]
+    assert store.query(where=lambda n: n.get("metrics.auc", 0) > 0.15) == [
+        notes[4],
+        notes[2],
+    ]
+    # Notes without the order_by key are returned last
+    assert store.query(where={"model": "b"}, order_by="metrics.auc") == [
+        notes[1],
+        notes[3],
+    ]
+    assert store.query(order_by="metrics.auc", ascending=False, limit=2) == [
+        notes[4],
+        notes[2],
+    ]
+    assert store.query(order_by="text", limit=2) == [notes[0], notes[1]]
+    assert store.query(
+        where={"model": "a", "metrics.auc": 0.0}, columns=["text", "metrics"]
+    ) == [{"text": "Note 0", "metrics.auc": 0.0}]
+
+    # Values of different types are sorted by type, numbers before strings
+    mixed_note = Note("Mixed note")
+    mixed_note.metrics["auc"] = "n/a"
+    store.add(mixed_note)
+    assert store.query(order_by="metrics.auc", limit=2) == [notes[0], notes[1]]
+    assert store.query(order_by="metrics.auc", ascending=False, limit=2) == [
+        mixed_note,
+        notes[4],
+    ]
+
+
+def _validate_stats(store: BaseStore) -> None:
+    notes = [Note(f"Note {i}") for i in range(3)]
+    store.add_many(notes)
+    store.update(notes[0])
+    store.remove(notes[1])
+    store.load()
+    store.query(where={"text": "Note 0"})
+
+    assert store.stats is not None
+    summary = store.stats.summary()
+    assert sorted(summary) == ["add_many", "load", "query", "remove", "update"]
+    assert summary["add_many"]["notes"] == 3
+    assert summary["update"]["notes"] == 1
+    assert summary["remove"]["notes"] == 1
+    assert summary["load"]["notes"] == 2
+    assert summary["query"]["notes"] == 1
+    for operation in summary.values():
+        assert operation["calls"] == 1
+        assert "total" in operation["phases"]
+    assert {"prepare", "serialize", "write"} <= set(summary["add_many"]["phases"])
+
+
+def _run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _add_notes(store_path: Path, n: int) -> None:
+    store = Store(store_path)
+    for _ in range(n):
+        store.add(Note())
 
 
 class InvalidObject: